@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+#
+# Benchmarks evaluation of a synthetic BUILD file that generates rule classes
+# with rule class factories, e.g. cc_binary_factory(target=...). The BUILD
+# file is evaluated several times in a row, as the build server does:
+#
+# $ PYTHONPATH=src python scripts/benchmark_b3_factory.py [number of loops]
+
+from __future__ import print_function
+
+import shutil
+import sys
+import tempfile
+import time
+
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import engine
+
+TARGETS = ("collections.OrderedDict", "collections.Counter",
+           "collections.deque", "collections.defaultdict", "decimal.Decimal",
+           "fractions.Fraction", "io.BytesIO", "io.StringIO",
+           "json.JSONEncoder", "json.JSONDecoder", "string.Formatter",
+           "threading.Thread", "Queue.Queue", "Queue.LifoQueue",
+           "StringIO.StringIO", "numbers.Number")
+FACTORIES = ("binary_factory(target=t, srcs=[])",
+             "cc_binary_factory(target=t)",
+             "cc_library_factory(target=t, srcs=[])")
+RUNS = 5
+
+def write_buildfile(root_dir, num_loops):
+  modules = sorted(set([target.split(".")[0] for target in TARGETS]))
+  with open(root_dir + "/BUILD", "w") as handle:
+    handle.write("import %s\n" % ", ".join(modules))
+    handle.write("targets = [%s]\n" % ", ".join(TARGETS))
+    handle.write("for i in range(%d):\n" % num_loops)
+    handle.write("  for t in targets:\n")
+    for factory in FACTORIES:
+      handle.write("    %s\n" % factory)
+
+def main():
+  num_loops = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  engine.register_rules()
+  root_dir = tempfile.mkdtemp()
+  try:
+    write_buildfile(root_dir, num_loops)
+    print("%d factory calls per evaluation" %
+          (num_loops * len(TARGETS) * len(FACTORIES)))
+    for i in range(RUNS):
+      buildfile.reset()
+      build = buildfile.BuildFile(root_dir, ".")
+      start = time.time()
+      buildfile.Context(build).parse()
+      print("  evaluation %d %8.3fs" % (i + 1, time.time() - start))
+  finally:
+    shutil.rmtree(root_dir)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
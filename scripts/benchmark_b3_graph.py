@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+#
+# Benchmarks construction and traversal of b3 dependency graph on synthetic
+# rules. If NetworkX is installed, the same work is done with networkx.DiGraph
+# and the old (not interned) address for comparison:
+#
+# $ PYTHONPATH=src python scripts/benchmark_b3_graph.py [number of rules]
+
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+from bb.tools.b3 import buildfile
+
+RULES_PER_BUILDFILE = 10
+DEPS_PER_RULE = 4
+
+class LegacyAddress(object):
+  """Address as it was before interning."""
+
+  def __init__(self, buildfile, target):
+    self.buildfile = buildfile
+    self.target = target
+
+  def __eq__(self, other):
+    return other and (type(other) == LegacyAddress) and (
+      self.buildfile.canonical_relpath == other.buildfile.canonical_relpath) \
+      and (self.target == other.target)
+
+  def __hash__(self):
+    value = 17
+    value *= 37 + hash(self.buildfile.canonical_relpath)
+    value *= 37 + hash(self.target)
+    return value
+
+class SyntheticRule(object):
+  """Hashes and compares like :class:`bb.tools.b3.buildfile.Rule`."""
+
+  def __init__(self, address):
+    self._address = address
+
+  def get_address(self):
+    return self._address
+
+  def __eq__(self, other):
+    return other and (type(self) == type(other)) and \
+        (self.get_address() == other.get_address())
+
+  def __hash__(self):
+    return hash(self.get_address())
+
+def gen_rules(num_rules, address_class):
+  rules = []
+  for i in range(num_rules):
+    build = buildfile.BuildFile("/benchmark",
+                                "pkg%d/BUILD" % (i // RULES_PER_BUILDFILE),
+                                must_exist=False)
+    rules.append(SyntheticRule(address_class(build, "rule%d" % i)))
+  return rules
+
+def gen_edges(num_rules):
+  rand = random.Random(0)
+  edges = []
+  for i in range(1, num_rules):
+    for _ in range(min(i, DEPS_PER_RULE)):
+      # Dependencies point to rules defined earlier, the graph is acyclic.
+      edges.append((i, rand.randrange(max(0, i - 1000), i)))
+  return edges
+
+def measure(name, func):
+  start = time.time()
+  result = func()
+  print("  %-28s %8.3fs" % (name, time.time() - start))
+  return result
+
+def run(title, graph_class, rules, edges):
+  print(title)
+  graph = graph_class()
+  def build():
+    for rule in rules:
+      graph.add_node(rule)
+    for i, j in edges:
+      graph.add_edge(rules[i], rules[j])
+  measure("construction", build)
+  if hasattr(graph, "compact"):
+    measure("compaction", graph.compact)
+  def scan():
+    for rule in rules:
+      graph.successors(rule)
+      graph.predecessors(rule)
+  measure("successors/predecessors", scan)
+  roots = rules[-10:]
+  def walk():
+    total = 0
+    for root in roots:
+      closure = set([root])
+      stack = [root]
+      while stack:
+        for dep in graph.successors(stack.pop()):
+          if dep not in closure:
+            closure.add(dep)
+            stack.append(dep)
+      total += len(closure)
+    return total
+  measure("closure walk (10 roots)", walk)
+  if hasattr(graph, "get_closure"):
+    def index():
+      return sum([len(graph.get_closure(root)) for root in roots])
+    measure("closure index (10 roots)", index)
+
+def main():
+  num_rules = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+  edges = gen_edges(num_rules)
+  print("%d rules, %d edges" % (num_rules, len(edges)))
+  run("DependencyGraph, interned Address", buildfile.DependencyGraph,
+      gen_rules(num_rules, buildfile.Address), edges)
+  try:
+    import networkx
+  except ImportError:
+    return 0
+  run("networkx.DiGraph, legacy Address", networkx.DiGraph,
+      gen_rules(num_rules, LegacyAddress), edges)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -22,6 +22,10 @@ _DEFAULT_USER_CONFIG = {
   },
   "b3": {
     "builddir": os.path.expanduser("~/.b3"),
+    "cachedir": os.path.expanduser("~/.b3cache"),
+    "cachesize": "1024",
+    "compilercache": "direct",
+    "discoveryjobs": "1",
   }
 }
 
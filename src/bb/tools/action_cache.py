@@ -0,0 +1,363 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Content-addressed local cache of action outputs.
+
+An action is a single invocation of a tool, e.g. compilation of one source
+file or linking of a binary. The action key is a digest of the tool identity,
+its arguments, the content of its input files and the relevant environment
+variables. Outputs of an action are stored once by content and restored by
+hardlink (or copy) when an action with the same key is requested again::
+
+  cache = ActionCache("~/.b3cache")
+  key = action_key(compiler.get_identity(), argv, [src])
+  if not cache.restore(key, {"obj": obj}):
+    compile()
+    cache.store(key, {"obj": obj})
+
+Inputs that are known only once the action is done, e.g. headers included
+by a source, are tracked by manifests. A manifest is looked up by the key of
+the action without such inputs and lists entries of action keys with the
+digests of their inputs. An entry applies if all of its inputs are unchanged,
+see :func:`ActionCache.find_manifest_entry`.
+
+The cache layout is::
+
+  <root>/actions/<key[:2]>/<key>    action entries (JSON)
+  <root>/blobs/<digest[:2]>/<digest> output files by content digest
+  <root>/manifests/<key[:2]>/<key>  manifests (JSON)
+
+The size of the cache is limited; least recently used actions are evicted by
+:func:`ActionCache.gc`.
+"""
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import bb.config
+from bb.utils import logging
+from bb.utils import path_utils
+
+logger = logging.get_logger("bb")
+
+DEFAULT_CACHE_DIR = os.path.expanduser("~/.b3cache")
+DEFAULT_CACHE_SIZE = 1024 # MB
+# The maximal number of entries kept by a manifest.
+MAX_MANIFEST_ENTRIES = 8
+
+# Environment variables that can affect the output of a tool.
+RELEVANT_ENV = ("GCC_EXEC_PREFIX", "COMPILER_PATH", "CPATH", "C_INCLUDE_PATH",
+                "CPLUS_INCLUDE_PATH", "LIBRARY_PATH", "SOURCE_DATE_EPOCH")
+
+def action_key(tool, argv, inputs=[], env=None):
+  """Returns hex digest that identifies an action: the `tool` identity (see
+  :func:`bb.utils.executable.ExecutableWrapper.get_identity`), the list of
+  arguments `argv`, the content of `inputs` files and relevant environment
+  variables from `env` (:const:`os.environ` by default).
+  """
+  if env is None:
+    env = os.environ
+  sha1 = hashlib.sha1()
+  sha1.update(repr(tool))
+  sha1.update(repr(list(argv)))
+  for path in sorted(set(inputs)):
+    sha1.update(path)
+    sha1.update(path_utils.digest(path))
+  for name in RELEVANT_ENV:
+    sha1.update(repr((name, env.get(name))))
+  return sha1.hexdigest()
+
+class ActionCache(object):
+  """Local content-addressed cache of action outputs. The `max_size` is given
+  in bytes.
+  """
+
+  def __init__(self, root_dir=DEFAULT_CACHE_DIR,
+               max_size=DEFAULT_CACHE_SIZE << 20):
+    self._root_dir = os.path.expanduser(root_dir)
+    self._max_size = max_size
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    # The number of bytes stored by this session.
+    self.stored_size = 0
+
+  def get_root_dir(self):
+    return self._root_dir
+
+  def get_max_size(self):
+    return self._max_size
+
+  def _get_action_path(self, key):
+    return path_utils.join(self._root_dir, "actions", key[:2], key)
+
+  def _get_blob_path(self, digest):
+    return path_utils.join(self._root_dir, "blobs", digest[:2], digest)
+
+  def _get_manifest_path(self, key):
+    return path_utils.join(self._root_dir, "manifests", key[:2], key)
+
+  def _write_atomically(self, path, write):
+    path_utils.mkpath(path_utils.dirname(path))
+    tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(),
+                                 threading.current_thread().ident)
+    try:
+      write(tmp_path)
+      os.rename(tmp_path, path)
+    finally:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+  def lookup(self, key):
+    """Returns the entry of the action `key` as a dict that maps output names
+    to blob digests, or ``None`` if the action is not cached.
+    """
+    path = self._get_action_path(key)
+    try:
+      with open(path) as handle:
+        entry = json.load(handle)
+    except (IOError, ValueError):
+      return None
+    # Mark the action as recently used.
+    try:
+      os.utime(path, None)
+    except OSError:
+      pass
+    return entry
+
+  def restore(self, key, outputs):
+    """Restores the outputs of the action `key`. The `outputs` maps output
+    names to destination paths. Returns ``True`` if all the outputs were
+    restored.
+    """
+    entry = self.lookup(key)
+    if not entry or set(entry["outputs"].keys()) != set(outputs.keys()):
+      with self._lock:
+        self.misses += 1
+      return False
+    for name, path in outputs.items():
+      blob_path = self._get_blob_path(entry["outputs"][name])
+      if not os.path.exists(blob_path):
+        with self._lock:
+          self.misses += 1
+        return False
+      path_utils.mkpath(path_utils.dirname(path))
+      if os.path.lexists(path):
+        os.remove(path)
+      try:
+        os.link(blob_path, path)
+      except OSError:
+        shutil.copy2(blob_path, path)
+    with self._lock:
+      self.hits += 1
+    return True
+
+  def store(self, key, outputs):
+    """Stores the outputs of the action `key`. The `outputs` maps output names
+    to paths of the produced files.
+    """
+    entry = {"outputs": {}, "size": 0}
+    for name, path in outputs.items():
+      digest = path_utils.digest(path)
+      blob_path = self._get_blob_path(digest)
+      if not os.path.exists(blob_path):
+        self._write_atomically(blob_path,
+                               lambda tmp_path: shutil.copy2(path, tmp_path))
+        # Blobs can be hardlinked, protect them from modification.
+        os.chmod(blob_path, os.stat(blob_path).st_mode & 0555)
+        with self._lock:
+          self.stored_size += os.path.getsize(blob_path)
+      entry["outputs"][name] = digest
+      entry["size"] += os.path.getsize(blob_path)
+    def write_entry(tmp_path):
+      with open(tmp_path, "w") as handle:
+        json.dump(entry, handle)
+    self._write_atomically(self._get_action_path(key), write_entry)
+
+  def load_manifest(self, key):
+    """Returns a list of manifest entries, where an entry is a dict with
+    action key and files that maps input files to their digests.
+    """
+    try:
+      with open(self._get_manifest_path(key)) as handle:
+        return json.load(handle)
+    except (IOError, ValueError):
+      return []
+
+  def find_manifest_entry(self, key):
+    """Returns the first entry of manifest `key` which files exist and are
+    unchanged, or ``None``.
+    """
+    for entry in self.load_manifest(key):
+      if all([path_utils.exists(path) and path_utils.digest(path) == digest
+              for path, digest in entry["files"].items()]):
+        return entry
+    return None
+
+  def add_manifest_entry(self, key, action_key, files):
+    """Adds entry of `action_key` with the current digests of `files` to
+    manifest `key`. Only the most recent entries are kept, see
+    :const:`MAX_MANIFEST_ENTRIES`.
+    """
+    entries = [entry for entry in self.load_manifest(key)
+               if entry["key"] != action_key]
+    entries.insert(0, {"key": action_key,
+                       "files": dict([(path, path_utils.digest(path))
+                                      for path in files])})
+    def write_manifest(tmp_path):
+      with open(tmp_path, "w") as handle:
+        json.dump(entries[:MAX_MANIFEST_ENTRIES], handle)
+    self._write_atomically(self._get_manifest_path(key), write_manifest)
+
+  def _list_dir(self, kind):
+    result = []
+    top = path_utils.join(self._root_dir, kind)
+    if not os.path.isdir(top):
+      return result
+    for prefix in os.listdir(top):
+      prefix_dir = path_utils.join(top, prefix)
+      for name in os.listdir(prefix_dir):
+        if not name.endswith(".tmp"):
+          result.append(path_utils.join(prefix_dir, name))
+    return result
+
+  def get_stats(self):
+    """Returns a dict with the number of actions, blobs and manifests, the
+    total size of blobs and manifests in bytes, the size limit and
+    hits/misses of this session.
+    """
+    blobs = self._list_dir("blobs")
+    manifests = self._list_dir("manifests")
+    return dict(actions=len(self._list_dir("actions")),
+                blobs=len(blobs),
+                manifests=len(manifests),
+                size=sum([os.path.getsize(path)
+                          for path in blobs + manifests]),
+                max_size=self._max_size,
+                hits=self.hits,
+                misses=self.misses)
+
+  def gc(self, max_size=None):
+    """Evicts least recently used actions until the size of the cache fits
+    `max_size` (the cache limit by default) and removes blobs and manifests
+    that are not referenced anymore. A manifest is referenced while some of
+    its entries refer to a cached action. Returns the number of evicted
+    actions.
+    """
+    if max_size is None:
+      max_size = self._max_size
+    actions = []
+    for path in self._list_dir("actions"):
+      try:
+        with open(path) as handle:
+          entry = json.load(handle)
+        actions.append((os.path.getmtime(path), path, entry))
+      except (IOError, OSError, ValueError):
+        self._remove(path)
+    actions.sort()
+    blobs = self._list_dir("blobs")
+    blob_sizes = dict([(path_utils.basename(path), os.path.getsize(path))
+                       for path in blobs])
+    refs = dict()
+    for _, _, entry in actions:
+      for digest in entry["outputs"].values():
+        refs[digest] = refs.get(digest, 0) + 1
+    size = sum([blob_sizes[digest] for digest in refs if digest in blob_sizes])
+    # Maps action key to manifests that refer to it, and each manifest to the
+    # number of cached actions it refers to.
+    keys = set([path_utils.basename(path) for _, path, _ in actions])
+    manifests_by_key = dict()
+    manifest_refs = dict()
+    manifest_sizes = dict()
+    for path in self._list_dir("manifests"):
+      try:
+        with open(path) as handle:
+          manifest_keys = set([entry["key"] for entry in json.load(handle)])
+        manifest_sizes[path] = os.path.getsize(path)
+      except (IOError, OSError, ValueError, KeyError, TypeError):
+        self._remove(path)
+        continue
+      manifest_refs[path] = len(manifest_keys & keys)
+      for key in manifest_keys & keys:
+        manifests_by_key.setdefault(key, []).append(path)
+    size += sum([manifest_sizes[path] for path, num_refs
+                 in manifest_refs.items() if num_refs])
+    num_evicted = 0
+    for _, path, entry in actions:
+      if size <= max_size:
+        break
+      self._remove(path)
+      num_evicted += 1
+      for digest in entry["outputs"].values():
+        refs[digest] -= 1
+        if not refs[digest]:
+          size -= blob_sizes.get(digest, 0)
+      for manifest in manifests_by_key.get(path_utils.basename(path), []):
+        manifest_refs[manifest] -= 1
+        if not manifest_refs[manifest]:
+          size -= manifest_sizes[manifest]
+    for path in blobs:
+      if not refs.get(path_utils.basename(path)):
+        self._remove(path)
+    for path, num_refs in manifest_refs.items():
+      if not num_refs:
+        self._remove(path)
+    return num_evicted
+
+  def _remove(self, path):
+    try:
+      os.remove(path)
+    except OSError, e:
+      if e.errno != errno.ENOENT:
+        raise
+
+  def clear(self):
+    """Removes all the cached actions and blobs."""
+    if os.path.isdir(self._root_dir):
+      shutil.rmtree(self._root_dir)
+
+def new_action_cache():
+  """Returns :class:`ActionCache` instance configured by `cachedir` and
+  `cachesize` (in megabytes) options from `b3` section of user settings.
+  """
+  settings = bb.config.user_settings
+  root_dir = DEFAULT_CACHE_DIR
+  if settings.has_option("b3", "cachedir"):
+    root_dir = settings.get("b3", "cachedir")
+  max_size = DEFAULT_CACHE_SIZE
+  if settings.has_option("b3", "cachesize"):
+    max_size = settings.getint("b3", "cachesize")
+  return ActionCache(root_dir, max_size << 20)
+
+_action_cache = None
+
+def get_action_cache():
+  """Returns the current action cache or ``None`` if caching is disabled."""
+  return _action_cache
+
+def set_action_cache(cache):
+  global _action_cache
+  if cache is not None and not isinstance(cache, ActionCache):
+    raise TypeError("'cache' has to be an ActionCache: %s" % cache)
+  _action_cache = cache
+  return cache
@@ -0,0 +1,87 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools import action_cache
+
+class ActionCacheTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.cache = action_cache.ActionCache(os.path.join(self.dir, "cache"))
+
+  def test_key(self):
+    src = self.write("a.c", "int a;")
+    key = action_cache.action_key("gcc", ["-c"], [src], env={})
+    self.assert_equal(key, action_cache.action_key("gcc", ["-c"], [src],
+                                                   env={}))
+    self.assert_not_equal(key, action_cache.action_key("gcc", ["-O2"], [src],
+                                                       env={}))
+    self.write("a.c", "int b;")
+    self.assert_not_equal(key, action_cache.action_key("gcc", ["-c"], [src],
+                                                       env={}))
+
+  def test_store_and_restore(self):
+    obj = self.write("a.o", "object")
+    self.assert_false(self.cache.restore("k1", {"object": obj}))
+    self.cache.store("k1", {"object": obj})
+    os.remove(obj)
+    self.assert_true(self.cache.restore("k1", {"object": obj}))
+    with open(obj) as handle:
+      self.assert_equal(handle.read(), "object")
+    self.assert_equal((self.cache.hits, self.cache.misses), (1, 1))
+
+  def test_manifest(self):
+    header = self.write("a.h", "#define A 1\n")
+    self.assert_is_none(self.cache.find_manifest_entry("m1"))
+    self.cache.add_manifest_entry("m1", "k1", [header])
+    self.assert_equal(self.cache.find_manifest_entry("m1")["key"], "k1")
+    self.write("a.h", "#define A 2\n")
+    self.assert_is_none(self.cache.find_manifest_entry("m1"))
+    self.cache.add_manifest_entry("m1", "k2", [header])
+    self.assert_equal([entry["key"] for entry
+                       in self.cache.load_manifest("m1")], ["k2", "k1"])
+    self.write("a.h", "#define A 1\n")
+    self.assert_equal(self.cache.find_manifest_entry("m1")["key"], "k1")
+    os.remove(header)
+    self.assert_is_none(self.cache.find_manifest_entry("m1"))
+
+  def test_gc(self):
+    for i in range(3):
+      obj = self.write("%d.o" % i, str(i) * 10)
+      self.cache.store("k%d" % i, {"object": obj})
+      os.utime(self.cache._get_action_path("k%d" % i), (i, i))
+    # Make k0 the most recently used action.
+    self.cache.lookup("k0")
+    self.assert_equal(self.cache.gc(max_size=20), 1)
+    self.assert_is_none(self.cache.lookup("k1"))
+    self.assert_is_not_none(self.cache.lookup("k0"))
+    self.assert_equal(self.cache.get_stats()["size"], 20)
+
+  def test_gc_manifests(self):
+    header = self.write("a.h", "#define A 1\n")
+    for i in range(3):
+      obj = self.write("%d.o" % i, str(i) * 10)
+      self.cache.store("k%d" % i, {"object": obj})
+      os.utime(self.cache._get_action_path("k%d" % i), (i, i))
+    self.cache.add_manifest_entry("m1", "k0", [header])
+    self.cache.add_manifest_entry("m2", "k0", [header])
+    self.cache.add_manifest_entry("m2", "k1", [header])
+    stats = self.cache.get_stats()
+    self.assert_equal(stats["manifests"], 2)
+    self.assert_equal(stats["size"], 30 + sum(
+        [os.path.getsize(self.cache._get_manifest_path(key))
+         for key in ("m1", "m2")]))
+    # Evicting k0 leaves m1 without cached actions.
+    self.assert_equal(self.cache.gc(max_size=stats["size"] - 1), 1)
+    self.assert_equal(self.cache.load_manifest("m1"), [])
+    self.assert_equal(len(self.cache.load_manifest("m2")), 2)
+    self.assert_equal(self.cache.gc(max_size=0), 2)
+    self.assert_equal(self.cache.get_stats()["manifests"], 0)
+
+if __name__ == "__main__":
+  unittest.main()
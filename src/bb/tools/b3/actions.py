@@ -0,0 +1,220 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The action table guarantees that each rule is executed at most once per
+build, no matter how many times it is reached in the dependency graph.
+
+Every executed rule is recorded with its fingerprint, a digest of everything
+that affects the result of the rule: its type, address, sources, flags,
+compiler identity and fingerprints of its dependencies. Records are persisted
+in the b3 build directory, so that a rule with identical inputs and existing
+outputs is recognized as up-to-date by the next invocation.
+"""
+
+import cPickle as pickle
+import hashlib
+import os
+import threading
+
+import bb.config
+from bb.utils import logging
+from bb.utils import path_utils
+from bb.utils import profiler
+
+logger = logging.get_logger("bb")
+
+DEFAULT_RECORDS_FILENAME = "actions.pickle"
+
+class ActionError(Exception):
+  """Indicates that a rule has failed when executed by another caller."""
+
+class Action(object):
+  """Represents a single execution of a rule."""
+
+  def __init__(self, rule):
+    self.rule = rule
+    self.fingerprint = None
+    self.up_to_date = False
+    self.error = None
+    self._done = threading.Event()
+
+  def is_done(self):
+    return self._done.is_set()
+
+  def wait(self):
+    # Py2.x Event.wait() without timeout cannot be interrupted.
+    while not self._done.wait(60 * 60):
+      pass
+
+  def finish(self, error=None):
+    self.error = error
+    self._done.set()
+
+class ActionTable(object):
+  """Executes rules at most once and records their fingerprints. If `path` is
+  provided, records are loaded from and saved to this file.
+  """
+
+  def __init__(self, path=None, records=None):
+    self._path = path
+    self._lock = threading.RLock()
+    self._actions = dict()
+    self._fingerprints = dict()
+    self._records = dict()
+    if records is not None:
+      self._records = records
+    elif path:
+      self.load()
+
+  def get_path(self):
+    return self._path
+
+  def get_records(self):
+    return self._records
+
+  def load(self):
+    if not os.path.exists(self._path):
+      return
+    try:
+      with open(self._path, "rb") as handle:
+        self._records = pickle.load(handle)
+    except Exception, e:
+      logger.warning("Cannot load action records from %s: %s" %
+                     (self._path, e))
+      self._records = dict()
+
+  def save(self):
+    if not self._path:
+      return
+    path_utils.mkpath(os.path.dirname(self._path))
+    tmp_path = "%s.%d" % (self._path, os.getpid())
+    with self._lock:
+      with open(tmp_path, "wb") as handle:
+        pickle.dump(self._records, handle, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, self._path)
+
+  def get_action(self, rule):
+    return self._actions.get(rule, None)
+
+  def get_actions(self):
+    return self._actions.values()
+
+  def get_fingerprint(self, rule, _visiting=None):
+    """Returns hex digest that identifies inputs of the rule."""
+    with self._lock:
+      if rule in self._fingerprints:
+        return self._fingerprints[rule]
+    visiting = _visiting or set()
+    if rule in visiting:
+      raise ActionError("Dependency cycle at %s" % rule)
+    visiting.add(rule)
+    sha1 = hashlib.sha1()
+    sha1.update("%s.%s" % (type(rule).__module__, type(rule).__name__))
+    sha1.update(repr(rule.get_address()))
+    if hasattr(rule, "get_fingerprint_data"):
+      for value in rule.get_fingerprint_data():
+        sha1.update(repr(value))
+    for dep in sorted(rule.get_dependencies(), key=repr):
+      sha1.update(self.get_fingerprint(dep, visiting))
+    visiting.discard(rule)
+    fingerprint = sha1.hexdigest()
+    with self._lock:
+      self._fingerprints[rule] = fingerprint
+    return fingerprint
+
+  def copy_fingerprints(self, table, rules):
+    """Reuses fingerprints of `rules` computed by another `table`. Used when
+    it is known that inputs of these rules have not been changed since then
+    (see ``b3 build --watch``).
+    """
+    with self._lock:
+      for rule in rules:
+        fingerprint = table._fingerprints.get(rule, None)
+        if fingerprint is not None:
+          self._fingerprints[rule] = fingerprint
+
+  def is_up_to_date(self, rule, fingerprint):
+    """Returns ``True`` if the rule was executed by a previous invocation with
+    the same fingerprint and all its outputs and discovered inputs are still in
+    place.
+    """
+    record = self._records.get(repr(rule.get_address()))
+    if not record or record["fingerprint"] != fingerprint:
+      return False
+    outputs = rule.get_outputs()
+    if not outputs:
+      return False
+    for output in outputs:
+      if not os.path.exists(output):
+        return False
+    for path, signature in record["inputs"].items():
+      if path_utils.signature(path) != signature:
+        return False
+    return True
+
+  def execute(self, rule):
+    """Executes the rule unless it was already executed during this build or
+    it is up-to-date. Returns :class:`Action` instance.
+    """
+    with self._lock:
+      action = self._actions.get(rule, None)
+      owner = action is None
+      if owner:
+        action = self._actions[rule] = Action(rule)
+    if not owner:
+      action.wait()
+      if action.error:
+        raise ActionError("%s has failed" % rule)
+      return action
+    try:
+      action.fingerprint = self.get_fingerprint(rule)
+      if self.is_up_to_date(rule, action.fingerprint):
+        logger.debug("%s is up-to-date" % rule)
+        action.up_to_date = True
+      else:
+        with profiler.span(repr(rule), "rule"):
+          rule.execute()
+        self.record(rule, action.fingerprint)
+    except Exception, e:
+      action.finish(e)
+      raise
+    action.finish()
+    return action
+
+  def record(self, rule, fingerprint):
+    inputs = dict()
+    for path in rule.get_discovered_inputs():
+      inputs[path] = path_utils.signature(path)
+    with self._lock:
+      self._records[repr(rule.get_address())] = dict(fingerprint=fingerprint,
+                                                     inputs=inputs)
+
+_action_table = ActionTable()
+
+def get_action_table():
+  """Returns action table of the current build."""
+  return _action_table
+
+def set_action_table(table):
+  global _action_table
+  if not isinstance(table, ActionTable):
+    raise TypeError("'table' has to be an ActionTable: %s" % table)
+  _action_table = table
+  return table
+
+def new_action_table():
+  """Creates a new action table, which records are kept in the b3 build
+  directory, and makes it the current one. Records of the current table are
+  reused if they are kept in the same file, so that a long-running process
+  (see :mod:`bb.tools.b3.server`) does not read them on each build.
+  """
+  path = path_utils.join(bb.config.user_settings.get("b3", "builddir"),
+                         DEFAULT_RECORDS_FILENAME)
+  records = None
+  if _action_table.get_path() == path:
+    records = _action_table.get_records()
+  return set_action_table(ActionTable(path, records))
@@ -10,25 +10,31 @@ import __builtin__
 import collections
 import os
 import re
+import sys
 import copy
+import copy_reg
 import marshal
 import inspect
 import types
+import weakref
 import new
 import functools
-from glob import glob1
 from contextlib import contextmanager
-import networkx
 
 import bb.config
 import bb.object
+from bb.utils import fs_snapshot
 from bb.utils import path_utils
 from bb.utils import logging
+from bb.utils import profiler
 from bb.utils import proxy
 from bb.utils.containers import DictWrapper
 from bb.utils import typecheck
 from bb.tools.interpreters import python
+from bb.tools.b3 import actions
+from bb.tools.b3 import graph
 from bb.tools.b3 import primitives
+from bb.tools.b3 import registry
 
 logger = logging.get_logger("bb")
 
@@ -36,34 +42,154 @@ _addresses_by_buildfile = collections.defaultdict(set)
 _rules_by_address = dict()
 _parsed_contexts = set()
 _dynamic_rules = collections.defaultdict(set)
+# Files and directories that affect the result of parsing: BUILD files, source
+# files of the modules imported by them and directories of BUILD families.
+_parse_inputs = set()
+_parse_dirs = set()
 
-class DependencyGraph(networkx.DiGraph):
+class DependencyGraph(graph.Graph):
   """Read more about dependency graph:
   <http://en.wikipedia.org/wiki/Dependency_graph>
+
+  The graph keeps a :class:`~bb.tools.b3.reachability.ReachabilityIndex`, so
+  that transitive dependencies of a rule are computed once and then updated
+  along with the graph.
   """
 
+  def __init__(self):
+    # Forks that have got new parents or children since the last resolution.
+    self._unresolved_forks = set()
+    graph.Graph.__init__(self)
+
+  def clear(self):
+    graph.Graph.clear(self)
+    self._unresolved_forks.clear()
+
+  def add_unresolved_fork(self, fork):
+    self._unresolved_forks.add(fork)
+
+  def get_unresolved_forks(self):
+    return set(self._unresolved_forks)
+
+  def add_edge(self, src, dst):
+    graph.Graph.add_edge(self, src, dst)
+    if isinstance(src, Fork):
+      self._unresolved_forks.add(src)
+    if isinstance(dst, Fork):
+      self._unresolved_forks.add(dst)
+
+  def remove_node(self, node):
+    graph.Graph.remove_node(self, node)
+    self._unresolved_forks.discard(node)
+
   def resolve_forks(self):
-    forks = filter(lambda node: isinstance(node, Fork), self.nodes())
-    for fork in forks:
-      for parent in self.predecessors(fork):
-        parent_lang = parent.get_property_value("programming_language")
-        remove_edge = False
-        for child in self.successors(fork):
-          child_lang = child.get_property_value("programming_language")
-          if not child_lang or parent_lang == child_lang:
-            self.add_edge(parent, child)
-            remove_edge = True
-        if remove_edge:
-          self.remove_edge(parent, fork)
+    """Connects parents of each unresolved fork directly to the children that
+    have the same programming language (or no language at all). Each fork is
+    resolved once, until it gets a new parent or child.
+    """
+    while self._unresolved_forks:
+      fork = self._unresolved_forks.pop()
+      if fork in self:
+        self._resolve_fork(fork)
+
+  def _resolve_fork(self, fork):
+    children = self.successors(fork)
+    for parent in self.predecessors(fork):
+      parent_lang = parent.get_property_value("programming_language")
+      remove_edge = False
+      for child in children:
+        child_lang = child.get_property_value("programming_language")
+        if not child_lang or parent_lang == child_lang:
+          self.add_edge(parent, child)
+          remove_edge = True
+      if remove_edge:
+        self.remove_edge(parent, fork)
 
   def save(self, filepath='dependency_graph.png'):
     import matplotlib.pyplot as plt
-    pos = networkx.graphviz_layout(self)
-    networkx.draw(self, pos, with_labels=True, arrows=True)
+    import networkx
+    g = networkx.DiGraph()
+    g.add_nodes_from(self.nodes())
+    g.add_edges_from(self.edges())
+    pos = networkx.graphviz_layout(g)
+    networkx.draw(g, pos, with_labels=True, arrows=True)
     plt.savefig(filepath)
 
 dependency_graph = DependencyGraph()
 
+def reset():
+  """Forgets all the parsed BUILD files and registered rules."""
+  _addresses_by_buildfile.clear()
+  _rules_by_address.clear()
+  _parsed_contexts.clear()
+  _dynamic_rules.clear()
+  _parse_inputs.clear()
+  _parse_dirs.clear()
+  dependency_graph.clear()
+
+def _get_module_names(paths):
+  paths = set(paths)
+  names = []
+  for name, module in sys.modules.items():
+    if name.startswith("__") or module is None:
+      continue
+    if set(get_module_sources([name])) & paths:
+      names.append(name)
+  return names
+
+def invalidate_files(paths):
+  """Forgets BUILD families and rules affected by changes of `paths`: a BUILD
+  file or a directory of a BUILD family invalidates the family, rules of the
+  family and all the rules that depend on them directly or indirectly, along
+  with their families. A change of a module imported by a BUILD file reloads
+  the module and resets everything, see :func:`reset`. Returns a set of
+  invalidated BUILD files.
+  """
+  paths = set([os.path.abspath(path) for path in paths])
+  buildfiles = set(_parsed_contexts)
+  modules = (paths & _parse_inputs) - \
+      set([buildfile.full_path for buildfile in buildfiles])
+  if modules:
+    for name in _get_module_names(modules):
+      logger.debug("Reload module %s" % name)
+      reload(sys.modules[name])
+    reset()
+    return buildfiles
+  # Only BUILD files and listings of their directories affect parsing,
+  # sources are tracked by the action table.
+  dirs = set()
+  for path in paths:
+    if path in _parse_dirs:
+      dirs.add(path)
+    elif path in _parse_inputs:
+      dirs.add(os.path.dirname(path))
+  dirs &= _parse_dirs
+  affected = set()
+  queue = [buildfile for buildfile in buildfiles
+           if buildfile.parent_path in dirs]
+  while queue:
+    buildfile = queue.pop()
+    if buildfile in affected:
+      continue
+    affected.add(buildfile)
+    for sibling in buildfiles:
+      if sibling.parent_path == buildfile.parent_path:
+        queue.append(sibling)
+    for address in _addresses_by_buildfile.get(buildfile, ()):
+      rule = _rules_by_address.get(address, None)
+      if rule is not None and rule in dependency_graph:
+        for dependent in dependency_graph.predecessors(rule):
+          queue.append(dependent.get_address().buildfile)
+  for buildfile in affected:
+    for address in _addresses_by_buildfile.pop(buildfile, ()):
+      rule = _rules_by_address.pop(address, None)
+      if rule is not None and rule in dependency_graph:
+        dependency_graph.remove_node(rule)
+    _parsed_contexts.discard(buildfile)
+    _parse_inputs.discard(buildfile.full_path)
+    _parse_dirs.discard(buildfile.parent_path)
+  return affected
+
 def get_primitive(name):
   return getattr(primitives, name, None)
 
@@ -71,7 +197,10 @@ def register_primitive(primitive, name=None):
   """Registers and returns primitive."""
   if not name:
     name = primitive.__name__
-  if hasattr(primitives, name):
+  # Lazy primitives are replaced by the real ones once their module has been
+  # imported, see bb.tools.b3.registry.
+  if hasattr(primitives, name) and \
+        not isinstance(getattr(primitives, name), registry.LazyPrimitive):
     logger.warning("Primitive %s will be replaced" % name)
   setattr(primitives, name, primitive)
   return primitive
@@ -88,22 +217,27 @@ def primitive(name=None, primitive=None):
 setattr(primitives, "primitive", primitive)
 
 _rule_classes = dict()
-
-class RuleClassFactory(object):
-  """This factory generates rule classes bases on a given rule class, e.g.
-  RuleClassFactory(CCBinary).gen() will generate another CCBinary rule
-  class. The key moment here is arguments that you can pass to gen() method.
+# Generated rule classes by (rule class, target, parent class, BUILD file).
+_generated_classes = dict()
+
+def _generate_rule_class(rule_cls, target, parent_class, buildfile, args,
+                         kwargs):
+  """Returns a rule class derived from `rule_cls` (and `parent_class`, if any)
+  for `target` defined in `buildfile`. The class is created once and reused
+  while the default arguments are the same.
   """
-
-  template = """class %(name)s(%(unrolled_bases)s):
-  abstract = rule_cls.abstract
-  default_args = args
-  default_kwargs = kwargs
+  key = (rule_cls, target, parent_class, buildfile)
+  cached = _generated_classes.get(key)
+  if cached and cached.default_args == args and \
+        cached.default_kwargs == kwargs:
+    return cached
+  bases = [rule_cls]
+  if parent_class:
+    bases.append(parent_class)
 
   def __init__(self, *fargs, **fkwargs):
-    new_kwargs = None
     if parent_class:
-      new_kwargs = DictWrapper(getattr(parent_class, "default_kwargs").copy())
+      new_kwargs = DictWrapper(parent_class.default_kwargs.copy())
       new_kwargs.update(kwargs)
     else:
       new_kwargs = DictWrapper(kwargs.copy())
@@ -112,49 +246,55 @@ class RuleClassFactory(object):
     rule_cls.__init__(self, *(args + fargs), **new_kwargs)
 
   def locate(self):
-    return Address(ctx.buildfile, self.get_name())"""
+    return Address(buildfile, self.get_name())
+
+  name = RuleClassFactory.gen_name(target, rule_cls)
+  klass = type(rule_cls)(name, tuple(bases), {
+    "__module__": __name__,
+    "__init__": __init__,
+    "locate": locate,
+    "abstract": rule_cls.abstract,
+    "default_args": args,
+    "default_kwargs": kwargs,
+    "_generated_from": key + (args, kwargs),
+  })
+  _generated_classes[key] = klass
+  return klass
+
+class RuleClassFactory(object):
+  """This factory generates rule classes bases on a given rule class, e.g.
+  RuleClassFactory(CCBinary).gen() will generate another CCBinary rule
+  class. The key moment here is arguments that you can pass to gen() method.
+
+  Generated classes are memoized, so that BUILD files evaluated once again
+  (e.g. by the build server) reuse them, and can be pickled with the parsed
+  graph.
+  """
 
   def __init__(self, rule_cls):
     self._rule_cls = rule_cls
 
-  def gen_name(self, target, cls):
+  def get_rule_class(self):
+    return self._rule_cls
+
+  @staticmethod
+  def gen_name(target, cls):
     fullname = bb.object.get_class_fullname(target)
     parts = fullname.split(".")
     return "_".join(parts[:-1] + [parts[-1] + cls.__name__])
 
   def gen(self, *args, **kwargs):
-    bases = [self._rule_cls]
     target = len(args) and args[0] or kwargs.get("target", None)
     if not target:
       raise Exception()
-    name = self.gen_name(target, self._rule_cls)
     parent_class = None
     for subklass in self._rule_cls.__bases__:
       parent_class = _rule_classes.get(self.gen_name(target, subklass), None)
       if parent_class:
-        bases.append(parent_class)
         break
-    try:
-      result = self.template % {
-        'name': name,
-        'unrolled_bases': ','.join(["bases[%d]" % i for i in range(len(bases))])
-      }
-    except Exception, e:
-      raise Exception(e.message + ":\n" + self.template)
-    namespace = dict(rule_cls=self._rule_cls,
-                     bases=bases,
-                     parent_class = parent_class,
-                     DictWrapper = DictWrapper,
-                     Address = Address,
-                     ctx=Context.locate(),
-                     args=args,
-                     kwargs=kwargs)
-    try:
-      exec result in namespace
-    except SyntaxError, e:
-      raise SyntaxError(e.message + ':\n' + self.template.format(namespace))
-    klass = namespace[name]
-    _rule_classes[name] = klass
+    klass = _generate_rule_class(self._rule_cls, target, parent_class,
+                                 Context.locate().buildfile, args, kwargs)
+    _rule_classes[klass.__name__] = klass
     if not klass.abstract:
       _dynamic_rules[target].add(klass)
     return klass
@@ -213,6 +353,20 @@ def parse_address(spec):
           return rule
   return None if not address else get_rule(address)
 
+def get_module_sources(names):
+  """Returns a list of source files of the modules `names`."""
+  sources = []
+  for name in names:
+    module = sys.modules.get(name, None)
+    path = getattr(module, "__file__", None)
+    if not path:
+      continue
+    path = os.path.abspath(path)
+    if path.endswith((".pyc", ".pyo")) and os.path.exists(path[:-1]):
+      path = path[:-1]
+    sources.append(path)
+  return sources
+
 def get_address(root_dir, path, is_relative=True):
   """Parses pathish into an Address. A pathish can be one of:
 
@@ -280,9 +434,9 @@ class RuleWithSources(object):
 
   def _find_work_dir(self):
     """Find and return work directory."""
-    cwd = os.path.abspath(os.getcwd())
-    path = os.path.relpath(self.get_address().buildfile.parent_path, cwd)
-    return os.path.abspath(path)
+    # The directory of the BUILD file is an absolute normalized path, there is
+    # no need to resolve it against the current directory.
+    return self.get_address().buildfile.parent_path
 
   def get_work_dir(self):
     return self._work_dir
@@ -324,7 +478,9 @@ class RuleWithSources(object):
       # First of all check for attribute "__build__" and call it to resolve
       # dependencies.
       if hasattr(source, "__build__"):
-        self._add_callable_source(source.__build__)
+        with profiler.span(type(source).__name__, "expand",
+                           rule=repr(self)):
+          self._add_callable_source(source.__build__)
       elif callable(source):
         self._add_callable_source(source.__call__)
       rule = parse_address(source)
@@ -369,6 +525,20 @@ class RuleWithSources(object):
   def get_sources(self):
     return self._sources
 
+  def get_sources_fingerprint_data(self):
+    """Returns a list of (source, digest) pairs, where digest is a content
+    digest for files and an address for rules.
+    """
+    data = []
+    for source in self.get_sources():
+      if isinstance(source, Rule):
+        data.append((repr(source.get_address()), None))
+      elif path_utils.isfile(source):
+        data.append((source, path_utils.digest(source)))
+      else:
+        data.append((source, None))
+    return data
+
 class rule(type):
 
   def __new__(mcls, name, bases, d):
@@ -386,6 +556,15 @@ class rule(type):
     s1 = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', cls.__name__)
     return re.sub('([a-z0-9])([A-Z])', r'\1_\2', s1).lower()
 
+def _reduce_rule_class(cls):
+  # Generated rule classes cannot be found by name, thus they are generated
+  # once again when unpickled.
+  if "_generated_from" in cls.__dict__:
+    return (_generate_rule_class, cls.__dict__["_generated_from"])
+  return cls.__name__
+
+copy_reg.pickle(rule, _reduce_rule_class)
+
 class Rule(Primitive):
   """Within a BUILD file we have a number of named rules describing the build
   outputs.
@@ -468,9 +647,9 @@ class Rule(Primitive):
     elif not typecheck.is_string(path):
       raise TypeError("path can be only a string or list")
     path = path_utils.join(self.get_build_dir(), path)
-    if path_utils.exists(path):
+    if fs_snapshot.exists(path):
       return path
-    return path_utils.touch(path, recursive=recursive)
+    return fs_snapshot.touch(path, recursive=recursive)
 
   def _post_init(self, func, *args, **kwargs):
     """Registers a command `func` to invoke after this rule's BUILD file is
@@ -522,26 +701,46 @@ class Rule(Primitive):
     raise NotImplementedError()
 
   def resolve(self):
+    """Executes dependencies of this rule. Each dependency is executed at most
+    once per build, see :class:`~bb.tools.b3.actions.ActionTable`.
+    """
+    table = actions.get_action_table()
     for dep in self.get_dependencies():
-      #dep.resolve()
-      dep.execute()
+      table.execute(dep)
+
+  def get_fingerprint_data(self):
+    """Returns a list of values that affect the result of this rule. Used by
+    :class:`~bb.tools.b3.actions.ActionTable` to compute the rule fingerprint.
+    Fingerprints of the dependencies are taken into account separately.
+    """
+    data = []
+    if isinstance(self, RuleWithSources):
+      data.extend(self.get_sources_fingerprint_data())
+    return data
+
+  def get_outputs(self):
+    """Returns a list of files produced by this rule. A rule without outputs is
+    never considered up-to-date.
+    """
+    return []
+
+  def get_discovered_inputs(self):
+    """Returns a list of files, that are not sources, but were used to produce
+    the outputs (e.g. headers).
+    """
+    return []
 
   def get_dependency_graph(self):
     """Returns directed dependency tree."""
-    nodes = []
-    def _collect_subgraph_nodes(roots):
-      nodes.extend(roots)
-      for root in roots:
-        _collect_subgraph_nodes(dependency_graph.successors(root))
-    _collect_subgraph_nodes([self])
-    return dependency_graph.subgraph(nodes)
+    return dependency_graph.subgraph(dependency_graph.get_closure(self))
 
   def get_common_languages(self):
     common_langs = set()
-    for _, node in bfs(self.get_dependency_graph(), self):
+    graph = self.get_dependency_graph()
+    for _, node in bfs(graph, self):
       langs = []
       if isinstance(node, Fork):
-        for child in self.get_dependency_graph().successors(node):
+        for child in graph.successors(node):
           lang = child.get_property_value("programming_language")
           if lang:
             langs.append(lang)
@@ -609,23 +808,37 @@ class Rule(Primitive):
     self._walk_deps(set(), work, predicate)
 
 class Address(object):
-  """Represents a BUILD file rule address."""
+  """Represents a BUILD file rule address. Addresses are interned: there is
+  only one instance for each BUILD file and target, thus addresses can be
+  compared by identity and the hash is computed once.
+  """
 
-  def __init__(self, buildfile, target):
-    self.buildfile = buildfile
-    self.target = target
+  __slots__ = ("buildfile", "target", "_key", "_hash", "__weakref__")
+
+  _interned = weakref.WeakValueDictionary()
+
+  def __new__(cls, buildfile, target):
+    key = (buildfile.full_path, buildfile.canonical_relpath, target)
+    address = cls._interned.get(key, None)
+    if address is None:
+      address = object.__new__(cls)
+      address.buildfile = buildfile
+      address.target = target
+      address._key = (buildfile.canonical_relpath, target)
+      address._hash = hash(address._key)
+      cls._interned[key] = address
+    return address
+
+  def __reduce__(self):
+    return (Address, (self.buildfile, self.target))
 
   def __eq__(self, other):
-    result = other and (type(other) == Address) and (
-      self.buildfile.canonical_relpath == other.buildfile.canonical_relpath) and \
-      (self.target == other.target)
-    return result
+    if self is other:
+      return True
+    return type(other) is Address and self._key == other._key
 
   def __hash__(self):
-    value = 17
-    value *= 37 + hash(self.buildfile.canonical_relpath)
-    value *= 37 + hash(self.target)
-    return value
+    return self._hash
 
   def __ne__(self, other):
     return not self.__eq__(other)
@@ -637,6 +850,10 @@ class Fork(Rule):
 
   def __init__(self, target=None, name=None, deps=[]):
     Rule.__init__(self, target, name, deps=deps)
+    dependency_graph.add_unresolved_fork(self)
+
+  def execute(self):
+    pass
 
 class ContextError(Exception):
   """Inidicates an action that requires a BUILD file parse context was attempted
@@ -707,21 +924,27 @@ class Context(object):
       # Inject b3 primitives
       ast = compile("from bb.tools.b3.primitives import *", "<string>", "exec")
       python.Compatibility.exec_function(ast, pants_context)
-      with Context.activate(self):
-        start = os.path.abspath(os.curdir)
-        try:
-          os.chdir(self.buildfile.parent_path)
-          for buildfile in buildfile_family:
-            self.buildfile = buildfile
-            eval_globals = copy.copy(pants_context)
-            eval_globals.update({
-              'ROOT_DIR': buildfile.root_dir,
-              '__file__': buildfile.full_path,
-            })
-            eval_globals.update(globalargs)
-            python.Compatibility.exec_function(buildfile.code(), eval_globals)
-        finally:
-          os.chdir(start)
+      _parse_dirs.add(self.buildfile.parent_path)
+      imported_modules = set(sys.modules.keys())
+      with profiler.span(self.buildfile.relpath, "parse"):
+        with Context.activate(self):
+          start = os.path.abspath(os.curdir)
+          try:
+            os.chdir(self.buildfile.parent_path)
+            for buildfile in buildfile_family:
+              self.buildfile = buildfile
+              _parse_inputs.add(buildfile.full_path)
+              eval_globals = copy.copy(pants_context)
+              eval_globals.update({
+                'ROOT_DIR': buildfile.root_dir,
+                '__file__': buildfile.full_path,
+              })
+              eval_globals.update(globalargs)
+              python.Compatibility.exec_function(buildfile.code(), eval_globals)
+          finally:
+            os.chdir(start)
+            _parse_inputs.update(get_module_sources(set(sys.modules.keys()) -
+                                                    imported_modules))
 
   def do_in_context(self, work):
     """Executes the callable work in this parse context."""
@@ -742,16 +965,14 @@ class BuildFile(object):
   def __init__(self, root_dir, relpath, must_exist=True):
     path = os.path.abspath(os.path.join(root_dir, relpath))
     buildfile = os.path.join(path, BuildFile._CANONICAL_NAME) \
-        if os.path.isdir(path) else path
-    if os.path.isdir(buildfile):
+        if fs_snapshot.isdir(path) else path
+    if fs_snapshot.isdir(buildfile):
       raise IOError("%s is a directory" % buildfile)
     if must_exist:
-      if not os.path.exists(buildfile):
+      if not fs_snapshot.exists(buildfile):
         raise IOError("BUILD file does not exist at: %s" % (buildfile))
       if not BuildFile._is_buildfile_name(os.path.basename(buildfile)):
         raise IOError("%s is not a BUILD file" % buildfile)
-      if not os.path.exists(buildfile):
-        raise IOError("BUILD file does not exist at: %s" % buildfile)
     self.root_dir = root_dir
     self.full_path = buildfile
     self.name = os.path.basename(self.full_path)
@@ -775,9 +996,9 @@ class BuildFile(object):
 
   def code(self):
     """Returns the code object for this BUILD file."""
-    if (os.path.exists(self._bytecode_path)
-        and os.path.getmtime(self.full_path) <= \
-          os.path.getmtime(self._bytecode_path)):
+    if (fs_snapshot.exists(self._bytecode_path)
+        and fs_snapshot.getmtime(self.full_path) <= \
+          fs_snapshot.getmtime(self._bytecode_path)):
       with open(self._bytecode_path, 'rb') as bytecode:
         return marshal.load(bytecode)
     else:
@@ -785,6 +1006,7 @@ class BuildFile(object):
         code = compile(source.read(), self.full_path, 'exec')
         with open(self._bytecode_path, 'wb') as bytecode:
           marshal.dump(code, bytecode)
+        fs_snapshot.invalidate([self._bytecode_path])
         return code
 
   @staticmethod
@@ -809,10 +1031,10 @@ class BuildFile(object):
     """Returns an iterator over all the BUILD files co-located with this BUILD
     file not including this BUILD file itself.
     """
-    for build in glob1(self.parent_path, 'BUILD*'):
+    for build in fs_snapshot.glob1(self.parent_path, 'BUILD*'):
       if self.name != build and BuildFile._is_buildfile_name(build):
         siblingpath = os.path.join(os.path.dirname(self.relpath), build)
-        if not os.path.isdir(os.path.join(self.root_dir, siblingpath)):
+        if not fs_snapshot.isdir(os.path.join(self.root_dir, siblingpath)):
           yield BuildFile(self.root_dir, siblingpath)
 
   def family(self):
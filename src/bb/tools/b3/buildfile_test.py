@@ -0,0 +1,103 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import cPickle as pickle
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import buildfile
+from bb.tools.b3.rules import cc
+from bb.tools.b3.rules import fileset
+
+class ForkResolutionTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    with open(os.path.join(self.dir, "BUILD"), "w") as handle:
+      handle.write('fileset(name="files", srcs=[])\n'
+                   'cc_library(name="lib", srcs=[])\n'
+                   'cc_binary(name="app", deps=[(":lib", ":files")])\n')
+    buildfile.reset()
+
+  def teardown(self):
+    buildfile.reset()
+
+  def test_resolve_forks(self):
+    build = buildfile.BuildFile(self.dir, ".")
+    buildfile.Context(build).parse()
+    graph = buildfile.dependency_graph
+    app = buildfile.get_rule(buildfile.Address(build, "app"))
+    lib = buildfile.get_rule(buildfile.Address(build, "lib"))
+    files = buildfile.get_rule(buildfile.Address(build, "files"))
+    forks = graph.get_unresolved_forks()
+    self.assert_equal(len(forks), 1)
+    self.assert_equal(graph.successors(app), list(forks))
+    graph.resolve_forks()
+    self.assert_equal(graph.get_unresolved_forks(), set())
+    self.assert_equal(set(graph.successors(app)), set([lib, files]))
+
+class InvalidationTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.buildfile_path = os.path.join(self.dir, "BUILD")
+    with open(self.buildfile_path, "w") as handle:
+      handle.write('cc_library(name="lib", srcs=["lib.c"])\n')
+    buildfile.reset()
+    self.build = buildfile.BuildFile(self.dir, ".")
+    self.address = buildfile.Address(self.build, "lib")
+    buildfile.get_rule(self.address)
+
+  def teardown(self):
+    buildfile.reset()
+
+  def test_source_change(self):
+    invalidated = buildfile.invalidate_files([os.path.join(self.dir, "lib.c")])
+    self.assert_equal(invalidated, set())
+    self.assert_true(self.address in buildfile._rules_by_address)
+
+  def test_buildfile_change(self):
+    invalidated = buildfile.invalidate_files([self.buildfile_path])
+    self.assert_equal(invalidated, set([self.build]))
+    self.assert_false(self.address in buildfile._rules_by_address)
+    self.assert_true(buildfile.get_rule(self.address) is not None)
+
+class RuleClassFactoryTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.write_build('cc_library_factory(target=collections.OrderedDict,'
+                     ' srcs=[])\n')
+    buildfile.reset()
+    self.build = buildfile.BuildFile(self.dir, ".")
+
+  def teardown(self):
+    buildfile.reset()
+
+  def write_build(self, line):
+    with open(os.path.join(self.dir, "BUILD"), "w") as handle:
+      handle.write("import collections\n" + line)
+
+  def parse(self):
+    buildfile.reset()
+    buildfile.Context(self.build).parse()
+    return buildfile._rule_classes["collections_OrderedDictCCLibrary"]
+
+  def test_memoization(self):
+    klass = self.parse()
+    self.assert_true(issubclass(klass, cc.CCLibrary))
+    self.assert_true(self.parse() is klass)
+    self.write_build('cc_library_factory(target=collections.OrderedDict,'
+               ' srcs=["lib.c"])\n')
+    other = self.parse()
+    self.assert_false(other is klass)
+    self.assert_equal(other.default_kwargs["srcs"], ["lib.c"])
+
+  def test_pickle(self):
+    klass = self.parse()
+    self.assert_true(pickle.loads(pickle.dumps(klass, 2)) is klass)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -7,7 +7,24 @@
 
    $ b3 build [:target]
 
-, where ``:target`` is a label name inside your BUILD script.
+, where ``:target`` is a label name inside your BUILD script. Recursive
+patterns ``dir/...`` and ``dir:*`` select all the rules under a directory and
+all the rules of a BUILD family respectively, see
+:mod:`bb.tools.b3.discovery`.
+
+With ``--watch`` option the command keeps running after the build, watches
+sources of the rules, their dependencies and BUILD files, and rebuilds the
+rules affected by changes::
+
+   $ b3 build --watch :app --load :load
+
+, where ``:load`` is executed after each successful build, e.g. a
+``propeller_load`` rule that uploads the binary to the board.
+
+With ``--profile`` option the command records time spent on parsing BUILD
+files, expanding sources, executing rules and running child processes, writes
+a trace in Chrome trace-event format (open it with chrome://tracing) and
+prints the slowest rules and the critical path through the dependency graph.
 """
 
 from __future__ import print_function
@@ -17,15 +34,48 @@ import os
 import traceback
 
 import bb.config
+from bb.tools import action_cache
+from bb.tools.compilers import compiler_cache
 from bb.tools.b3.commands.command import Command
+from bb.tools.b3 import actions
 from bb.tools.b3 import buildfile
+from bb.tools.b3 import discovery
+from bb.tools.b3 import graph_cache
+from bb.tools.b3 import scheduler
+from bb.tools.b3 import watcher
+from bb.utils import fs_snapshot
 from bb.utils import path_utils
+from bb.utils import spawn
 from bb.utils import logging
+from bb.utils import profiler
+from bb.utils import typecheck
 
 DEFAULT_TARGET = ":all"
+DEFAULT_PROFILE_FILENAME = "profile.json"
+# The number of the slowest rules printed by --profile.
+NUM_SLOWEST_RULES = 10
 
 logger = logging.get_logger("bb")
 
+class TargetError(Exception):
+  """Indicates that a requested rule cannot be parsed or does not exist."""
+
+def get_rules(addresses):
+  """Returns a list of rules for `addresses`, BUILD files are parsed if
+  required. Raises :class:`TargetError` if some rule cannot be found.
+  """
+  rules = []
+  for address in addresses:
+    try:
+      rule = buildfile.get_rule(address)
+    except:
+      raise TargetError("Problem parsing BUILD rule %s: %s" %
+                        (address, traceback.format_exc()))
+    if not rule:
+      raise TargetError("Rule %s does not exist" % address)
+    rules.append(rule)
+  return rules
+
 class Build(Command):
   """This class represents build command."""
 
@@ -34,34 +84,95 @@ class Build(Command):
     if not self.args:
       self.args = [DEFAULT_TARGET]
     self.rules = []
-    addresses = []
+    self.addresses = []
+    self.load_rule = None
+    self.load_address = None
+    self.graph_cache = None
+    if self.options.profile:
+      if self.options.watch:
+        self.error("--profile cannot be used with --watch")
+      profiler.set_profiler(profiler.Profiler())
+    try:
+      self._setup_targets(root_dir)
+    except BaseException:
+      profiler.set_profiler(None)
+      raise
+
+  def _setup_targets(self, root_dir):
+    """Parses BUILD files and resolves the requested rules."""
+    # The snapshot lives as long as this command, a watching build
+    # invalidates changed paths.
+    fs_snapshot.new_snapshot()
+    if self.options.graph_cache:
+      self.graph_cache = graph_cache.GraphCache(root_dir)
+      with profiler.span("load graph snapshot", "parse"):
+        self.graph_cache.load()
+    self._parse_bbos()
+    for target in self.args[0:]:
+      if discovery.is_pattern(target):
+        for address in self._expand_pattern(target):
+          if address not in self.addresses:
+            self.addresses.append(address)
+        continue
+      address = self._get_address(target)
+      if not address:
+        print("Cannot find BUILD file for", target, file=sys.stderr)
+        continue
+      if address not in self.addresses:
+        self.addresses.append(address)
+    if self.options.load:
+      self.load_address = self._get_address(self.options.load)
+      if not self.load_address:
+        self.error("Cannot find BUILD file for %s" % self.options.load)
+    try:
+      self.resolve_rules()
+    except TargetError, e:
+      self.error(str(e))
+    for rule in self.rules:
+      print(rule)
+    if self.graph_cache and self.graph_cache.is_dirty():
+      self.graph_cache.save()
+
+  def run(self, lock):
+    try:
+      return Command.run(self, lock)
+    finally:
+      # The process can outlive the command (see b3 server), the next command
+      # must not record into the profiler of this one.
+      profiler.set_profiler(None)
+
+  def _parse_bbos(self):
     # TODO: the following injection has to be fixed
     if os.path.exists(bb.config.user_settings.get("bbos", "homedir")):
       bbos_src = path_utils.join(bb.config.user_settings.get("bbos", "homedir"),
                                  "src", "main")
       bbos_buildfile = buildfile.BuildFile(bbos_src, ".")
       buildfile.Context(bbos_buildfile).parse()
-    #
-    for target in self.args[0:]:
-      try:
-        address = buildfile.get_address(root_dir, target)
-      except:
-        self.error("Problem parsing target %s: %s" %
-                   (target, traceback.format_exc()))
-      if not address:
-        print("Cannot find BUILD file for", target, file=sys.stderr)
-        continue
-      addresses.append(address)
-    for address in addresses:
-      try:
-        print(buildfile.get_rule(address))
-        rule = buildfile.get_rule(address)
-      except:
-        self.error("Problem parsing BUILD rule %s: %s" %
-                   (address, traceback.format_exc()))
-      if not rule:
-        self.error("Rule %s does not exist" % address)
-      self.rules.append(rule)
+
+  def _get_address(self, target):
+    try:
+      return buildfile.get_address(self.root_dir, target)
+    except:
+      self.error("Problem parsing target %s: %s" %
+                 (target, traceback.format_exc()))
+
+  def _expand_pattern(self, pattern):
+    try:
+      return discovery.expand_pattern(self.root_dir, pattern)
+    except IOError, e:
+      self.error(str(e))
+    except:
+      self.error("Problem parsing target %s: %s" %
+                 (pattern, traceback.format_exc()))
+
+  def resolve_rules(self):
+    """Finds rules for the requested targets and the rule to be executed after
+    a successful build (see ``--load`` option). Raises :class:`TargetError` if
+    some rule cannot be found.
+    """
+    self.rules = get_rules(self.addresses)
+    if self.load_address:
+      self.load_rule = get_rules([self.load_address])[0]
 
   def setup_parser(self, parser, args):
     parser.set_usage("\n"
@@ -72,6 +183,31 @@ class Build(Command):
                       default=False, help="Don't output result of empty rules")
     parser.add_option("--list-rules", action="store_true", dest="list_rules",
                       default=False, help="List existed rules")
+    parser.add_option("-j", "--jobs", type="int", dest="jobs", default=1,
+                      metavar="N", help="Execute up to N rules at once")
+    parser.add_option("--no-cache", action="store_false", dest="cache",
+                      default=True, help="Do not use the action cache")
+    parser.add_option("--no-graph-cache", action="store_false",
+                      dest="graph_cache", default=True,
+                      help="Parse all BUILD files instead of loading the graph"
+                      " snapshot")
+    parser.add_option("-k", "--keep-going", action="store_true",
+                      dest="keep_going", default=False,
+                      help="Keep going when some rules fail")
+    parser.add_option("-w", "--watch", action="store_true", dest="watch",
+                      default=False,
+                      help="Watch sources and BUILD files of the rules and"
+                      " rebuild affected rules once they have been changed")
+    parser.add_option("--load", dest="load", metavar="TARGET",
+                      help="Execute TARGET (e.g. a propeller_load rule) after"
+                      " each successful build")
+    parser.add_option("--profile", action="store_true", dest="profile",
+                      default=False,
+                      help="Write a trace of the build in Chrome trace-event"
+                      " format and print where the time has gone")
+    parser.add_option("--profile-file", dest="profile_file", metavar="FILE",
+                      help="Write the trace to FILE instead of %s in the"
+                      " build directory" % DEFAULT_PROFILE_FILENAME)
     parser.epilog = "Builds the specified rule(s). Currently any additional" \
         "arguments are passed straight through to the ant build" \
         "system."
@@ -82,6 +218,200 @@ class Build(Command):
       for rule in self.rules:
         print("\t", rule.name)
       return
+    if self.options.jobs < 1:
+      self.error("The number of jobs has to be positive: %d" %
+                 self.options.jobs)
+    # Rules and compilers share the same limit of concurrent processes.
+    spawn.set_max_jobs(self.options.jobs)
+    if self.options.watch:
+      return self.watch()
+    code = self.build()
+    if profiler.get_profiler():
+      self.print_profile(profiler.get_profiler())
+    return code
+
+  def print_profile(self, build_profiler):
+    """Writes the trace and prints the slowest rules, the critical path
+    through the dependency graph, and the time spent in child processes
+    (compilers, linkers, etc.) versus the time spent in Python.
+    """
+    build_profiler.stop()
+    path = self.options.profile_file or \
+        path_utils.join(bb.config.user_settings.get("b3", "builddir"),
+                        DEFAULT_PROFILE_FILENAME)
+    path_utils.mkpath(os.path.dirname(os.path.abspath(path)))
+    build_profiler.write_trace(path)
+    rule_time = build_profiler.get_total_time("rule")
+    process_time = build_profiler.get_total_time("process")
+    print("Build profile, %.3fs wall time (trace: %s)" %
+          (build_profiler.get_wall_time(), path))
+    print("  Parsing BUILD files:  %8.3fs" %
+          build_profiler.get_total_time("parse"))
+    print("  Expanding sources:    %8.3fs" %
+          build_profiler.get_total_time("expand"))
+    print("  Executing rules:      %8.3fs" % rule_time)
+    print("    child processes:    %8.3fs" % process_time)
+    print("    Python:             %8.3fs" % max(rule_time - process_time, 0.0))
+    rules = dict([(repr(rule), rule) for rule in self.get_closure()])
+    if self.load_rule:
+      rules.update([(repr(rule), rule) for rule in
+                    buildfile.dependency_graph.get_closure(self.load_rule)])
+    durations = dict()
+    for name, duration in build_profiler.get_durations("rule").items():
+      if name in rules:
+        durations[rules[name]] = duration
+    if not durations:
+      print("All rules are up-to-date")
+      return
+    print("Slowest rules:")
+    slowest = sorted(durations.items(), key=lambda item: -item[1])
+    for rule, duration in slowest[:NUM_SLOWEST_RULES]:
+      print("  %8.3fs  %s" % (duration, rule))
+    roots = list(self.rules)
+    if self.load_rule:
+      roots.append(self.load_rule)
+    critical_path, length = profiler.get_critical_path(
+      roots, durations, buildfile.dependency_graph.successors)
+    print("Critical path, %.3fs:" % length)
+    for rule in critical_path:
+      print("  %8.3fs  %s" % (durations.get(rule, 0.0), rule))
+
+  def build(self, unchanged_rules=None):
+    """Builds the requested rules and executes the load rule, if any. Rules
+    from `unchanged_rules` reuse fingerprints computed by the previous build.
+    Returns the exit code.
+    """
+    cache = None
+    if self.options.cache:
+      cache = action_cache.set_action_cache(action_cache.new_action_cache())
+    compiler_cache.set_compiler_cache(
+      cache and compiler_cache.new_compiler_cache(cache))
+    previous_table = actions.get_action_table()
+    action_table = actions.new_action_table()
+    if unchanged_rules:
+      action_table.copy_fingerprints(previous_table, unchanged_rules)
+    build_scheduler = scheduler.Scheduler(jobs=self.options.jobs,
+                                          keep_going=self.options.keep_going,
+                                          action_table=action_table)
+    # The engine lives as long as the process (see b3 server), thus only
+    # programs run by this build are counted.
+    engine_stats = spawn.get_engine().begin_stats()
+    try:
+      build_scheduler.run(self.rules)
+      if self.load_rule:
+        build_scheduler.run([self.load_rule])
+    except scheduler.BuildError, e:
+      print(e, file=sys.stderr)
+      return 1
+    finally:
+      action_table.save()
+      stats = spawn.get_engine().end_stats(engine_stats)
+      if stats["processes"]:
+        logger.debug("Processes: %d run, %d failed, %.2fs user, %.2fs system, "
+                     "%d KB max RSS" % (stats["processes"], stats["failures"],
+                                        stats["utime"], stats["stime"],
+                                        stats["maxrss"]))
+      if cache:
+        logger.debug("Action cache: %d hit(s), %d miss(es)" %
+                     (cache.hits, cache.misses))
+        ccache = compiler_cache.get_compiler_cache()
+        if ccache:
+          logger.debug("Compiler cache: %d direct hit(s), %d preprocessed "
+                       "hit(s), %d miss(es)" % (ccache.direct_hits,
+                                                ccache.preprocessed_hits,
+                                                ccache.misses))
+        if cache.stored_size:
+          cache.gc()
+    return 0
+
+  def get_closure(self):
+    """Returns a set of the requested rules and all their dependencies."""
+    closure = set()
     for rule in self.rules:
-      logger.debug("Execute %s" % rule)
-      rule.execute()
+      closure.update(buildfile.dependency_graph.get_closure(rule))
+    return closure
+
+  def _get_inputs(self, rule, records):
+    inputs = set()
+    if isinstance(rule, buildfile.RuleWithSources):
+      for source in rule.get_expanded_sources():
+        if typecheck.is_string(source):
+          inputs.add(source)
+    record = records.get(repr(rule.get_address()), None)
+    if record:
+      inputs.update(record["inputs"])
+    return inputs
+
+  def get_watched_paths(self):
+    """Returns a set of paths that affect the requested rules: expanded
+    sources of the rules and their dependencies, inputs discovered by the
+    previous build (e.g. headers), BUILD files, their directories and modules
+    imported by them.
+    """
+    records = actions.get_action_table().get_records()
+    paths = set(buildfile._parse_inputs) | set(buildfile._parse_dirs)
+    for rule in self.get_closure():
+      paths.update(self._get_inputs(rule, records))
+    return paths
+
+  def get_affected_rules(self, paths):
+    """Returns a set of rules which inputs are among `paths` along with all
+    the rules that depend on them.
+    """
+    paths = set(paths)
+    records = actions.get_action_table().get_records()
+    closure = self.get_closure()
+    affected = set([rule for rule in closure
+                    if self._get_inputs(rule, records) & paths])
+    stack = list(affected)
+    while stack:
+      rule = stack.pop()
+      for dependent in buildfile.dependency_graph.predecessors(rule):
+        if dependent in closure and dependent not in affected:
+          affected.add(dependent)
+          stack.append(dependent)
+    return affected
+
+  def _update_watched(self, file_watcher):
+    paths = self.get_watched_paths()
+    for path in file_watcher.get_watched():
+      if path not in paths:
+        file_watcher.unwatch(path)
+    file_watcher.watch_all(paths)
+
+  def watch(self):
+    """Builds the requested rules, then waits for changes of their inputs and
+    rebuilds affected rules until interrupted by the user. Returns the exit
+    code of the last build.
+    """
+    file_watcher = watcher.FileWatcher()
+    code = self.build()
+    try:
+      while True:
+        self._update_watched(file_watcher)
+        print("Watching %d path(s) for changes, press Ctrl-C to stop" %
+              len(file_watcher.get_watched()))
+        changed = file_watcher.wait()
+        logger.debug("Changed %s" % ", ".join(changed))
+        fs_snapshot.invalidate(changed)
+        unchanged_rules = None
+        if buildfile.invalidate_files(changed):
+          # BUILD files have to be parsed again, thus all the fingerprints have
+          # to be computed again.
+          try:
+            self._parse_bbos()
+            self.resolve_rules()
+          except TargetError, e:
+            print(e, file=sys.stderr)
+            code = 1
+            continue
+        else:
+          affected = self.get_affected_rules(changed)
+          if not affected:
+            continue
+          unchanged_rules = self.get_closure() - affected
+          print("Rebuild %d rule(s) affected by changes" % len(affected))
+        code = self.build(unchanged_rules)
+    except KeyboardInterrupt:
+      print()
+    return code
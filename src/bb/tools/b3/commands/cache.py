@@ -0,0 +1,57 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+
+"""The cache command manages the local action cache::
+
+   $ b3 cache stats
+   $ b3 cache gc [--max-size MB]
+   $ b3 cache clean
+
+The location and the size limit of the cache are defined by `cachedir` and
+`cachesize` (in megabytes) options of `b3` section in the user config.
+"""
+
+from __future__ import print_function
+
+from bb.tools import action_cache
+from bb.tools.b3.commands.command import Command
+
+class Cache(Command):
+  """This class represents cache command."""
+
+  SUBCOMMANDS = ("stats", "gc", "clean")
+
+  def setup_parser(self, parser, args):
+    parser.set_usage("\n"
+                     "  %prog cache stats\n"
+                     "  %prog cache gc [--max-size MB]\n"
+                     "  %prog cache clean")
+    parser.add_option("--max-size", type="int", dest="max_size",
+                      default=None, metavar="MB",
+                      help="Shrink the cache to MB megabytes")
+    parser.epilog = "Manages the local action cache."
+
+  def execute(self):
+    if len(self.args) != 1 or self.args[0] not in self.SUBCOMMANDS:
+      self.error("Expected one of: %s" % ", ".join(self.SUBCOMMANDS))
+    cache = action_cache.new_action_cache()
+    subcommand = self.args[0]
+    if subcommand == "stats":
+      stats = cache.get_stats()
+      print("Cache directory: %s" % cache.get_root_dir())
+      print("Actions:         %d" % stats["actions"])
+      print("Blobs:           %d" % stats["blobs"])
+      print("Manifests:       %d" % stats["manifests"])
+      print("Size:            %.1f MB of %.1f MB" %
+            (stats["size"] / 1048576., stats["max_size"] / 1048576.))
+    elif subcommand == "gc":
+      max_size = None
+      if self.options.max_size is not None:
+        max_size = self.options.max_size << 20
+      print("Evicted %d action(s)" % cache.gc(max_size))
+    elif subcommand == "clean":
+      cache.clear()
+      print("Cache %s has been removed" % cache.get_root_dir())
+    return 0
@@ -0,0 +1,107 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+
+"""The query command answers questions about the rule graph without building
+anything::
+
+   $ b3 query 'deps(:app)'
+   $ b3 query 'kind(cc_binary, rdeps(src/lib:lib))' --output=json
+
+All the BUILD files under the root directory are parsed (or loaded from the
+graph snapshot), see :mod:`bb.tools.b3.query` for the query language. Targets
+can be recursive patterns, e.g. ``deps(src/...)``, see
+:mod:`bb.tools.b3.discovery`.
+"""
+
+from __future__ import print_function
+
+import json
+import sys
+import traceback
+
+from bb.tools.b3.commands.command import Command
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import discovery
+from bb.tools.b3 import graph_cache
+from bb.tools.b3 import query
+
+OUTPUT_FORMATS = ("label", "kind", "json")
+
+class Query(Command):
+  """This class represents query command."""
+
+  def setup_parser(self, parser, args):
+    parser.set_usage("\n"
+                     "  %prog query (options) expression")
+    parser.add_option("--output", dest="output", default="label",
+                      metavar="FORMAT",
+                      help="Output format: %s" % ", ".join(OUTPUT_FORMATS))
+    parser.add_option("--no-graph-cache", action="store_false",
+                      dest="graph_cache", default=True,
+                      help="Parse all BUILD files instead of loading the graph"
+                      " snapshot")
+    parser.epilog = "Evaluates the query expression over the rule graph."
+
+  def load_graph(self):
+    """Parses all the BUILD files under the root directory."""
+    cache = None
+    if self.options.graph_cache:
+      cache = graph_cache.GraphCache(self.root_dir)
+      cache.load()
+    try:
+      discovery.parse_buildfiles(self.root_dir,
+                                 discovery.find_buildfiles(self.root_dir))
+    except:
+      self.error("Problem parsing BUILD files: %s" % traceback.format_exc(),
+                 show_help=False)
+    buildfile.dependency_graph.resolve_forks()
+    buildfile.dependency_graph.compact()
+    if cache and cache.is_dirty():
+      cache.save()
+
+  def resolve_target(self, target):
+    if discovery.is_pattern(target):
+      try:
+        addresses = discovery.expand_pattern(self.root_dir, target)
+      except IOError, e:
+        raise query.QueryError(str(e))
+      return [buildfile.get_rule(address) for address in addresses]
+    address = buildfile.get_address(self.root_dir, target)
+    rule = buildfile.get_rule(address) if address else None
+    if not rule:
+      raise query.QueryError("Rule %s does not exist" % target)
+    return [rule]
+
+  def execute(self):
+    if not self.args:
+      self.error("Expected a query expression")
+    if self.options.output not in OUTPUT_FORMATS:
+      self.error("Unknown output format %s, expected one of: %s" %
+                 (self.options.output, ", ".join(OUTPUT_FORMATS)))
+    expression = " ".join(self.args)
+    self.load_graph()
+    index = query.QueryIndex()
+    try:
+      rules = query.Query(expression, index, self.resolve_target).evaluate()
+    except query.QueryError, e:
+      print(e, file=sys.stderr)
+      return 1
+    if self.options.output == "json":
+      json.dump({"query": expression,
+                 "rules": [{"label": query.get_label(rule),
+                            "kind": query.get_kind(rule),
+                            "deps": sorted([query.get_label(dep) for dep in
+                                            index.deps([rule], 1)
+                                            if dep is not rule])}
+                           for rule in rules]},
+                sys.stdout, indent=2, sort_keys=True)
+      print()
+    elif self.options.output == "kind":
+      for rule in rules:
+        print(query.get_kind(rule), query.get_label(rule))
+    else:
+      for rule in rules:
+        print(query.get_label(rule))
+    return 0
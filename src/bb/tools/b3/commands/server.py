@@ -0,0 +1,57 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+
+"""The server command runs the b3 build server for the current directory::
+
+   $ b3 server
+   $ b3 server --status
+   $ b3 server --stop
+
+While the server is running, b3 commands started from the same directory are
+executed by the server, see :mod:`bb.tools.b3.server`.
+"""
+
+from __future__ import print_function
+
+import sys
+
+from bb.tools.b3 import server
+from bb.tools.b3.commands.command import Command
+
+class Server(Command):
+  """This class represents server command."""
+
+  def setup_parser(self, parser, args):
+    parser.set_usage("\n"
+                     "  %prog server\n"
+                     "  %prog server --status\n"
+                     "  %prog server --stop")
+    parser.add_option("--stop", action="store_true", dest="stop",
+                      default=False, help="Stop the running server")
+    parser.add_option("--status", action="store_true", dest="status",
+                      default=False, help="Show status of the running server")
+    parser.epilog = "Runs the build server, that keeps parsed BUILD files " \
+        "and rules in memory between builds."
+
+  def execute(self):
+    if self.options.stop or self.options.status:
+      request = "stop" if self.options.stop else "status"
+      result = server.send_request(self.root_dir, {"request": request})
+      if result is None:
+        print("b3 server for %s is not running" % self.root_dir,
+              file=sys.stderr)
+        return 1
+      return result
+    try:
+      build_server = server.BuildServer(self.root_dir)
+    except server.ServerError, e:
+      print(e, file=sys.stderr)
+      return 1
+    print("b3 server is listening on %s" % build_server.socket_path)
+    try:
+      build_server.serve()
+    except KeyboardInterrupt:
+      pass
+    return 0
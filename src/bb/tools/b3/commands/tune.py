@@ -0,0 +1,108 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+
+"""The tune command searches for compiler flags of a CC binary (e.g.
+``propeller_binary``) and its libraries that minimize the image size and,
+optionally, the number of cycles estimated on the host::
+
+   $ b3 tune -j4 :app
+   $ b3 tune --strategy halving --estimate "./sim --cycles" --write :app
+
+The binary is built first, then its variants are built concurrently through
+the action cache and scored, see :mod:`bb.tools.b3.tuner`. Flag sets are
+picked by the compiler unless given by ``--flags`` options, e.g.
+``--flags "-Os" --flags "-O2 -mfcache"``. With ``--write`` the best flags are
+written back as `copts` attributes of the rules in their BUILD files.
+"""
+
+from __future__ import print_function
+
+import random
+import shlex
+import sys
+
+from bb.tools.b3.commands.build import Build
+from bb.tools.b3 import tuner
+from bb.tools.b3.rules.cc import CCBinary
+from bb.utils import spawn
+
+class Tune(Build):
+  """This class represents tune command."""
+
+  def setup_parser(self, parser, args):
+    Build.setup_parser(self, parser, args)
+    parser.set_usage("\n"
+                     "  %prog tune (options) [target]...")
+    parser.add_option("--strategy", dest="strategy",
+                      default=tuner.GREEDY_STRATEGY, metavar="STRATEGY",
+                      help="Search strategy: %s" % ", ".join(tuner.STRATEGIES))
+    parser.add_option("--flags", action="append", dest="flag_sets",
+                      default=[], metavar="FLAGS",
+                      help="Try flag set FLAGS, e.g. \"-O2 -mfcache\"")
+    parser.add_option("--estimate", dest="estimator", metavar="COMMAND",
+                      help="Estimate cycles of an image by COMMAND, that gets"
+                      " the image as the last argument and prints the number"
+                      " of cycles")
+    parser.add_option("--cycles-weight", type="float", dest="cycles_weight",
+                      default=1.0, metavar="WEIGHT",
+                      help="Weight of cycles relative to the image size")
+    parser.add_option("--candidates", type="int", dest="candidates",
+                      default=tuner.DEFAULT_NUM_CANDIDATES, metavar="N",
+                      help="Sample N configurations for successive halving")
+    parser.add_option("--seed", type="int", dest="seed", default=0,
+                      help="Random seed of successive halving")
+    parser.add_option("--write", action="store_true", dest="write",
+                      default=False,
+                      help="Write the best flags back to BUILD files")
+    parser.epilog = "Searches for the best compiler flags of the specified" \
+        " binaries."
+
+  def execute(self):
+    if self.options.watch or self.options.load:
+      self.error("--watch and --load cannot be used with tune")
+    if self.options.strategy not in tuner.STRATEGIES:
+      self.error("Unknown strategy %s, expected one of: %s" %
+                 (self.options.strategy, ", ".join(tuner.STRATEGIES)))
+    if self.options.jobs < 1:
+      self.error("The number of jobs has to be positive: %d" %
+                 self.options.jobs)
+    binaries = [rule for rule in self.rules if isinstance(rule, CCBinary)]
+    if not binaries:
+      self.error("Expected one or more CC binaries")
+    spawn.set_max_jobs(self.options.jobs)
+    code = self.build()
+    if code:
+      return code
+    flag_sets = [tuple(shlex.split(flags))
+                 for flags in self.options.flag_sets]
+    for binary in binaries:
+      binary_tuner = tuner.Tuner(binary, flag_sets=flag_sets,
+                                 jobs=self.options.jobs,
+                                 estimator=self.options.estimator,
+                                 cycles_weight=self.options.cycles_weight)
+      try:
+        config, cost = binary_tuner.tune(self.options.strategy,
+                                         self.options.candidates,
+                                         random.Random(self.options.seed))
+      except tuner.TuneError, e:
+        print(e, file=sys.stderr)
+        return 1
+      print(binary_tuner.format_report(config))
+      if config == binary_tuner.baseline:
+        print("The flags of %s are the best already" % binary)
+        continue
+      for module, flags in zip(binary_tuner.modules, config):
+        if list(flags) == module.get_copts():
+          continue
+        if not self.options.write:
+          print("%s: copts=%s" % (module.get_address(), list(flags)))
+          continue
+        try:
+          tuner.write_copts(module, flags)
+        except (tuner.TuneError, IOError, SyntaxError), e:
+          print("Cannot write copts of %s: %s" % (module, e), file=sys.stderr)
+          return 1
+        print("Written copts=%s of %s" % (list(flags), module.get_address()))
+    return 0
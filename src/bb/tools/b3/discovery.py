@@ -0,0 +1,231 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""Discovery of BUILD files and expansion of recursive target patterns::
+
+  $ b3 build src/...     # all the rules under src directory
+  $ b3 build src/lib:*   # all the rules of src/lib BUILD family
+  $ b3 build :*          # all the rules of the BUILD family in the current
+                         # directory
+
+Directories are walked level by level. The directories of each level can be
+listed concurrently by a pool of threads, the number of threads is defined by
+`discoveryjobs` option of `b3` section in the user config. Listing is mostly
+waiting for the filesystem, which pays off on network filesystems; on a local
+filesystem with a warm page cache the walk is bound by the interpreter and a
+single thread is faster, thus it is the default. The `scandir` module is used
+if it is installed, so that entry types are taken from the listing without
+extra stat calls.
+
+Hidden directories, the b3 build directory and directories matching the
+patterns from ``.b3ignore`` file in the root directory (one shell pattern of a
+path relative to the root directory per line, ``#`` starts a comment) are not
+walked. BUILD families are returned and parsed in sorted order, so that the
+result does not depend on the order in which directories were listed.
+"""
+
+import fnmatch
+import os
+import stat
+from multiprocessing.pool import ThreadPool
+
+try:
+  from scandir import scandir
+except ImportError:
+  scandir = None
+
+import bb.config
+from bb.tools.b3 import buildfile
+
+IGNORE_FILENAME = ".b3ignore"
+DEFAULT_JOBS = 1
+
+RECURSIVE_SUFFIX = "..."
+ALL_RULES_SUFFIX = ":*"
+
+def is_pattern(target):
+  """Returns ``True`` if `target` is a recursive or a wildcard pattern."""
+  return target == RECURSIVE_SUFFIX or \
+      target.endswith("/" + RECURSIVE_SUFFIX) or \
+      target.endswith(ALL_RULES_SUFFIX)
+
+def get_default_jobs():
+  """Returns the number of threads used to list directories."""
+  settings = bb.config.user_settings
+  if settings.has_option("b3", "discoveryjobs"):
+    return max(settings.getint("b3", "discoveryjobs"), 1)
+  return DEFAULT_JOBS
+
+def read_ignore_patterns(root_dir):
+  """Returns a list of patterns from the ignore file in `root_dir`."""
+  path = os.path.join(root_dir, IGNORE_FILENAME)
+  if not os.path.isfile(path):
+    return []
+  patterns = []
+  with open(path) as handle:
+    for line in handle:
+      line = line.split("#", 1)[0].strip().rstrip("/")
+      if line:
+        patterns.append(line)
+  return patterns
+
+def _list_dir(path):
+  """Returns a tuple of sorted lists of file names and directory names in
+  `path`.
+  """
+  files = []
+  dirs = []
+  try:
+    if scandir:
+      for entry in scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+          dirs.append(entry.name)
+        else:
+          files.append(entry.name)
+    else:
+      for name in os.listdir(path):
+        try:
+          mode = os.lstat(os.path.join(path, name)).st_mode
+        except OSError:
+          continue
+        if stat.S_ISDIR(mode):
+          dirs.append(name)
+        else:
+          files.append(name)
+  except OSError:
+    pass
+  return sorted(files), sorted(dirs)
+
+class Walker(object):
+  """Finds BUILD files under `root_dir` with `jobs` threads. `ignore` is a
+  list of shell patterns of directory paths relative to `root_dir` that have
+  to be skipped, by default they are read from the ignore file.
+  """
+
+  def __init__(self, root_dir, ignore=None, jobs=None):
+    self._root_dir = os.path.abspath(root_dir)
+    self._ignore = read_ignore_patterns(self._root_dir) if ignore is None \
+        else list(ignore)
+    self._jobs = jobs or get_default_jobs()
+    self._ignored_dirs = set()
+    builddir = os.path.abspath(bb.config.user_settings.get("b3", "builddir"))
+    self._ignored_dirs.add(builddir)
+
+  def get_root_dir(self):
+    return self._root_dir
+
+  def get_ignore_patterns(self):
+    return list(self._ignore)
+
+  def is_ignored(self, path):
+    """Returns ``True`` if the directory `path` must not be walked."""
+    if os.path.basename(path).startswith("."):
+      return True
+    if path in self._ignored_dirs:
+      return True
+    relpath = os.path.relpath(path, self._root_dir)
+    for pattern in self._ignore:
+      if fnmatch.fnmatch(relpath, pattern):
+        return True
+    return False
+
+  def find_buildfiles(self, relpath="."):
+    """Returns a sorted list of paths of BUILD files under `relpath`, paths
+    are relative to the root directory.
+    """
+    start = os.path.normpath(os.path.join(self._root_dir, relpath))
+    result = []
+    level = [start]
+    pool = None
+    try:
+      while level:
+        if len(level) > 1 and self._jobs > 1:
+          if not pool:
+            pool = ThreadPool(self._jobs)
+          listings = pool.map(_list_dir, level)
+        else:
+          listings = map(_list_dir, level)
+        next_level = []
+        for path, (files, dirs) in zip(level, listings):
+          for name in files:
+            if buildfile.BuildFile._is_buildfile_name(name):
+              result.append(os.path.relpath(os.path.join(path, name),
+                                            self._root_dir))
+          for name in dirs:
+            child = os.path.join(path, name)
+            if not self.is_ignored(child):
+              next_level.append(child)
+        level = next_level
+    finally:
+      if pool:
+        pool.close()
+        pool.join()
+    return sorted(result)
+
+def find_buildfiles(root_dir, relpath=".", ignore=None, jobs=None):
+  """Returns a sorted list of paths of BUILD files under `relpath`, see
+  :class:`Walker`.
+  """
+  return Walker(root_dir, ignore, jobs).find_buildfiles(relpath)
+
+def get_families(root_dir, relpaths):
+  """Returns a list of canonical BUILD files, one per BUILD family found
+  among `relpaths`, sorted by path.
+  """
+  families = dict()
+  for relpath in relpaths:
+    dirname = os.path.dirname(relpath)
+    if dirname in families:
+      continue
+    canonical = os.path.join(dirname, buildfile.BuildFile._CANONICAL_NAME)
+    if os.path.isfile(os.path.join(root_dir, canonical)):
+      relpath = canonical
+    families[dirname] = relpath
+  return [buildfile.BuildFile(root_dir, families[dirname])
+          for dirname in sorted(families)]
+
+def parse_buildfiles(root_dir, relpaths):
+  """Parses BUILD families of `relpaths` in sorted order. Returns a list of
+  canonical BUILD files of the families.
+  """
+  families = get_families(root_dir, relpaths)
+  for family in families:
+    buildfile.Context(family).parse()
+  return families
+
+def get_addresses(buildfiles):
+  """Returns a list of addresses of rules defined in BUILD families of
+  `buildfiles`, sorted by BUILD file and rule name.
+  """
+  addresses = set()
+  for build in buildfiles:
+    for member in build.family():
+      for address in member.get_all_addresses():
+        # Forks are created implicitly for alternative dependencies.
+        if not isinstance(buildfile.get_rule(address), buildfile.Fork):
+          addresses.add(address)
+  return sorted(addresses, key=lambda address: (address.buildfile.relpath,
+                                                address.target))
+
+def expand_pattern(root_dir, pattern, walker=None):
+  """Returns a list of addresses of rules matched by `pattern`. Relative
+  paths are resolved against the current directory, as for
+  :func:`~bb.tools.b3.buildfile.get_address`. Raises :class:`IOError` if the
+  directory of the pattern does not exist.
+  """
+  root_dir = os.path.abspath(root_dir)
+  if pattern.endswith(ALL_RULES_SUFFIX):
+    path = pattern[:-len(ALL_RULES_SUFFIX)] or "."
+    relpath = os.path.relpath(os.path.abspath(path), root_dir)
+    return get_addresses([buildfile.BuildFile(root_dir, relpath)])
+  path = pattern[:-len(RECURSIVE_SUFFIX)] or "."
+  path = os.path.abspath(path)
+  if not os.path.isdir(path):
+    raise IOError("Directory does not exist: %s" % path)
+  walker = walker or Walker(root_dir)
+  relpaths = walker.find_buildfiles(os.path.relpath(path, root_dir))
+  return get_addresses(parse_buildfiles(root_dir, relpaths))
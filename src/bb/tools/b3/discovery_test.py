@@ -0,0 +1,53 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import discovery
+from bb.tools.b3.rules import cc
+
+class DiscoveryTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.write("BUILD", "")
+    self.write("lib/BUILD", 'cc_library(name="lib", srcs=[])\n')
+    self.write("lib/BUILD.extras", 'cc_library(name="extras", srcs=[])\n')
+    self.write("lib/util/BUILD", 'cc_library(name="util", srcs=[])\n')
+    self.write("third_party/BUILD", 'cc_library(name="zlib", srcs=[])\n')
+    self.write(".git/BUILD", "")
+    buildfile.reset()
+
+  def teardown(self):
+    buildfile.reset()
+
+  def test_find_buildfiles(self):
+    self.assert_equal(discovery.find_buildfiles(self.dir, ignore=[], jobs=4),
+                      ["BUILD", "lib/BUILD", "lib/BUILD.extras",
+                       "lib/util/BUILD", "third_party/BUILD"])
+    self.write(discovery.IGNORE_FILENAME, "third_party # vendored\n")
+    self.assert_equal(discovery.find_buildfiles(self.dir, "lib"),
+                      ["lib/BUILD", "lib/BUILD.extras", "lib/util/BUILD"])
+    self.assert_equal(discovery.find_buildfiles(self.dir),
+                      ["BUILD", "lib/BUILD", "lib/BUILD.extras",
+                       "lib/util/BUILD"])
+
+  def test_expand_pattern(self):
+    addresses = discovery.expand_pattern(
+      self.dir, os.path.join(self.dir, "lib") + "/...")
+    self.assert_equal([repr(address) for address in addresses],
+                      ["lib/BUILD:lib", "lib/BUILD.extras:extras",
+                       "lib/util/BUILD:util"])
+    addresses = discovery.expand_pattern(
+      self.dir, os.path.join(self.dir, "lib") + ":*")
+    self.assert_equal([address.target for address in addresses],
+                      ["lib", "extras"])
+    self.assert_raises(IOError, discovery.expand_pattern, self.dir,
+                       os.path.join(self.dir, "nope") + "/...")
+
+if __name__ == "__main__":
+  unittest.main()
@@ -7,24 +7,17 @@
 
 from __future__ import print_function
 
-import logging
-import pkgutil
-import inspect
 import os
 import sys
 import optparse
 import traceback
 
-from bb.utils import typecheck
-from bb.tools.b3 import commands
-from bb.tools.b3 import rules
-from bb.tools.b3 import buildfile
-from bb.tools.b3.commands.command import Command
+from bb.tools.b3 import registry
+from bb.tools.b3 import server
 
 __version__ = "0.0.1"
 
 _buildroot = None
-_commands = {}
 
 DEFAULT_COMMAND = "build"
 
@@ -49,7 +42,7 @@ def trace_exception_and_exit():
   print()
   traceback.print_exc(file=sys.stdout)
   print("_" * 70)
-  sys.exit(0)
+  sys.exit(1)
 
 def synthesize_command(root_dir, args):
   command = args[0] if len(args) else DEFAULT_COMMAND
@@ -61,50 +54,37 @@ def synthesize_command(root_dir, args):
   return command, None
 
 def get_command(name):
-  return _commands.get(name, None)
+  """Returns command class `name`. The command module is imported on
+  demand.
+  """
+  return registry.load_command(name)
 
 def get_all_commands():
-  return _commands.keys()
-
-def register_commands():
-  """Registers commands from bb.tools.b3.commands package."""
-  for _, mod, ispkg in pkgutil.iter_modules(commands.__path__):
-    if ispkg: continue
-    fq_module = '.'.join([commands.__name__, mod])
-    __import__(fq_module)
-    for (_, cls) in inspect.getmembers(sys.modules[fq_module], inspect.isclass):
-      if issubclass(cls, Command) and not cls is Command:
-        _commands[cls.__name__.lower()] = cls
+  return registry.get_command_names()
 
 def parse_command(root_dir, args):
   command, args = synthesize_command(root_dir, args)
   return get_command(command), args
 
 def register_rules():
-  """Registers rules from bb.tools.b3.rules package."""
-  for _, mod, ispkg in pkgutil.iter_modules(rules.__path__):
-    if ispkg:
-      continue
-    fq_module = '.'.join([rules.__name__, mod])
-    __import__(fq_module)
-    for (_, cls) in inspect.getmembers(sys.modules[fq_module], inspect.isclass):
-      if issubclass(cls, buildfile.Rule):
-        setattr(sys.modules[__name__], cls.__name__, cls)
-
-def run():
-  version = get_version()
-  rootdir = get_build_root()
-  print("b3 v%s" % version)
-  command_class, command_args = parse_command(rootdir, sys.argv[1:])
-  parser = optparse.OptionParser(version='b3 %s' % version)
+  """Registers rules from bb.tools.b3.rules package. Rule modules are
+  imported once their primitives are used from a BUILD file.
+  """
+  registry.install_primitives()
+
+def run_command(rootdir, args):
+  """Runs b3 command line `args` for the root directory `rootdir` and returns
+  the exit code of the command.
+  """
+  command_class, command_args = parse_command(rootdir, args)
+  parser = optparse.OptionParser(version='b3 %s' % get_version())
   command = command_class(rootdir, parser, command_args)
   if command.serialized():
     raise NotImplementedError()
   else:
     lock = None #Lock.unlocked()
   try:
-    result = command.run(lock)
-    sys.exit(result)
+    return command.run(lock)
   except KeyboardInterrupt:
     command.cleanup()
     raise
@@ -112,16 +92,29 @@ def run():
     # lock.release()
     pass
 
+def run():
+  version = get_version()
+  rootdir = get_build_root()
+  # Keep STDOUT for the output of commands, e.g. b3 query --output=json.
+  print("b3 v%s" % version, file=sys.stderr)
+  sys.exit(run_command(rootdir, sys.argv[1:]))
+
 def main():
+  # Fast path, that does not need any rule or command.
+  if sys.argv[1:] == ["--version"]:
+    print("b3 %s" % get_version())
+    return 0
+  # Let the build server execute the command if it is running.
+  result = server.forward(get_build_root(), sys.argv[1:])
+  if result is not None:
+    return result
   register_rules()
-  register_commands()
   try:
     run()
   except KeyboardInterrupt:
     exit_and_fail("Interrupted by user.")
   except SystemExit, e:
-    if e.code > 0:
-      trace_exception_and_exit()
+    return e.code
   except:
     trace_exception_and_exit()
   return 0
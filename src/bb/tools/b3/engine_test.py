@@ -0,0 +1,43 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+import sys
+
+from bb.utils.testing import unittest
+from bb.utils import fs_snapshot
+from bb.tools import action_cache
+from bb.tools.b3 import engine
+from bb.tools.b3 import server
+from bb.tools.compilers import compiler_cache
+
+class EngineTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.saved = (os.getcwd(), sys.argv, os.environ.get(server.ENV_NO_SERVER))
+    os.chdir(self.dir)
+    os.environ[server.ENV_NO_SERVER] = "1"
+
+  def teardown(self):
+    cwd, sys.argv, no_server = self.saved
+    os.chdir(cwd)
+    # The build installs process-wide caches.
+    fs_snapshot.set_snapshot(None)
+    action_cache.set_action_cache(None)
+    compiler_cache.set_compiler_cache(None)
+    if no_server is None:
+      del os.environ[server.ENV_NO_SERVER]
+
+  def test_failed_build_exits_with_error(self):
+    self.write("BUILD", 'cc_binary(name="prog", srcs=["prog.c"])\n')
+    self.write("prog.c", "int main() { return }\n")
+    sys.argv = ["b3", "build", ":prog"]
+    self.assert_equal(engine.main(), 1)
+    sys.argv = ["b3", "query", "deps(:nonexist)"]
+    self.assert_not_equal(engine.main(), 0)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,238 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""Compact directed graph used by b3 to keep rule dependencies.
+
+Each node gets an integer id once it has been added to the graph. Adjacency is
+kept by ids: while the graph is being built, as a list of successors and a list
+of predecessors for each node; once :func:`Graph.compact` has been called, as
+CSR-style arrays (an array of offsets and an array of targets for successors,
+the same for predecessors). A compacted graph answers all the queries, the
+first modification expands it back to lists.
+
+The graph provides the subset of NetworkX `DiGraph` API used by b3::
+
+  g = Graph()
+  g.add_edge(a, b)
+  g.successors(a) # [b]
+  g.predecessors(b) # [a]
+  g[a] # [b]
+"""
+
+import array
+
+from bb.tools.b3 import reachability
+
+class Graph(object):
+  """Directed graph without parallel edges. Nodes can be any hashable
+  objects.
+  """
+
+  def __init__(self):
+    self._reachability = reachability.ReachabilityIndex(self)
+    self.clear()
+
+  def clear(self):
+    """Removes all the nodes and edges."""
+    # Maps node to its id.
+    self._ids = dict()
+    # Maps id to node, removed nodes leave None behind.
+    self._nodes = []
+    self._num_nodes = 0
+    self._num_edges = 0
+    self._succ = []
+    self._pred = []
+    # (succ_offsets, succ_targets, pred_offsets, pred_targets) once compacted.
+    self._csr = None
+    self._reachability.invalidate()
+
+  def _get_id(self, node):
+    try:
+      return self._ids[node]
+    except KeyError:
+      raise KeyError("The node %s is not in the graph" % (node,))
+
+  def _get_successor_ids(self, i):
+    if self._csr:
+      offsets, targets = self._csr[0], self._csr[1]
+      return targets[offsets[i]:offsets[i + 1]]
+    return self._succ[i]
+
+  def _get_predecessor_ids(self, i):
+    if self._csr:
+      offsets, targets = self._csr[2], self._csr[3]
+      return targets[offsets[i]:offsets[i + 1]]
+    return self._pred[i]
+
+  def is_compact(self):
+    return self._csr is not None
+
+  def compact(self):
+    """Packs adjacency lists into CSR arrays."""
+    if self._csr:
+      return
+    self._csr = self._pack(self._succ) + self._pack(self._pred)
+    self._succ = self._pred = None
+
+  def _pack(self, lists):
+    offsets = array.array("l", [0])
+    targets = array.array("l")
+    for ids in lists:
+      targets.extend(ids)
+      offsets.append(len(targets))
+    return (offsets, targets)
+
+  def _expand(self):
+    if not self._csr:
+      return
+    num_ids = len(self._nodes)
+    succ_offsets, succ_targets, pred_offsets, pred_targets = self._csr
+    self._succ = [succ_targets[succ_offsets[i]:succ_offsets[i + 1]].tolist()
+                  for i in xrange(num_ids)]
+    self._pred = [pred_targets[pred_offsets[i]:pred_offsets[i + 1]].tolist()
+                  for i in xrange(num_ids)]
+    self._csr = None
+
+  def get_reachability_index(self):
+    return self._reachability
+
+  def get_closure(self, node):
+    """Returns a frozenset of `node` and all the nodes reachable from it."""
+    return self._reachability.get_closure(node)
+
+  def is_reachable(self, src, dst):
+    return self._reachability.is_reachable(src, dst)
+
+  def add_node(self, node):
+    if node in self._ids:
+      return
+    self._expand()
+    self._ids[node] = len(self._nodes)
+    self._nodes.append(node)
+    self._succ.append([])
+    self._pred.append([])
+    self._num_nodes += 1
+    self._reachability.add_node(node)
+
+  def add_nodes_from(self, nodes):
+    for node in nodes:
+      self.add_node(node)
+
+  def remove_node(self, node):
+    i = self._get_id(node)
+    self._expand()
+    for j in self._succ[i]:
+      self._pred[j].remove(i)
+    for j in self._pred[i]:
+      self._succ[j].remove(i)
+    # A self-loop has been already removed from the predecessors.
+    self._num_edges -= len(self._succ[i]) + len(self._pred[i])
+    self._succ[i] = []
+    self._pred[i] = []
+    self._nodes[i] = None
+    del self._ids[node]
+    self._num_nodes -= 1
+    self._reachability.invalidate()
+
+  def remove_nodes_from(self, nodes):
+    for node in list(nodes):
+      if node in self._ids:
+        self.remove_node(node)
+
+  def add_edge(self, src, dst):
+    self.add_node(src)
+    self.add_node(dst)
+    i, j = self._ids[src], self._ids[dst]
+    self._expand()
+    if j in self._succ[i]:
+      return
+    self._succ[i].append(j)
+    self._pred[j].append(i)
+    self._num_edges += 1
+    self._reachability.add_edge(src, dst)
+
+  def add_edges_from(self, edges):
+    for src, dst in edges:
+      self.add_edge(src, dst)
+
+  def remove_edge(self, src, dst):
+    i, j = self._get_id(src), self._get_id(dst)
+    self._expand()
+    if j not in self._succ[i]:
+      raise KeyError("The edge %s-%s is not in the graph" % (src, dst))
+    self._succ[i].remove(j)
+    self._pred[j].remove(i)
+    self._num_edges -= 1
+    self._reachability.invalidate()
+
+  def remove_edges_from(self, edges):
+    for src, dst in edges:
+      if self.has_edge(src, dst):
+        self.remove_edge(src, dst)
+
+  def has_node(self, node):
+    return node in self._ids
+
+  def has_edge(self, src, dst):
+    i, j = self._ids.get(src, None), self._ids.get(dst, None)
+    if i is None or j is None:
+      return False
+    return j in self._get_successor_ids(i)
+
+  def nodes(self):
+    """Returns a list of nodes in the order they have been added."""
+    return [node for node in self._nodes if node is not None]
+
+  def edges(self):
+    """Returns a list of (src, dst) tuples."""
+    nodes = self._nodes
+    result = []
+    for i, src in enumerate(nodes):
+      if src is None:
+        continue
+      for j in self._get_successor_ids(i):
+        result.append((src, nodes[j]))
+    return result
+
+  def successors(self, node):
+    nodes = self._nodes
+    return [nodes[j] for j in self._get_successor_ids(self._get_id(node))]
+
+  def predecessors(self, node):
+    nodes = self._nodes
+    return [nodes[j] for j in self._get_predecessor_ids(self._get_id(node))]
+
+  def number_of_nodes(self):
+    return self._num_nodes
+
+  def number_of_edges(self):
+    return self._num_edges
+
+  def subgraph(self, nodes):
+    """Returns a new graph of the same class that contains `nodes` and edges
+    between them.
+    """
+    graph = self.__class__()
+    nodes = [node for node in nodes if node in self._ids]
+    graph.add_nodes_from(nodes)
+    for node in nodes:
+      for successor in self.successors(node):
+        if successor in graph._ids:
+          graph.add_edge(node, successor)
+    return graph
+
+  def __getitem__(self, node):
+    return self.successors(node)
+
+  def __contains__(self, node):
+    return node in self._ids
+
+  def __iter__(self):
+    return iter(self.nodes())
+
+  def __len__(self):
+    return self._num_nodes
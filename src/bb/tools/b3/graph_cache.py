@@ -0,0 +1,152 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The graph cache keeps a snapshot of parsed BUILD files, so that the next b3
+invocation can load the rule graph instead of evaluating BUILD files and the
+modules they import once again::
+
+  cache = GraphCache(root_dir)
+  cache.load()
+  # ... parse BUILD files, parsed ones will be skipped ...
+  cache.save()
+
+The snapshot is valid while the content of every BUILD file and imported module
+is the same, and the set of BUILD files in each BUILD family directory is the
+same. Snapshots that cannot be written (e.g. some rule cannot be pickled) or
+read are ignored and BUILD files are parsed as usual.
+"""
+
+import cPickle as pickle
+import glob
+import hashlib
+import os
+
+import bb.config
+from bb.tools.b3 import buildfile
+from bb.tools.interpreters import python
+from bb.utils import logging
+from bb.utils import path_utils
+
+logger = logging.get_logger("bb")
+
+# Has to be changed once the format of snapshot is changed.
+SNAPSHOT_VERSION = 2
+
+class GraphCache(object):
+  """Saves and loads snapshot of the parsed rule graph for the given root
+  directory.
+  """
+
+  def __init__(self, root_dir, path=None):
+    self._root_dir = os.path.abspath(root_dir)
+    if not path:
+      path = path_utils.join(bb.config.user_settings.get("b3", "builddir"),
+                             "graphs",
+                             hashlib.sha1(self._root_dir).hexdigest()
+                             + ".pickle")
+    self._path = path
+    self._loaded_contexts = set()
+
+  def get_path(self):
+    return self._path
+
+  def _get_header(self):
+    return (SNAPSHOT_VERSION, str(python.PythonIdentity.get()), self._root_dir)
+
+  def _get_inputs(self):
+    files = dict()
+    for path in buildfile._parse_inputs:
+      if os.path.isfile(path):
+        files[path] = path_utils.digest(path)
+    dirs = dict()
+    for path in buildfile._parse_dirs:
+      dirs[path] = sorted(glob.glob1(path, "BUILD*"))
+    return dict(files=files, dirs=dirs)
+
+  def _is_valid(self, inputs):
+    for path, digest in inputs["files"].items():
+      if not os.path.isfile(path) or path_utils.digest(path) != digest:
+        logger.debug("Graph snapshot is out of date: %s has been changed" %
+                     path)
+        return False
+    for path, names in inputs["dirs"].items():
+      if sorted(glob.glob1(path, "BUILD*")) != names:
+        logger.debug("Graph snapshot is out of date: BUILD files in %s" % path)
+        return False
+    return True
+
+  def is_dirty(self):
+    """Returns ``True`` if some BUILD files have been parsed after the
+    snapshot was loaded.
+    """
+    return buildfile._parsed_contexts != self._loaded_contexts
+
+  def load(self):
+    """Loads the snapshot and installs the rule graph. Returns ``True`` on
+    success.
+    """
+    if buildfile._parsed_contexts or not os.path.exists(self._path):
+      # The snapshot is never mixed with BUILD files parsed by this process.
+      return False
+    try:
+      with open(self._path, "rb") as handle:
+        unpickler = pickle.Unpickler(handle)
+        if unpickler.load() != self._get_header():
+          return False
+        if not self._is_valid(unpickler.load()):
+          return False
+        state = unpickler.load()
+    except Exception, e:
+      logger.debug("Cannot load graph snapshot %s: %s" % (self._path, e))
+      return False
+    self._install(state)
+    self._loaded_contexts = set(buildfile._parsed_contexts)
+    logger.debug("Graph snapshot %s has been loaded" % self._path)
+    return True
+
+  def _install(self, state):
+    buildfile._rules_by_address.update(state["rules_by_address"])
+    for key, addresses in state["addresses_by_buildfile"].items():
+      buildfile._addresses_by_buildfile[key].update(addresses)
+    for key, rule_classes in state["dynamic_rules"].items():
+      buildfile._dynamic_rules[key].update(rule_classes)
+    buildfile._parsed_contexts.update(state["parsed_contexts"])
+    buildfile._parse_inputs.update(state["parse_inputs"])
+    buildfile._parse_dirs.update(state["parse_dirs"])
+    buildfile.dependency_graph.add_nodes_from(state["nodes"])
+    buildfile.dependency_graph.add_edges_from(state["edges"])
+
+  def save(self):
+    """Saves the snapshot of the current rule graph. Returns ``True`` on
+    success.
+    """
+    state = dict(
+      rules_by_address=buildfile._rules_by_address,
+      addresses_by_buildfile=dict(buildfile._addresses_by_buildfile),
+      dynamic_rules=dict(buildfile._dynamic_rules),
+      parsed_contexts=buildfile._parsed_contexts,
+      parse_inputs=buildfile._parse_inputs,
+      parse_dirs=buildfile._parse_dirs,
+      nodes=buildfile.dependency_graph.nodes(),
+      edges=buildfile.dependency_graph.edges())
+    path_utils.mkpath(os.path.dirname(self._path))
+    tmp_path = "%s.%d" % (self._path, os.getpid())
+    try:
+      with open(tmp_path, "wb") as handle:
+        pickler = pickle.Pickler(handle, pickle.HIGHEST_PROTOCOL)
+        pickler.dump(self._get_header())
+        pickler.dump(self._get_inputs())
+        pickler.dump(state)
+      os.rename(tmp_path, self._path)
+    except Exception, e:
+      logger.debug("Cannot save graph snapshot: %s" % e)
+      return False
+    finally:
+      if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    self._loaded_contexts = set(buildfile._parsed_contexts)
+    return True
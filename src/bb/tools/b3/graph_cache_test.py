@@ -0,0 +1,56 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import graph_cache
+from bb.tools.b3.rules import fileset
+
+class GraphCacheTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.write("BUILD", 'fileset(name="files", srcs=["a.c"])\n')
+    self.write("a.c", "int a;\n")
+    buildfile.reset()
+
+  def teardown(self):
+    buildfile.reset()
+
+  def new_cache(self):
+    return graph_cache.GraphCache(self.dir,
+                                  os.path.join(self.dir, "graph.pickle"))
+
+  def parse(self):
+    buildfile.Context(buildfile.BuildFile(self.dir, ".")).parse()
+
+  def test_load(self):
+    cache = self.new_cache()
+    self.assert_false(cache.load())
+    self.parse()
+    self.assert_true(cache.is_dirty())
+    self.assert_true(cache.save())
+    self.assert_false(cache.is_dirty())
+    buildfile.reset()
+    cache = self.new_cache()
+    self.assert_true(cache.load())
+    self.assert_equal([repr(address) for address in buildfile._rules_by_address],
+                      ["BUILD:files"])
+    self.assert_equal(len(buildfile.dependency_graph.nodes()), 1)
+
+  def test_invalidation(self):
+    self.parse()
+    self.new_cache().save()
+    buildfile.reset()
+    self.write("BUILD", 'fileset(name="other", srcs=["a.c"])\n')
+    self.assert_false(self.new_cache().load())
+    self.write("BUILD", 'fileset(name="files", srcs=["a.c"])\n')
+    self.write("BUILD.extra", "")
+    self.assert_false(self.new_cache().load())
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,62 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import cPickle as pickle
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import graph
+
+class GraphTest(unittest.TestCase):
+
+  def setup(self):
+    self.graph = graph.Graph()
+    self.graph.add_edges_from([("a", "b"), ("a", "c"), ("b", "c"), ("a", "b")])
+
+  def test_queries(self):
+    self.assert_equal(self.graph.nodes(), ["a", "b", "c"])
+    self.assert_equal(self.graph.edges(), [("a", "b"), ("a", "c"), ("b", "c")])
+    self.assert_equal(self.graph.successors("a"), ["b", "c"])
+    self.assert_equal(self.graph.predecessors("c"), ["a", "b"])
+    self.assert_equal(self.graph["b"], ["c"])
+    self.assert_equal(self.graph.number_of_edges(), 3)
+    self.assert_true(self.graph.has_edge("a", "b"))
+    self.assert_false(self.graph.has_edge("b", "a"))
+
+  def test_compact(self):
+    self.graph.compact()
+    self.assert_true(self.graph.is_compact())
+    self.assert_equal(self.graph.successors("a"), ["b", "c"])
+    self.assert_equal(self.graph.predecessors("c"), ["a", "b"])
+    self.graph.add_edge("c", "d")
+    self.assert_false(self.graph.is_compact())
+    self.assert_equal(self.graph.edges(), [("a", "b"), ("a", "c"), ("b", "c"),
+                                           ("c", "d")])
+
+  def test_remove(self):
+    self.graph.remove_edge("a", "c")
+    self.assert_equal(self.graph.successors("a"), ["b"])
+    self.graph.remove_node("b")
+    self.assert_equal(self.graph.nodes(), ["a", "c"])
+    self.assert_equal(self.graph.number_of_edges(), 0)
+    self.assert_equal(self.graph.predecessors("c"), [])
+    self.assert_raises(KeyError, self.graph.successors, "b")
+
+  def test_subgraph(self):
+    subgraph = self.graph.subgraph(["a", "c", "x"])
+    self.assert_equal(subgraph.nodes(), ["a", "c"])
+    self.assert_equal(subgraph.edges(), [("a", "c")])
+
+class AddressTest(unittest.TestCase):
+
+  def test_interning(self):
+    build = buildfile.BuildFile("/root", "pkg/BUILD", must_exist=False)
+    address = buildfile.Address(build, "target")
+    self.assert_true(buildfile.Address(build, "target") is address)
+    self.assert_true(pickle.loads(pickle.dumps(address, 2)) is address)
+    self.assert_not_equal(buildfile.Address(build, "another"), address)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,32 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# This file is generated by `python -m bb.tools.b3.registry`. Do not edit.
+
+PRIMITIVES = {
+  'binary': 'bb.tools.b3.rules.binary',
+  'binary_factory': 'bb.tools.b3.rules.binary',
+  'cc_binary': 'bb.tools.b3.rules.cc',
+  'cc_binary_factory': 'bb.tools.b3.rules.cc',
+  'cc_library': 'bb.tools.b3.rules.cc',
+  'cc_library_factory': 'bb.tools.b3.rules.cc',
+  'fileset': 'bb.tools.b3.rules.fileset',
+  'fileset_factory': 'bb.tools.b3.rules.fileset',
+  'java_library': 'bb.tools.b3.rules.java_library',
+  'java_library_factory': 'bb.tools.b3.rules.java_library',
+  'library': 'bb.tools.b3.rules.library',
+  'library_factory': 'bb.tools.b3.rules.library',
+  'propeller_binary': 'bb.tools.b3.rules.propeller',
+  'propeller_binary_factory': 'bb.tools.b3.rules.propeller',
+  'propeller_load': 'bb.tools.b3.rules.propeller',
+  'propeller_load_factory': 'bb.tools.b3.rules.propeller',
+}
+
+COMMANDS = {
+  'build': ('bb.tools.b3.commands.build', 'Build'),
+  'cache': ('bb.tools.b3.commands.cache', 'Cache'),
+  'init': ('bb.tools.b3.commands.init', 'Init'),
+  'query': ('bb.tools.b3.commands.query', 'Query'),
+  'server': ('bb.tools.b3.commands.server', 'Server'),
+  'tune': ('bb.tools.b3.commands.tune', 'Tune'),
+}
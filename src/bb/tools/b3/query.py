@@ -0,0 +1,302 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""Queries over the rule graph. A query is an expression that evaluates to a
+set of rules::
+
+  deps(:app)                  # :app and all the rules it depends on
+  deps(:app, 1)               # :app and its direct dependencies
+  rdeps(src/lib:lib)          # src/lib:lib and all the rules that depend on it
+  somepath(:app, src/lib:lib) # some path from :app to src/lib:lib
+  allpaths(:app, src/lib:lib) # all the rules on paths between them
+  kind(cc_binary, rdeps(src/lib:lib))
+
+Set operators ``+`` (``union``), ``-`` (``except``) and ``^`` (``intersect``)
+are left-associative and have the same precedence, parentheses can be used
+for grouping. Operators ``+`` and ``-`` have to be separated by spaces, since
+both can be a part of a target name. Targets are written as for ``b3 build``.
+
+The pattern of ``kind()`` is a regular expression searched in the rule kind,
+the name of the primitive that creates the rule (e.g. ``cc_binary``).
+
+Queries are answered by :class:`QueryIndex` built once over the dependency
+graph: the reachability index of the graph for dependencies, the same kind of
+index over the reversed graph for reverse dependencies, and a map of rules by
+kind.
+"""
+
+import collections
+import re
+
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import reachability
+
+class QueryError(Exception):
+  """Indicates a syntax error or an unknown target in a query."""
+
+def get_kind(rule):
+  """Returns the kind of `rule`, e.g. ``cc_binary``."""
+  return buildfile.rule.gen_primitive_name(type(rule))
+
+def get_label(rule):
+  return repr(rule.get_address())
+
+class _ReversedGraph(object):
+  """Presents `graph` with edges reversed."""
+
+  def __init__(self, graph):
+    self._graph = graph
+
+  def nodes(self):
+    return self._graph.nodes()
+
+  def successors(self, node):
+    return self._graph.predecessors(node)
+
+class QueryIndex(object):
+  """Forward and reverse indexes over `graph` (the dependency graph by
+  default) used to evaluate queries.
+  """
+
+  def __init__(self, graph=None):
+    self._graph = graph if graph is not None else buildfile.dependency_graph
+    self._reverse = reachability.ReachabilityIndex(_ReversedGraph(self._graph))
+    self._kinds = collections.defaultdict(set)
+    self._rules = set()
+    for node in self._graph.nodes():
+      if isinstance(node, buildfile.Fork):
+        continue
+      self._rules.add(node)
+      self._kinds[get_kind(node)].add(node)
+
+  def get_rules(self):
+    """Returns a set of all the rules."""
+    return set(self._rules)
+
+  def get_kinds(self):
+    return self._kinds.keys()
+
+  def _filter(self, nodes):
+    return set([node for node in nodes if node in self._rules])
+
+  def _walk(self, rules, next_nodes, depth):
+    result = set(rules)
+    frontier = list(rules)
+    for _ in range(depth):
+      following = []
+      for node in frontier:
+        for child in next_nodes(node):
+          if child not in result:
+            result.add(child)
+            following.append(child)
+      frontier = following
+    return result
+
+  def deps(self, rules, depth=None):
+    """Returns `rules` and all the rules they depend on, up to `depth` edges
+    away if `depth` is provided.
+    """
+    if depth is not None:
+      return self._filter(self._walk(rules, self._graph.successors, depth))
+    result = set()
+    for rule in rules:
+      result.update(self._graph.get_closure(rule))
+    return self._filter(result)
+
+  def rdeps(self, rules, depth=None):
+    """Returns `rules` and all the rules that depend on them, up to `depth`
+    edges away if `depth` is provided.
+    """
+    if depth is not None:
+      return self._filter(self._walk(rules, self._graph.predecessors, depth))
+    result = set()
+    for rule in rules:
+      result.update(self._reverse.get_closure(rule))
+    return self._filter(result)
+
+  def allpaths(self, sources, targets):
+    """Returns all the rules on paths from `sources` to `targets`."""
+    return self.deps(sources) & self.rdeps(targets)
+
+  def somepath(self, sources, targets):
+    """Returns a list of rules on some path from one of `sources` to one of
+    `targets`, or an empty list if there is no such path.
+    """
+    targets = set(targets)
+    for source in sorted(sources, key=get_label):
+      if not self._graph.get_closure(source) & targets:
+        continue
+      parents = {source: None}
+      queue = collections.deque([source])
+      while queue:
+        node = queue.popleft()
+        if node in targets:
+          path = []
+          while node is not None:
+            path.append(node)
+            node = parents[node]
+          return list(reversed(path))
+        for child in self._graph.successors(node):
+          if child not in parents:
+            parents[child] = node
+            queue.append(child)
+    return []
+
+  def kind(self, pattern, rules):
+    """Returns rules of `rules`, which kind matches `pattern`."""
+    try:
+      regexp = re.compile(pattern)
+    except re.error, e:
+      raise QueryError("Invalid kind pattern %s: %s" % (pattern, e))
+    result = set()
+    for kind, kind_rules in self._kinds.items():
+      if regexp.search(kind):
+        result.update(kind_rules)
+    return result & set(rules)
+
+class Query(object):
+  """Parses and evaluates `expression` with `index`. Words that are not
+  functions or operators are resolved to rules by `resolve_target(word)`,
+  which returns a list of rules.
+  """
+
+  FUNCTIONS = ("deps", "rdeps", "somepath", "allpaths", "kind")
+  OPERATORS = {"+": "union", "union": "union",
+               "-": "except", "except": "except",
+               "^": "intersect", "intersect": "intersect"}
+
+  _TOKEN_REGEXP = re.compile(r"\s*(\(|\)|,|\^|[^\s(),^]+)")
+
+  def __init__(self, expression, index, resolve_target):
+    self._expression = expression
+    self._index = index
+    self._resolve_target = resolve_target
+    self._tokens = self._tokenize(expression)
+    self._pos = 0
+    # True if the result is a path and has to keep its order.
+    self.ordered = False
+
+  def _tokenize(self, expression):
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression):
+      match = self._TOKEN_REGEXP.match(expression, pos)
+      if not match:
+        raise QueryError("Unexpected character at %d: %s" %
+                         (pos, expression[pos:]))
+      tokens.append(match.group(1))
+      pos = match.end()
+    return tokens
+
+  def _peek(self):
+    if self._pos < len(self._tokens):
+      return self._tokens[self._pos]
+    return None
+
+  def _next(self):
+    token = self._peek()
+    if token is None:
+      raise QueryError("Unexpected end of query: %s" % self._expression)
+    self._pos += 1
+    return token
+
+  def _expect(self, expected):
+    token = self._next()
+    if token != expected:
+      raise QueryError("Expected '%s', got '%s' in query: %s" %
+                       (expected, token, self._expression))
+
+  def evaluate(self):
+    """Returns a list of rules, sorted by label unless the result is a
+    path.
+    """
+    result = self._parse_expression()
+    if self._peek() is not None:
+      raise QueryError("Unexpected '%s' in query: %s" %
+                       (self._peek(), self._expression))
+    if self.ordered and isinstance(result, list):
+      return result
+    return sorted(result, key=get_label)
+
+  def _parse_expression(self):
+    result = self._parse_term()
+    while self._peek() in self.OPERATORS:
+      operator = self.OPERATORS[self._next()]
+      operand = set(self._parse_term())
+      self.ordered = False
+      if operator == "union":
+        result = set(result) | operand
+      elif operator == "except":
+        result = set(result) - operand
+      else:
+        result = set(result) & operand
+    return result
+
+  def _parse_int(self):
+    token = self._next()
+    try:
+      return int(token)
+    except ValueError:
+      raise QueryError("Expected a number, got '%s' in query: %s" %
+                       (token, self._expression))
+
+  def _parse_term(self):
+    token = self._next()
+    if token == "(":
+      result = self._parse_expression()
+      self._expect(")")
+      return result
+    if token in self.FUNCTIONS and self._peek() == "(":
+      self._next()
+      result = getattr(self, "_eval_" + token)()
+      self._expect(")")
+      return result
+    if token in ("(", ")", ",") or token in self.OPERATORS:
+      raise QueryError("Unexpected '%s' in query: %s" %
+                       (token, self._expression))
+    self.ordered = False
+    return set(self._resolve_target(token))
+
+  def _parse_depth(self):
+    if self._peek() == ",":
+      self._next()
+      return self._parse_int()
+    return None
+
+  def _eval_deps(self):
+    rules = self._parse_expression()
+    self.ordered = False
+    return self._index.deps(rules, self._parse_depth())
+
+  def _eval_rdeps(self):
+    rules = self._parse_expression()
+    self.ordered = False
+    return self._index.rdeps(rules, self._parse_depth())
+
+  def _parse_pair(self):
+    sources = self._parse_expression()
+    self._expect(",")
+    targets = self._parse_expression()
+    return sources, targets
+
+  def _eval_somepath(self):
+    sources, targets = self._parse_pair()
+    self.ordered = True
+    return self._index.somepath(sources, targets)
+
+  def _eval_allpaths(self):
+    sources, targets = self._parse_pair()
+    self.ordered = False
+    return self._index.allpaths(sources, targets)
+
+  def _eval_kind(self):
+    pattern = self._next()
+    self._expect(",")
+    rules = self._parse_expression()
+    self.ordered = False
+    return self._index.kind(pattern, rules)
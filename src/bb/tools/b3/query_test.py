@@ -0,0 +1,67 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import query
+from bb.tools.b3.rules import cc
+
+class QueryTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    with open(os.path.join(self.dir, "BUILD"), "w") as handle:
+      handle.write('cc_library(name="lib", srcs=[])\n'
+                   'cc_library(name="util", srcs=[], deps=[":lib"])\n'
+                   'cc_binary(name="app", srcs=[], deps=[":util"])\n'
+                   'cc_binary(name="tool", srcs=[], deps=[":lib"])\n')
+    buildfile.reset()
+    self.build = buildfile.BuildFile(self.dir, ".")
+    buildfile.Context(self.build).parse()
+    self.index = query.QueryIndex()
+
+  def teardown(self):
+    buildfile.reset()
+
+  def resolve_target(self, target):
+    rule = buildfile.get_rule(buildfile.Address(self.build, target))
+    if not rule:
+      raise query.QueryError(target)
+    return [rule]
+
+  def evaluate(self, expression):
+    rules = query.Query(expression, self.index, self.resolve_target).evaluate()
+    return [rule.get_address().target for rule in rules]
+
+  def test_deps(self):
+    self.assert_equal(self.evaluate("deps(app)"), ["app", "lib", "util"])
+    self.assert_equal(self.evaluate("deps(app, 1)"), ["app", "util"])
+    self.assert_equal(self.evaluate("rdeps(lib)"),
+                      ["app", "lib", "tool", "util"])
+    self.assert_equal(self.evaluate("rdeps(lib, 1)"), ["lib", "tool", "util"])
+
+  def test_paths(self):
+    self.assert_equal(self.evaluate("somepath(app, lib)"),
+                      ["app", "util", "lib"])
+    self.assert_equal(self.evaluate("somepath(tool, util)"), [])
+    self.assert_equal(self.evaluate("allpaths(app + tool, lib)"),
+                      ["app", "lib", "tool", "util"])
+
+  def test_kind_and_operators(self):
+    self.assert_equal(self.evaluate("kind(cc_binary, rdeps(lib))"),
+                      ["app", "tool"])
+    self.assert_equal(self.evaluate("rdeps(lib) - kind(library, rdeps(lib))"),
+                      ["app", "tool"])
+    self.assert_equal(self.evaluate("deps(app) ^ deps(tool)"), ["lib"])
+
+  def test_errors(self):
+    self.assert_raises(query.QueryError, self.evaluate, "deps(app")
+    self.assert_raises(query.QueryError, self.evaluate, "deps(nope)")
+    self.assert_raises(query.QueryError, self.evaluate, "deps(app, x)")
+
+if __name__ == "__main__":
+  unittest.main()
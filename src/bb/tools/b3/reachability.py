@@ -0,0 +1,153 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""Reachability index answers "which rules does this rule depend on" without
+walking the dependency graph on each query.
+
+Each node gets an integer id. The set of nodes reachable from a node is kept as
+a bitset (a Python long), where bit `i` is set if the node with id `i` is
+reachable. Bitsets are computed in one pass over the strongly connected
+components of the graph in reverse topological order, so that the bitset of a
+node is the union of the bitsets of its successors.
+
+The index is kept up-to-date incrementally when nodes and edges are added.
+Removal of a node or an edge invalidates the index, it will be rebuilt on the
+next query.
+"""
+
+class ReachabilityIndex(object):
+  """Reachability index for `graph`. The graph has to provide `nodes()` and
+  `successors(node)` methods.
+  """
+
+  def __init__(self, graph):
+    self._graph = graph
+    self._valid = False
+    self._ids = dict()
+    self._nodes = []
+    self._bits = dict()
+    self._closures = dict()
+
+  def is_valid(self):
+    return self._valid
+
+  def invalidate(self):
+    self._valid = False
+    self._ids.clear()
+    self._nodes = []
+    self._bits.clear()
+    self._closures.clear()
+
+  def _add_id(self, node):
+    self._ids[node] = len(self._nodes)
+    self._nodes.append(node)
+    self._bits[node] = 1 << self._ids[node]
+
+  def add_node(self, node):
+    """Notifies the index that `node` has been added to the graph."""
+    if self._valid and node not in self._ids:
+      self._add_id(node)
+
+  def add_edge(self, src, dst):
+    """Notifies the index that edge `src` -> `dst` has been added to the graph.
+    Every node that reaches `src` now also reaches everything reachable from
+    `dst`.
+    """
+    if not self._valid:
+      return
+    self.add_node(src)
+    self.add_node(dst)
+    reach = self._bits[dst]
+    if self._bits[src] & reach == reach:
+      return
+    src_bit = 1 << self._ids[src]
+    for node, bits in self._bits.iteritems():
+      if bits & src_bit:
+        self._bits[node] = bits | reach
+    self._closures.clear()
+
+  def _build(self):
+    self.invalidate()
+    successors = self._graph.successors
+    nodes = self._graph.nodes()
+    for node in nodes:
+      self._add_id(node)
+    # Iterative Tarjan's algorithm. Components are emitted in reverse
+    # topological order, thus successors from other components are done by the
+    # time the component is emitted.
+    index = dict()
+    lowlink = dict()
+    stack = []
+    on_stack = set()
+    for root in nodes:
+      if root in index:
+        continue
+      index[root] = lowlink[root] = len(index)
+      stack.append(root)
+      on_stack.add(root)
+      work = [(root, iter(successors(root)))]
+      while work:
+        node, children = work[-1]
+        for child in children:
+          if child not in index:
+            index[child] = lowlink[child] = len(index)
+            stack.append(child)
+            on_stack.add(child)
+            work.append((child, iter(successors(child))))
+            break
+          elif child in on_stack:
+            lowlink[node] = min(lowlink[node], index[child])
+        else:
+          work.pop()
+          if work:
+            parent = work[-1][0]
+            lowlink[parent] = min(lowlink[parent], lowlink[node])
+          if lowlink[node] == index[node]:
+            component = []
+            while True:
+              member = stack.pop()
+              on_stack.discard(member)
+              component.append(member)
+              if member is node:
+                break
+            bits = 0
+            for member in component:
+              bits |= self._bits[member]
+              for child in successors(member):
+                bits |= self._bits[child]
+            for member in component:
+              self._bits[member] = bits
+    self._valid = True
+
+  def get_bits(self, node):
+    """Returns the bitset of nodes reachable from `node`."""
+    if not self._valid:
+      self._build()
+    return self._bits[node]
+
+  def get_closure(self, node):
+    """Returns a frozenset of `node` and all the nodes reachable from it."""
+    if not self._valid:
+      self._build()
+    closure = self._closures.get(node, None)
+    if closure is None:
+      # Bit i is the character i of the reversed binary representation.
+      digits = bin(self._bits[node])[:1:-1]
+      nodes = self._nodes
+      members = []
+      i = digits.find("1")
+      while i >= 0:
+        members.append(nodes[i])
+        i = digits.find("1", i + 1)
+      closure = self._closures[node] = frozenset(members)
+    return closure
+
+  def is_reachable(self, src, dst):
+    """Returns ``True`` if `dst` can be reached from `src`."""
+    bits = self.get_bits(src)
+    dst_id = self._ids.get(dst, None)
+    return dst_id is not None and bool(bits >> dst_id & 1)
@@ -0,0 +1,54 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import buildfile
+
+class ReachabilityIndexTest(unittest.TestCase):
+
+  def setup(self):
+    self.graph = buildfile.DependencyGraph()
+
+  def test_closure(self):
+    self.graph.add_edges_from([("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")])
+    self.graph.add_node("e")
+    self.assert_equal(self.graph.get_closure("a"),
+                      frozenset(["a", "b", "c", "d"]))
+    self.assert_equal(self.graph.get_closure("e"), frozenset(["e"]))
+    self.assert_true(self.graph.is_reachable("a", "d"))
+    self.assert_false(self.graph.is_reachable("d", "a"))
+
+  def test_cycle(self):
+    self.graph.add_edges_from([("a", "b"), ("b", "c"), ("c", "b"),
+                               ("c", "d")])
+    self.assert_equal(self.graph.get_closure("c"),
+                      frozenset(["b", "c", "d"]))
+    self.assert_equal(self.graph.get_closure("a"),
+                      frozenset(["a", "b", "c", "d"]))
+
+  def test_update(self):
+    self.graph.add_edges_from([("a", "b"), ("c", "d")])
+    self.assert_equal(self.graph.get_closure("a"), frozenset(["a", "b"]))
+    # Edges that were added after the index was built.
+    self.graph.add_edge("b", "c")
+    self.assert_true(self.graph.get_reachability_index().is_valid())
+    self.assert_equal(self.graph.get_closure("a"),
+                      frozenset(["a", "b", "c", "d"]))
+    self.graph.remove_edge("a", "b")
+    self.assert_equal(self.graph.get_closure("a"), frozenset(["a"]))
+
+  def test_diamonds(self):
+    # Each level doubles the number of paths from the top.
+    levels = 64
+    for i in range(levels):
+      self.graph.add_edge(("top", i), ("left", i))
+      self.graph.add_edge(("top", i), ("right", i))
+      self.graph.add_edge(("left", i), ("top", i + 1))
+      self.graph.add_edge(("right", i), ("top", i + 1))
+    self.assert_equal(len(self.graph.get_closure(("top", 0))),
+                      3 * levels + 1)
+
+if __name__ == "__main__":
+  unittest.main()
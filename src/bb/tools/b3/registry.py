@@ -0,0 +1,145 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The registry knows which module provides each b3 primitive and command
+without importing it. The mapping is kept in the generated
+:mod:`bb.tools.b3.manifest` module, which has to be regenerated once a rule or
+a command has been added, renamed or removed::
+
+  $ python -m bb.tools.b3.registry
+
+Primitives are installed into :mod:`bb.tools.b3.primitives` as
+:class:`LazyPrimitive` proxies. The module of a primitive is imported on the
+first use of the primitive from a BUILD file, and the real rule class (or
+factory) replaces the proxy.
+"""
+
+from __future__ import print_function
+
+import inspect
+import os
+import pkgutil
+import sys
+
+from bb.tools.b3 import manifest
+from bb.tools.b3 import primitives
+
+RULES_PACKAGE = "bb.tools.b3.rules"
+COMMANDS_PACKAGE = "bb.tools.b3.commands"
+
+MANIFEST_HEADER = """\
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# This file is generated by `python -m bb.tools.b3.registry`. Do not edit.
+
+"""
+
+class LazyPrimitive(object):
+  """Stands for primitive `name` until its module has been imported."""
+
+  def __init__(self, name, module):
+    self.name = name
+    self.module = module
+
+  def load(self):
+    """Imports the module of this primitive and returns the primitive."""
+    __import__(self.module)
+    primitive = getattr(primitives, self.name, None)
+    if primitive is None or isinstance(primitive, LazyPrimitive):
+      raise ImportError("Module %s does not provide primitive %s, the manifest"
+                        " has to be regenerated" % (self.module, self.name))
+    return primitive
+
+  def __call__(self, *args, **kwargs):
+    return self.load()(*args, **kwargs)
+
+  def __getattr__(self, name):
+    return getattr(self.load(), name)
+
+  def __repr__(self):
+    return "LazyPrimitive(%s from %s)" % (self.name, self.module)
+
+def install_primitives():
+  """Installs lazy proxies for all the primitives from the manifest that have
+  not been registered yet.
+  """
+  for name, module in manifest.PRIMITIVES.items():
+    if not hasattr(primitives, name):
+      setattr(primitives, name, LazyPrimitive(name, module))
+
+def get_command_names():
+  return manifest.COMMANDS.keys()
+
+def load_command(name):
+  """Imports and returns command class `name`, or ``None`` if there is no such
+  command.
+  """
+  if name not in manifest.COMMANDS:
+    return None
+  module, class_name = manifest.COMMANDS[name]
+  __import__(module)
+  return getattr(sys.modules[module], class_name)
+
+def _iter_modules(package):
+  __import__(package)
+  for _, name, ispkg in pkgutil.iter_modules(sys.modules[package].__path__):
+    if ispkg:
+      continue
+    fq_module = ".".join([package, name])
+    __import__(fq_module)
+    yield sys.modules[fq_module]
+
+def generate_manifest():
+  """Imports all the rules and commands and returns a tuple of primitives and
+  commands mappings.
+  """
+  from bb.tools.b3 import buildfile
+  from bb.tools.b3.commands.command import Command
+  modules = list(_iter_modules(RULES_PACKAGE))
+  modules_by_class = dict()
+  for module in modules:
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+      if cls.__module__ == module.__name__:
+        modules_by_class[cls] = module.__name__
+  rules = dict()
+  for name in dir(primitives):
+    primitive = getattr(primitives, name)
+    if isinstance(primitive, buildfile.RuleClassFactory):
+      primitive = primitive.get_rule_class()
+    if inspect.isclass(primitive) and primitive in modules_by_class:
+      rules[name] = modules_by_class[primitive]
+  commands = dict()
+  for module in _iter_modules(COMMANDS_PACKAGE):
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+      if issubclass(cls, Command) and cls is not Command:
+        commands[cls.__name__.lower()] = (cls.__module__, cls.__name__)
+  return rules, commands
+
+def _format_dict(name, d):
+  lines = ["%s = {" % name]
+  for key in sorted(d.keys()):
+    lines.append("  %r: %r," % (key, d[key]))
+  lines.append("}")
+  return "\n".join(lines) + "\n"
+
+def write_manifest(path=None):
+  """Generates the manifest and writes it to `path` (the source file of
+  :mod:`bb.tools.b3.manifest` by default). Returns the path.
+  """
+  if not path:
+    path = os.path.splitext(manifest.__file__)[0] + ".py"
+  rules, commands = generate_manifest()
+  with open(path, "w") as handle:
+    handle.write(MANIFEST_HEADER)
+    handle.write(_format_dict("PRIMITIVES", rules))
+    handle.write("\n")
+    handle.write(_format_dict("COMMANDS", commands))
+  return path
+
+if __name__ == "__main__":
+  print("Manifest %s has been generated" % write_manifest())
@@ -0,0 +1,41 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+import subprocess
+import sys
+
+import bb
+from bb.utils.testing import unittest
+from bb.tools.b3 import manifest
+from bb.tools.b3 import registry
+
+class RegistryTest(unittest.TestCase):
+
+  def test_manifest_is_up_to_date(self):
+    self.assert_equal(registry.generate_manifest(),
+                      (manifest.PRIMITIVES, manifest.COMMANDS))
+
+  def test_lazy_primitive(self):
+    from bb.tools.b3.rules.fileset import Fileset
+    primitive = registry.LazyPrimitive("fileset", "bb.tools.b3.rules.fileset")
+    self.assert_true(primitive.load() is Fileset)
+
+  def test_engine_does_not_import_rules(self):
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(bb.__file__)))
+    script = ("import sys\n"
+              "from bb.tools.b3 import engine\n"
+              "engine.register_rules()\n"
+              "print(sorted(name for name in sys.modules\n"
+              "            if name.startswith(('bb.tools.compilers',\n"
+              "                                'bb.tools.loaders',\n"
+              "                                'bb.tools.b3.rules.',\n"
+              "                                'networkx'))))\n")
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    output = subprocess.check_output([sys.executable, "-c", script], env=env)
+    self.assert_equal(output.strip(), "[]")
+
+if __name__ == "__main__":
+  unittest.main()
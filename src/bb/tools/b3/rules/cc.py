@@ -11,11 +11,11 @@ from __future__ import print_function
 
 import sys
 
-from bb.tools.b3 import buildfile
 from bb.tools.b3.rules.binary import Binary
 from bb.tools.b3.rules.library import Library
 from bb.tools.b3.rules.fileset import Fileset
 from bb.tools.compilers import GCC
+from bb.utils import path_utils
 from bb.utils import typecheck
 from bb.utils import logging
 
@@ -25,13 +25,20 @@ class CCLikeRule(object):
 
   properties = (("programming_language", "c"),)
 
-  def __init__(self, includes=[], copts=[]):
+  def __init__(self, includes=[], copts=[], pch=False, unity=False,
+               batch=False):
     self._includes = []
     self._copts = []
+    self._pch = False
+    self._unity = False
+    self._batch = False
     if includes:
       self.set_includes(includes)
     if copts:
       self.set_copts(copts)
+    self.set_pch(pch)
+    self.set_unity(unity)
+    self.set_batch(batch)
 
   def set_includes(self, includes):
     if not typecheck.is_list(includes):
@@ -49,12 +56,60 @@ class CCLikeRule(object):
   def get_copts(self):
     return self._copts
 
+  def set_pch(self, pch):
+    """Enables or disables precompiled headers, see
+    :mod:`bb.tools.compilers.pch`.
+    """
+    if not typecheck.is_boolean(pch):
+      raise TypeError("pch has to be a bool: %s" % pch)
+    self._pch = pch
+
+  def get_pch(self):
+    return self._pch
+
+  def set_unity(self, unity):
+    """Enables or disables unity build, see
+    :mod:`bb.tools.compilers.unity`. `unity` is either a bool or the number of
+    sources per group, the number is picked adaptively if `unity` is
+    ``True``.
+    """
+    if not typecheck.is_boolean(unity) and \
+          not (typecheck.is_int(unity) and unity > 0):
+      raise TypeError("unity has to be a bool or a positive int: %s" % unity)
+    self._unity = unity
+
+  def get_unity(self):
+    return self._unity
+
+  def set_batch(self, batch):
+    """Enables or disables batched compilation, see
+    :mod:`bb.tools.compilers.batch`. `batch` is either a bool or the number of
+    sources per compiler invocation, the number is picked adaptively if
+    `batch` is ``True``.
+    """
+    if not typecheck.is_boolean(batch) and \
+          not (typecheck.is_int(batch) and batch > 0):
+      raise TypeError("batch has to be a bool or a positive int: %s" % batch)
+    self._batch = batch
+
+  def get_batch(self):
+    return self._batch
+
+  def get_fingerprint_data(self):
+    return [("includes", self.get_includes()), ("copts", self.get_copts()),
+            ("pch", self.get_pch()), ("unity", self.get_unity()),
+            ("batch", self.get_batch())]
+
 class CCLibrary(Library, CCLikeRule):
 
   def __init__(self, target=None, name=None, srcs=[], deps=[], **kwargs):
     Library.__init__(self, target=target, name=name, srcs=srcs, deps=deps)
     CCLikeRule.__init__(self, **kwargs)
 
+  def get_fingerprint_data(self):
+    return Library.get_fingerprint_data(self) + \
+        CCLikeRule.get_fingerprint_data(self)
+
 class CCBinary(Binary, CCLikeRule):
 
   is_language_dependent = True
@@ -68,27 +123,90 @@ class CCBinary(Binary, CCLikeRule):
                     compiler_class=compiler_class)
     CCLikeRule.__init__(self, **kwargs)
 
+  def get_output_filename(self):
+    return path_utils.abspath(self.get_name())
+
+  def get_outputs(self):
+    return [self.get_output_filename()]
+
+  def get_libraries(self):
+    """Returns CC libraries the binary depends on directly."""
+    return [dep for dep in self.get_dependencies()
+            if isinstance(dep, CCLibrary)]
+
+  def get_fingerprint_data(self):
+    # The compiler is configured by execute(), thus the fingerprint is taken
+    # from a fresh compiler of the same class, so that it does not depend on
+    # whether the rule was already executed by this process (see b3 server).
+    # Attributes of the libraries are a part of their own fingerprints.
+    return Binary.get_fingerprint_data(self) + \
+        CCLikeRule.get_fingerprint_data(self) + \
+        [("compiler", self.compiler.__class__().get_fingerprint_data()),
+         ("build_dir", self.get_build_dir())]
+
+  def get_discovered_inputs(self):
+    """Returns sources and headers the binary has been compiled from."""
+    return self.compiler.get_dependencies()
+
   def execute(self):
     print("Build cc binary '%s' with '%s'" %
           (self.get_name(), self.compiler.__class__.__name__))
-    buildfile.dependency_graph.resolve_forks()
-    # NOTE: this has to be fixed
-    self.compiler.add_include_dir(self.get_build_dir())
-    for src in self.get_sources():
-      if typecheck.is_string(src):
-        self.compiler.add_file(src)
-      elif isinstance(src, Fileset):
-        self.compiler.add_files(src.get_sources())
-    for dep in self.get_dependencies():
-      if isinstance(dep, CCLibrary):
-        self.compiler.add_files(dep.get_sources())
-        self.compiler.add_include_dirs(dep.get_includes())
-    if not self.compiler.get_files():
-      print("No source files", file=sys.stderr)
-      exit(0)
-    self.compiler.add_include_dirs(self.get_includes())
-    self.compiler.set_output_filename(self.get_name())
+    if not self._setup_compiler():
+      return
+    self.compiler.set_output_filename(self.get_output_filename())
     try:
       self.compiler.compile()
     except Exception, e:
       logger.error(e)
+      raise
+
+  def _setup_compiler(self):
+    """Passes sources and options to the compiler. Returns ``False`` if there
+    is nothing to compile.
+    """
+    # Each execution starts with a fresh compiler, options and dependencies of
+    # the previous one are not carried over.
+    self.compiler = self.compiler.__class__()
+    # Each binary gets its own object directory, so that binaries sharing the
+    # same sources can be built at the same time.
+    return self.configure_compiler(
+      self.compiler, path_utils.join(self.get_build_dir(), self.get_name()))
+
+  def configure_compiler(self, compiler, output_dir, copts={}):
+    """Passes sources and options of the binary and its libraries to
+    `compiler`, that keeps objects in `output_dir`. Copts of the binary and
+    each library apply to their own sources only; `copts` maps the binary or
+    its libraries to copts that replace their own ones (see ``b3 tune``).
+    Returns ``False`` if there is nothing to compile.
+    """
+    compiler.add_include_dir(self.get_build_dir())
+    compiler.set_output_dir(output_dir)
+    def add_files(rule, sources):
+      options = copts.get(rule, rule.get_copts())
+      for src in sources:
+        path = compiler.add_file(src)
+        if typecheck.is_string(path):
+          compiler.set_source_options(path, options)
+    for src in self.get_sources():
+      if typecheck.is_string(src):
+        add_files(self, [src])
+      elif isinstance(src, Fileset):
+        add_files(self, src.get_sources())
+    for library in self.get_libraries():
+      add_files(library, library.get_sources())
+      compiler.add_include_dirs(library.get_includes())
+    if not compiler.get_files():
+      print("No source files", file=sys.stderr)
+      return False
+    compiler.add_include_dirs(self.get_includes())
+    if self.get_pch():
+      compiler.enable_precompiled_headers()
+    if self.get_unity() is True:
+      compiler.enable_unity_build()
+    elif self.get_unity():
+      compiler.enable_unity_build(self.get_unity())
+    if self.get_batch() is True:
+      compiler.enable_batch_compile()
+    elif self.get_batch():
+      compiler.enable_batch_compile(self.get_batch())
+    return True
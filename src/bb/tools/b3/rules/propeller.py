@@ -5,21 +5,174 @@
 #
 # Author: Oleksandr Sviridenko <info@bionicbunny.org>
 
+from __future__ import print_function
+
+import json
+
 from bb.tools.b3.buildfile import Rule
 from bb.tools.b3.rules.cc import CCBinary
 from bb.tools.compilers import PropGCC
+from bb.tools.compilers import memory_models
 from bb.tools.loaders import propler
+from bb.utils import logging
 from bb.utils import path_utils
 from bb.utils import typecheck
 
+logger = logging.get_logger("bb")
+
+# Memory model of PropellerBinary that selects a model per thread.
+AUTO_MEMORY_MODEL = "auto"
+
 class PropellerBinary(CCBinary):
+  """Propeller binary. With `memory_model` set to ``auto`` the memory model
+  of the program is selected from an advisory launch plan of threads of
+  mappings from `srcs`, see :mod:`bb.tools.compilers.memory_models`: the
+  program is compiled in the fastest model in which the code of the runners
+  fits into hub memory, and hot threads (with high `thread_weights`) are
+  spread over cogs first. The launch plan is written next to the binary
+  (``<name>.plan.json``) with hub usage of the built image.
+  """
 
   def __init__(self, target=None, name=None, srcs=[], deps=[],
-               compiler_class=None):
+               compiler_class=None, memory_model=None, thread_weights={},
+               **kwargs):
     if not compiler_class:
       compiler_class = PropGCC
+    # Mappings are expanded by add_source(), that is called by the base
+    # class.
+    self._mappings = []
     CCBinary.__init__(self, target=target, name=name, srcs=srcs, deps=deps,
-                      compiler_class=compiler_class)
+                      compiler_class=compiler_class, **kwargs)
+    self._memory_model = None
+    self._thread_weights = dict()
+    self._launch_plan = None
+    if memory_model:
+      self.set_memory_model(memory_model)
+    if thread_weights:
+      self.set_thread_weights(thread_weights)
+
+  def set_memory_model(self, model):
+    """Sets the memory model of the binary: one of
+    :const:`~bb.tools.compilers.memory_models.MODELS` or ``auto``.
+    """
+    if not typecheck.is_string(model) or model.lower() not in \
+          memory_models.MODELS + (AUTO_MEMORY_MODEL,):
+      raise TypeError("memory_model has to be one of %s: %s" %
+                      (", ".join(memory_models.MODELS + (AUTO_MEMORY_MODEL,)),
+                       model))
+    self._memory_model = model.lower()
+
+  def get_memory_model(self):
+    return self._memory_model
+
+  def set_thread_weights(self, weights):
+    """Sets weights of threads by names, the higher the weight the hotter the
+    thread. The default weight is 1.
+    """
+    if not typecheck.is_dict(weights):
+      raise TypeError("thread_weights has to be a dict: %s" % weights)
+    for name, weight in weights.items():
+      if not typecheck.is_number(weight) or weight <= 0:
+        raise TypeError("Weight of thread %s has to be a positive number: %s"
+                        % (name, weight))
+    self._thread_weights = dict(weights)
+
+  def get_thread_weights(self):
+    return self._thread_weights
+
+  def add_source(self, source):
+    if hasattr(source, "get_threads") and source not in self._mappings:
+      self._mappings.append(source)
+    return CCBinary.add_source(self, source)
+
+  def get_threads(self):
+    """Returns threads of mappings from the sources."""
+    threads = []
+    # A mapping, its OS and kernels share the threads.
+    for mapping in self._mappings:
+      threads.extend([thread for thread in mapping.get_threads()
+                      if thread not in threads])
+    return threads
+
+  def get_plan_filename(self):
+    return self.get_output_filename() + ".plan.json"
+
+  def get_outputs(self):
+    outputs = CCBinary.get_outputs(self)
+    if self.get_memory_model() == AUTO_MEMORY_MODEL:
+      outputs.append(self.get_plan_filename())
+    return outputs
+
+  def get_fingerprint_data(self):
+    return CCBinary.get_fingerprint_data(self) + \
+        [("memory_model", self.get_memory_model()),
+         ("thread_weights", sorted(self.get_thread_weights().items()))]
+
+  def execute(self):
+    CCBinary.execute(self)
+    if self._launch_plan and not self.compiler.is_dry_run_mode_enabled() \
+          and path_utils.exists(self.get_output_filename()):
+      self._launch_plan.set_image_size(
+        memory_models.get_image_size(self.get_output_filename()))
+      self._write_launch_plan()
+      logger.info(self._launch_plan.format_report())
+
+  def _write_launch_plan(self):
+    with open(self.get_plan_filename(), "w") as handle:
+      json.dump(self._launch_plan.to_dict(), handle, indent=2,
+                sort_keys=True)
+
+  def _setup_compiler(self):
+    if not CCBinary._setup_compiler(self):
+      return False
+    if self.get_memory_model() == AUTO_MEMORY_MODEL:
+      self._select_memory_models()
+    return True
+
+  def configure_compiler(self, compiler, output_dir, copts={}):
+    """See :func:`CCBinary.configure_compiler`. With ``auto`` memory model
+    the model of the last launch plan is used, if any.
+    """
+    if not CCBinary.configure_compiler(self, compiler, output_dir, copts):
+      return False
+    model = self.get_memory_model()
+    if model == AUTO_MEMORY_MODEL:
+      model = None
+      if path_utils.exists(self.get_plan_filename()):
+        with open(self.get_plan_filename()) as handle:
+          model = json.load(handle).get("model")
+    if model:
+      compiler.set_memory_model(str(model))
+    return True
+
+  def _select_memory_models(self):
+    """Measures runners of the threads under each model that can be selected
+    for the program, selects the model and writes the advisory launch plan.
+    Hub usage of the plan is estimated until the image is built.
+    """
+    if not isinstance(self.compiler, PropGCC):
+      raise TypeError("Memory model selection requires PropGCC: %s" %
+                      self.compiler.__class__.__name__)
+    threads = self.get_threads()
+    sources = memory_models.find_runner_sources(
+      [thread.get_runner() for thread in threads if thread.get_runner()],
+      self.compiler.get_files())
+    output_dir = path_utils.join(self.get_build_dir(), self.get_name(),
+                                 "memory_models")
+    sizes = dict()
+    profiles = []
+    for thread in threads:
+      src = sources.get(thread.get_runner())
+      if src and src not in sizes:
+        sizes[src] = self.compiler.measure_code_sizes(
+          src, output_dir, memory_models.PROGRAM_MODELS)
+      profiles.append(memory_models.ThreadProfile(
+          thread.get_name(), thread.get_runner(),
+          self._thread_weights.get(thread.get_name(), 1), src,
+          sizes.get(src)))
+    self._launch_plan = memory_models.plan(profiles)
+    self.compiler.set_memory_model(self._launch_plan.get_model())
+    self._write_launch_plan()
 
 class PropellerLoad(Rule):
 
@@ -0,0 +1,198 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The scheduler executes rules of the dependency graph in topological order,
+so that each rule is executed only once all its dependencies were executed.
+Independent rules can be executed concurrently::
+
+  scheduler = Scheduler(jobs=4)
+  scheduler.run([rule1, rule2])
+
+Edges of the dependency graph point from a rule to its dependency, thus a rule
+becomes ready once all its successors within the requested closure are done.
+"""
+
+import collections
+import threading
+import traceback
+import Queue
+
+from bb.tools.b3 import actions
+from bb.tools.b3 import buildfile
+from bb.utils import logging
+from bb.utils import typecheck
+
+logger = logging.get_logger("bb")
+
+# Py2.x Queue.get() without timeout cannot be interrupted by KeyboardInterrupt.
+_QUEUE_TIMEOUT = 24 * 60 * 60
+
+class BuildError(Exception):
+  """Indicates that one or more rules have failed to execute."""
+
+  def __init__(self, message, failures=None):
+    Exception.__init__(self, message)
+    # A list of (rule, formatted traceback) pairs.
+    self.failures = failures or []
+
+class Scheduler(object):
+  """Executes a set of rules and all their dependencies.
+
+  `jobs` defines the maximum number of rules that can be executed at the same
+  time. If `keep_going` is ``True``, the scheduler continues to execute rules
+  that do not depend on a failed rule. Rules are executed through the action
+  table, thus rules that are up-to-date are skipped.
+  """
+
+  def __init__(self, graph=None, jobs=1, keep_going=False, action_table=None):
+    if not typecheck.is_int(jobs) or jobs < 1:
+      raise TypeError("'jobs' has to be a positive integer: %s" % jobs)
+    self._graph = graph if graph is not None else buildfile.dependency_graph
+    self._jobs = jobs
+    self._keep_going = keep_going
+    self._action_table = action_table
+
+  def get_jobs(self):
+    return self._jobs
+
+  def get_closure(self, rules):
+    """Returns a set of the given rules and all rules they depend on."""
+    closure = set()
+    for rule in rules:
+      closure.update(self._graph.get_closure(rule))
+    return closure
+
+  def _prepare(self, rules):
+    closure = self.get_closure(rules)
+    waiting_for = dict()
+    dependents = collections.defaultdict(set)
+    for rule in closure:
+      deps = set(self._graph.successors(rule)) & closure
+      waiting_for[rule] = deps
+      for dep in deps:
+        dependents[dep].add(rule)
+    return waiting_for, dependents
+
+  def get_execution_order(self, rules):
+    """Returns a list of rules sorted so that each rule follows all its
+    dependencies. Raises :class:`BuildError` if a cycle has been found.
+    """
+    waiting_for, dependents = self._prepare(rules)
+    ready = sorted([rule for rule, deps in waiting_for.items() if not deps],
+                   key=repr)
+    order = []
+    while ready:
+      rule = ready.pop(0)
+      order.append(rule)
+      for dependent in sorted(dependents[rule], key=repr):
+        waiting_for[dependent].discard(rule)
+        if not waiting_for[dependent]:
+          ready.append(dependent)
+    if len(order) != len(waiting_for):
+      cycle = [rule for rule, deps in waiting_for.items() if deps]
+      raise BuildError("Dependency cycle between rules: %s" %
+                       ", ".join(sorted(map(repr, cycle))))
+    return order
+
+  def get_action_table(self):
+    return self._action_table or actions.get_action_table()
+
+  def execute_rule(self, rule):
+    logger.debug("Execute %s" % rule)
+    self.get_action_table().execute(rule)
+
+  def run(self, rules):
+    """Executes the given rules and their dependencies. Raises
+    :class:`BuildError` if some rule has failed.
+    """
+    self._graph.resolve_forks()
+    # Pack adjacency lists, rules mostly read the graph from now on.
+    self._graph.compact()
+    # Validate the graph before executing anything.
+    self.get_execution_order(rules)
+    waiting_for, dependents = self._prepare(rules)
+    ready = collections.deque(
+      sorted([rule for rule, deps in waiting_for.items() if not deps],
+             key=repr))
+    failures = []
+    skipped = set()
+    done = set()
+    running = set()
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    workers = []
+
+    def work():
+      while True:
+        rule = tasks.get()
+        if rule is None:
+          return
+        try:
+          self.execute_rule(rule)
+          results.put((rule, None))
+        except:
+          results.put((rule, traceback.format_exc()))
+
+    def skip_dependents(rule):
+      stack = list(dependents[rule])
+      while stack:
+        dependent = stack.pop()
+        if dependent in skipped:
+          continue
+        skipped.add(dependent)
+        stack.extend(dependents[dependent])
+
+    def on_result(rule, error):
+      running.discard(rule)
+      done.add(rule)
+      if error:
+        logger.error("%s failed:\n%s" % (rule, error))
+        failures.append((rule, error))
+        skip_dependents(rule)
+        return
+      for dependent in sorted(dependents[rule], key=repr):
+        waiting_for[dependent].discard(rule)
+        if not waiting_for[dependent] and dependent not in skipped:
+          ready.append(dependent)
+
+    try:
+      if self._jobs > 1:
+        for _ in range(min(self._jobs, len(waiting_for))):
+          worker = threading.Thread(target=work)
+          worker.daemon = True
+          worker.start()
+          workers.append(worker)
+      while ready or running:
+        while ready and len(running) < self._jobs:
+          if failures and not self._keep_going:
+            ready.clear()
+            break
+          rule = ready.popleft()
+          if rule in skipped:
+            continue
+          if not workers:
+            try:
+              self.execute_rule(rule)
+              on_result(rule, None)
+            except KeyboardInterrupt:
+              raise
+            except:
+              on_result(rule, traceback.format_exc())
+            continue
+          running.add(rule)
+          tasks.put(rule)
+        if running:
+          on_result(*results.get(True, _QUEUE_TIMEOUT))
+    finally:
+      for _ in workers:
+        tasks.put(None)
+    if failures:
+      raise BuildError("%d rule(s) failed to build: %s" %
+                       (len(failures),
+                        ", ".join([repr(rule) for rule, _ in failures])),
+                       failures)
+    return done
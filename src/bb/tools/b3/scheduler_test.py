@@ -0,0 +1,102 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import actions
+from bb.tools.b3 import buildfile
+from bb.tools.b3 import scheduler
+
+class FakeRule(object):
+
+  def __init__(self, name, log, graph, fail=False):
+    self.name = name
+    self.log = log
+    self.graph = graph
+    self.fail = fail
+
+  def get_address(self):
+    return self.name
+
+  def get_dependencies(self):
+    return self.graph.successors(self)
+
+  def get_outputs(self):
+    return []
+
+  def get_discovered_inputs(self):
+    return []
+
+  def execute(self):
+    if self.fail:
+      raise Exception("%s failed" % self.name)
+    self.log.append(self.name)
+
+  def __repr__(self):
+    return self.name
+
+class SchedulerTest(unittest.TestCase):
+
+  def setup(self):
+    self.log = []
+    self.graph = buildfile.DependencyGraph()
+
+  def rule(self, name, deps=[], fail=False):
+    rule = FakeRule(name, self.log, self.graph, fail)
+    self.graph.add_node(rule)
+    for dep in deps:
+      self.graph.add_edge(rule, dep)
+    return rule
+
+  def test_execution_order(self):
+    a = self.rule("a")
+    b = self.rule("b", [a])
+    c = self.rule("c", [a])
+    d = self.rule("d", [b, c])
+    order = scheduler.Scheduler(self.graph).get_execution_order([d])
+    self.assert_equal(order, [a, b, c, d])
+
+  def test_parallel_run(self):
+    leaves = [self.rule("leaf%d" % i) for i in range(8)]
+    top = self.rule("top", leaves)
+    scheduler.Scheduler(self.graph, jobs=4,
+                        action_table=actions.ActionTable()).run([top])
+    self.assert_equal(len(self.log), 9)
+    self.assert_equal(self.log[-1], "top")
+
+  def test_failure_propagation(self):
+    a = self.rule("a", fail=True)
+    b = self.rule("b", [a])
+    c = self.rule("c")
+    for jobs in (1, 3):
+      del self.log[:]
+      s = scheduler.Scheduler(self.graph, jobs=jobs, keep_going=True,
+                              action_table=actions.ActionTable())
+      try:
+        s.run([b, c])
+        self.fail("BuildError expected")
+      except scheduler.BuildError, e:
+        self.assert_equal([rule for rule, _ in e.failures], [a])
+      self.assert_equal(self.log, ["c"])
+
+  def test_execute_once(self):
+    a = self.rule("a")
+    b = self.rule("b", [a])
+    c = self.rule("c", [a])
+    d = self.rule("d", [b, c])
+    table = actions.ActionTable()
+    scheduler.Scheduler(self.graph, jobs=2, action_table=table).run([d])
+    scheduler.Scheduler(self.graph, action_table=table).run([b, c])
+    self.assert_equal(sorted(self.log), ["a", "b", "c", "d"])
+    self.assert_not_equal(table.get_fingerprint(b), table.get_fingerprint(c))
+
+  def test_cycle(self):
+    a = self.rule("a")
+    b = self.rule("b", [a])
+    self.graph.add_edge(a, b)
+    s = scheduler.Scheduler(self.graph)
+    self.assert_raises(scheduler.BuildError, s.run, [b])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The build server is a long-lived b3 process that keeps parsed BUILD files,
+rules, the dependency graph and action records in memory between builds::
+
+  $ b3 server &
+  $ b3 build :app   # executed by the server
+  $ b3 server --stop
+
+The server listens on a Unix socket in the b3 build directory, one socket for
+each root directory. Once the server is running, b3 forwards command lines
+started from the same root directory to the server and prints the output.
+Set `B3_NO_SERVER` environment variable to run b3 in-process.
+
+Before each request the server polls BUILD files, their directories and
+modules imported by them (see :class:`~bb.tools.b3.watcher.FileWatcher`) and
+forgets only the BUILD families and rules affected by changes, see
+:func:`~bb.tools.b3.buildfile.invalidate_files`. Changes of sources are
+handled by the action table as usual.
+
+The command is executed with the environment of the client (e.g. `PATH`,
+that defines which toolchains are used, or `CPATH`), the environment of the
+server is restored once the command is done.
+
+The protocol is line-based: the client sends one JSON object
+``{"argv": [...], "env": {...}}`` (or ``{"request": "stop"}``,
+``{"request": "status"}``) and receives JSON objects ``{"out": text}``,
+``{"err": text}`` and finally ``{"exit": code}``.
+"""
+
+from __future__ import print_function
+
+import errno
+import hashlib
+import json
+import logging as _logging
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import traceback
+
+import bb.config
+from bb.utils import fs_snapshot
+from bb.utils import logging
+from bb.utils import path_utils
+
+logger = logging.get_logger("bb")
+
+ENV_NO_SERVER = "B3_NO_SERVER"
+
+class ServerError(Exception):
+  """Indicates that the server cannot be started."""
+
+def get_socket_path(root_dir):
+  """Returns path to the socket of the server for `root_dir`."""
+  digest = hashlib.sha1(os.path.abspath(root_dir)).hexdigest()
+  return path_utils.join(bb.config.user_settings.get("b3", "builddir"),
+                         "server", digest[:16] + ".sock")
+
+def connect(root_dir, socket_path=None):
+  """Returns a socket connected to the server for `root_dir`, or ``None`` if
+  the server is not running.
+  """
+  socket_path = socket_path or get_socket_path(root_dir)
+  if not os.path.exists(socket_path):
+    return None
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(socket_path)
+  except socket.error:
+    sock.close()
+    return None
+  return sock
+
+def send_request(root_dir, request, stdout=None, stderr=None,
+                 socket_path=None):
+  """Sends `request` to the server and writes its output to `stdout` and
+  `stderr`. Returns the exit code, or ``None`` if the server is not running.
+  """
+  stdout = stdout or sys.stdout
+  stderr = stderr or sys.stderr
+  sock = connect(root_dir, socket_path)
+  if not sock:
+    return None
+  try:
+    stream = sock.makefile("rwb")
+    stream.write(json.dumps(request) + "\n")
+    stream.flush()
+    for line in stream:
+      message = json.loads(line)
+      if "out" in message:
+        stdout.write(message["out"])
+        stdout.flush()
+      elif "err" in message:
+        stderr.write(message["err"])
+        stderr.flush()
+      elif "exit" in message:
+        return message["exit"]
+  finally:
+    sock.close()
+  print("Connection to b3 server has been lost", file=stderr)
+  return 1
+
+def forward(root_dir, argv):
+  """Runs command line `argv` on the server for `root_dir`. Returns the exit
+  code, or ``None`` if the command has to be executed in-process.
+  """
+  if os.environ.get(ENV_NO_SERVER) or (argv and argv[0] == "server"):
+    return None
+  # The watching build never ends, it runs in-process.
+  if "--watch" in argv or "-w" in argv:
+    return None
+  env = dict([(name.decode("utf-8", "replace"),
+               value.decode("utf-8", "replace"))
+              for name, value in os.environ.items()])
+  return send_request(root_dir, {"argv": argv, "env": env})
+
+def _set_environ(environ):
+  """Makes `environ` the environment of this process and its children."""
+  for name in list(os.environ.keys()):
+    if name not in environ:
+      del os.environ[name]
+  for name, value in environ.items():
+    if os.environ.get(name) != value:
+      os.environ[name] = value
+
+class _Channel(object):
+  """File-like object that sends written text to the client."""
+
+  def __init__(self, stream, name, lock, fd):
+    self._stream = stream
+    self._name = name
+    self._lock = lock
+    self._fd = fd
+
+  def write(self, data):
+    if isinstance(data, str):
+      data = data.decode("utf-8", "replace")
+    with self._lock:
+      try:
+        self._stream.write(json.dumps({self._name: data}) + "\n")
+        self._stream.flush()
+      except (IOError, socket.error):
+        # The client has gone, the command goes on.
+        pass
+
+  def flush(self):
+    pass
+
+  def isatty(self):
+    return False
+
+  def fileno(self):
+    """Returns the descriptor, that is redirected to this channel while the
+    command is executed, see :func:`BuildServer.execute`.
+    """
+    return self._fd
+
+class _OutputPump(object):
+  """Redirects descriptors 1 and 2 of this process to a pipe and sends
+  everything written there (e.g. the output of compilers started by
+  :func:`bb.utils.spawn.spawn`) to `channel`, until :func:`close` is called.
+  """
+
+  # Do not wait forever for a child that keeps the pipe open.
+  JOIN_TIMEOUT = 5.0
+
+  def __init__(self, channel):
+    self._channel = channel
+    sys.__stdout__.flush()
+    sys.__stderr__.flush()
+    self._saved_fds = (os.dup(1), os.dup(2))
+    read_fd, write_fd = os.pipe()
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    self._read_fd = read_fd
+    self._thread = threading.Thread(target=self._pump)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _pump(self):
+    while True:
+      try:
+        data = os.read(self._read_fd, 4096)
+      except OSError, e:
+        if e.errno == errno.EINTR:
+          continue
+        break
+      if not data:
+        break
+      self._channel.write(data)
+    os.close(self._read_fd)
+
+  def close(self):
+    sys.__stdout__.flush()
+    sys.__stderr__.flush()
+    os.dup2(self._saved_fds[0], 1)
+    os.dup2(self._saved_fds[1], 2)
+    os.close(self._saved_fds[0])
+    os.close(self._saved_fds[1])
+    self._thread.join(self.JOIN_TIMEOUT)
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+
+  def handle(self):
+    try:
+      request = json.loads(self.rfile.readline())
+    except ValueError:
+      return
+    lock = threading.Lock()
+    stdout = _Channel(self.wfile, "out", lock, 1)
+    stderr = _Channel(self.wfile, "err", lock, 2)
+    code = self.server.handle_command(request, stdout, stderr)
+    with lock:
+      try:
+        self.wfile.write(json.dumps({"exit": code}) + "\n")
+      except (IOError, socket.error):
+        pass
+
+class BuildServer(SocketServer.UnixStreamServer):
+  """Executes b3 command lines for `root_dir` one after another within this
+  process.
+  """
+
+  def __init__(self, root_dir, socket_path=None, watcher=None):
+    from bb.tools.b3 import watcher as watcher_module
+    self.root_dir = os.path.abspath(root_dir)
+    self.socket_path = socket_path or get_socket_path(self.root_dir)
+    self.watcher = watcher or watcher_module.FileWatcher()
+    self.num_requests = 0
+    self._stopping = False
+    if connect(self.root_dir, self.socket_path):
+      raise ServerError("b3 server for %s is already running" % self.root_dir)
+    path_utils.mkpath(os.path.dirname(self.socket_path))
+    if os.path.exists(self.socket_path):
+      # Stale socket of a server that has gone.
+      os.remove(self.socket_path)
+    SocketServer.UnixStreamServer.__init__(self, self.socket_path,
+                                           _RequestHandler)
+
+  def invalidate(self):
+    """Forgets BUILD families affected by changes since the previous request.
+    Returns a set of invalidated BUILD files.
+    """
+    from bb.tools.b3 import buildfile
+    changed = self.watcher.poll()
+    if not changed:
+      return set()
+    fs_snapshot.invalidate(changed)
+    invalidated = buildfile.invalidate_files(changed)
+    logger.debug("Changed %s, invalidated %d BUILD file(s)" %
+                 (", ".join(changed), len(invalidated)))
+    return invalidated
+
+  def update_watched(self):
+    """Watches all the BUILD files, their directories and modules imported by
+    them.
+    """
+    from bb.tools.b3 import buildfile
+    self.watcher.watch_all(buildfile._parse_inputs)
+    self.watcher.watch_all(buildfile._parse_dirs)
+
+  def handle_command(self, request, stdout, stderr):
+    if request.get("request") == "stop":
+      self._stopping = True
+      stdout.write("b3 server for %s has been stopped\n" % self.root_dir)
+      return 0
+    if request.get("request") == "status":
+      stdout.write("Root directory: %s\n"
+                   "Process:        %d\n"
+                   "Requests:       %d\n"
+                   "Watched paths:  %d\n" %
+                   (self.root_dir, os.getpid(), self.num_requests,
+                    len(self.watcher.get_watched())))
+      return 0
+    self.num_requests += 1
+    return self.execute(request.get("argv", []), stdout, stderr,
+                        request.get("env"))
+
+  def execute(self, argv, stdout, stderr, env=None):
+    """Executes command line `argv` with the output redirected to `stdout` and
+    `stderr`, and environment `env` if provided. Returns the exit code.
+    """
+    from bb.tools.b3 import engine
+    handlers = [handler for handler in _logging.getLogger().handlers
+                if isinstance(handler, _logging.StreamHandler)]
+    saved = (sys.stdout, sys.stderr, [handler.stream for handler in handlers])
+    sys.stdout, sys.stderr = stdout, stderr
+    for handler in handlers:
+      handler.stream = stderr
+    saved_environ = dict(os.environ)
+    if env is not None:
+      _set_environ(dict([(name.encode("utf-8"), value.encode("utf-8"))
+                         for name, value in env.items()]))
+    pump = _OutputPump(stdout)
+    try:
+      self.invalidate()
+      try:
+        code = engine.run_command(self.root_dir, argv)
+      except SystemExit, e:
+        code = e.code
+      except Exception:
+        traceback.print_exc(file=stderr)
+        code = 1
+      self.update_watched()
+    finally:
+      pump.close()
+      _set_environ(saved_environ)
+      sys.stdout, sys.stderr = saved[0], saved[1]
+      for handler, stream in zip(handlers, saved[2]):
+        handler.stream = stream
+    if code is None:
+      code = 0
+    elif not isinstance(code, int):
+      code = 1
+    return code
+
+  def serve(self):
+    """Handles requests until the server is stopped."""
+    try:
+      while not self._stopping:
+        self.handle_request()
+    finally:
+      self.server_close()
+      try:
+        os.remove(self.socket_path)
+      except OSError, e:
+        if e.errno != errno.ENOENT:
+          raise
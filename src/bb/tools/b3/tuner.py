@@ -0,0 +1,436 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Compiler flag autotuning of CC binaries (see ``b3 tune``).
+
+A binary consists of modules: the binary itself and each CC library it
+depends on. A configuration assigns a flag set (copts) to each module, e.g.
+``(("-Os",), ("-O2", "-mfcache"))``. Each configuration is built as a variant
+of the binary by a compiler of its own in
+``<builddir>/<binary>/tune/<digest>``. Variants are built concurrently and
+their objects go through the action cache, thus a module is compiled with the
+same flags only once for all the variants.
+
+A variant is scored by the size of its image and, optionally, by the number of
+cycles reported by a host side estimator (e.g. a simulator), a command that
+gets the image path as the last argument and prints the number of cycles as
+the last number of its output. The cost of a variant is relative to the
+baseline, the configuration from the BUILD files::
+
+  cost = size / baseline size + cycles weight * cycles / baseline cycles
+
+Variants that fail to build have infinite cost. Search strategies:
+
+* ``greedy`` (:func:`greedy_search`) tries each flag set for one module at a
+  time, keeping the best flags of the other modules, until no module can be
+  improved;
+* ``halving`` (:func:`successive_halving`) samples configurations, scores
+  them by size only, and keeps the best half, which is scored by the full cost
+  until a single configuration is left.
+
+The best configuration can be written back as `copts` attributes of the rules
+in their BUILD files, see :func:`update_copts`.
+"""
+
+from __future__ import print_function
+
+import ast
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+import shlex
+import StringIO
+import threading
+import tokenize
+from multiprocessing.pool import ThreadPool
+
+from bb.tools.b3 import manifest
+from bb.tools.compilers.compiler import CompileError
+from bb.tools.compilers import memory_models
+from bb.utils import logging
+from bb.utils import path_utils
+from bb.utils import spawn
+
+logger = logging.get_logger("bb")
+
+TUNE_DIR = "tune"
+GREEDY_STRATEGY = "greedy"
+HALVING_STRATEGY = "halving"
+STRATEGIES = (GREEDY_STRATEGY, HALVING_STRATEGY)
+# The number of configurations sampled by successive halving.
+DEFAULT_NUM_CANDIDATES = 16
+# Seconds given to the cycle estimator per variant.
+ESTIMATOR_TIMEOUT = 60
+# The maximal number of passes of greedy search over the modules.
+MAX_GREEDY_PASSES = 3
+# Random draws per candidate made by successive halving at most.
+MAX_SAMPLE_DRAWS = 100
+
+INFINITE_COST = float("inf")
+
+_NUMBER_REGEXP = re.compile(r"\d+(?:\.\d+)?")
+
+class TuneError(Exception):
+  """Indicates that a binary cannot be tuned or the result cannot be
+  written.
+  """
+
+def parse_cycles(output):
+  """Returns the last number from the estimator `output` or ``None``."""
+  numbers = _NUMBER_REGEXP.findall(output)
+  if not numbers:
+    return None
+  return float(numbers[-1])
+
+class Score(object):
+  """Image size and estimated cycles of a variant, or the error if the
+  variant cannot be built or estimated.
+  """
+
+  def __init__(self, size=None, cycles=None, error=None):
+    self.size = size
+    self.cycles = cycles
+    self.error = error
+
+  def is_ok(self):
+    return self.error is None
+
+  def __repr__(self):
+    if not self.is_ok():
+      return "Score(error=%r)" % self.error
+    return "Score(size=%s, cycles=%s)" % (self.size, self.cycles)
+
+def get_cost(score, baseline, cycles_weight=1.0):
+  """Returns the cost of `score` relative to `baseline` score, see the module
+  description. Cycles are taken into account only if both scores have them
+  and `cycles_weight` is not zero.
+  """
+  if not score.is_ok():
+    return INFINITE_COST
+  cost = float(score.size) / max(baseline.size, 1)
+  if cycles_weight and score.cycles is not None and \
+        baseline.cycles is not None:
+    cost += cycles_weight * score.cycles / max(baseline.cycles, 1)
+  return cost
+
+def greedy_search(baseline, flag_sets, evaluate,
+                  max_passes=MAX_GREEDY_PASSES):
+  """Returns a tuple of the best configuration found by coordinate descent
+  from `baseline` and its cost. `evaluate(configs, full)` returns a list of
+  costs of `configs`. Flag sets of a module are evaluated at once.
+  """
+  best = tuple(baseline)
+  best_cost = evaluate([best], True)[0]
+  for _ in range(max_passes):
+    improved = False
+    for i in range(len(best)):
+      candidates = [best[:i] + (flags,) + best[i + 1:]
+                    for flags in flag_sets if flags != best[i]]
+      if not candidates:
+        continue
+      costs = evaluate(candidates, True)
+      cost, config = min(zip(costs, candidates))
+      if cost < best_cost:
+        best, best_cost = config, cost
+        improved = True
+    if not improved:
+      break
+  return best, best_cost
+
+def unique_flag_sets(flag_sets):
+  """Returns a list of distinct `flag_sets` in their order."""
+  result = []
+  for flags in flag_sets:
+    if tuple(flags) not in result:
+      result.append(tuple(flags))
+  return result
+
+def sample_configs(baseline, flag_sets, num_candidates, rng=None):
+  """Returns a list of up to `num_candidates` distinct configurations, that
+  starts with `baseline`. All the configurations are returned if there are
+  not more of them.
+  """
+  baseline = tuple(baseline)
+  flag_sets = unique_flag_sets(flag_sets)
+  num_modules = len(baseline)
+  configs = [baseline]
+  num_configs = len(flag_sets) ** num_modules
+  if not all([flags in flag_sets for flags in baseline]):
+    num_configs += 1
+  if num_configs <= num_candidates:
+    configs.extend([config for config in
+                    itertools.product(flag_sets, repeat=num_modules)
+                    if config != baseline])
+    return configs
+  rng = rng or random.Random(0)
+  seen = set(configs)
+  # There are more configurations than candidates, but random draws can still
+  # repeat, thus the number of draws is bounded.
+  for _ in range(num_candidates * MAX_SAMPLE_DRAWS):
+    if len(configs) >= num_candidates:
+      break
+    config = tuple([rng.choice(flag_sets) for _ in range(num_modules)])
+    if config not in seen:
+      seen.add(config)
+      configs.append(config)
+  return configs
+
+def successive_halving(baseline, flag_sets, evaluate,
+                       num_candidates=DEFAULT_NUM_CANDIDATES, eta=2,
+                       rng=None):
+  """Returns a tuple of the best configuration found by successive halving
+  and its cost. The first rung scores sampled configurations by size only
+  (`evaluate(configs, False)`), the following rungs by the full cost, and
+  keep the best ``1/eta`` of the configurations.
+  """
+  candidates = sample_configs(baseline, flag_sets, num_candidates, rng)
+  rung = 0
+  while True:
+    ranked = sorted(zip(evaluate(candidates, rung > 0), candidates))
+    if rung > 0 and len(ranked) == 1:
+      return ranked[0][1], ranked[0][0]
+    keep = max(1, len(ranked) // eta)
+    candidates = [config for cost, config in ranked[:keep]
+                  if cost != INFINITE_COST] or [tuple(baseline)]
+    rung += 1
+
+class Tuner(object):
+  """Searches for the best flag sets of modules of the CC binary `binary`.
+  Up to `jobs` variants are built at once. `estimator` is the command that
+  estimates cycles of an image, if any.
+  """
+
+  def __init__(self, binary, flag_sets=None, jobs=1, estimator=None,
+               cycles_weight=1.0):
+    self.binary = binary
+    self.modules = [binary] + binary.get_libraries()
+    self.flag_sets = unique_flag_sets(flag_sets or
+                                      binary.compiler.tune_flag_sets)
+    self.jobs = jobs
+    self.estimator = estimator
+    if estimator:
+      self.estimator = shlex.split(estimator)
+    self.cycles_weight = cycles_weight
+    self.baseline = tuple([tuple(module.get_copts())
+                           for module in self.modules])
+    # Maps configuration to its score.
+    self._scores = dict()
+    self._lock = threading.Lock()
+
+  def get_variant_dir(self, config):
+    digest = hashlib.sha1(repr(config)).hexdigest()[:12]
+    return path_utils.join(self.binary.get_build_dir(),
+                           self.binary.get_name(), TUNE_DIR, digest)
+
+  def build(self, config):
+    """Builds the variant of the binary for `config` and returns the path to
+    its image.
+    """
+    compiler = self.binary.compiler.__class__()
+    output_dir = self.get_variant_dir(config)
+    copts = dict([(module, list(flags))
+                  for module, flags in zip(self.modules, config)])
+    if not self.binary.configure_compiler(compiler, output_dir, copts):
+      raise TuneError("%s has nothing to compile" % self.binary)
+    image = path_utils.join(output_dir, self.binary.get_name())
+    compiler.set_output_filename(image)
+    compiler.compile()
+    return image
+
+  def estimate(self, image):
+    """Returns cycles of `image` reported by the estimator."""
+    result = spawn.run(self.estimator + [image], capture=True,
+                       timeout=ESTIMATOR_TIMEOUT)
+    if not result.is_ok():
+      raise spawn.ExecutionError(result.get_error_message(), result)
+    cycles = parse_cycles(result.stdout)
+    if cycles is None:
+      raise TuneError("Estimator has not reported cycles of %s" % image)
+    return cycles
+
+  def score(self, config, full=True):
+    """Returns :class:`Score` of `config`, cycles are estimated only if
+    `full` is ``True``. Scores are memoized.
+    """
+    with self._lock:
+      score = self._scores.get(config)
+    if score and (not score.is_ok() or not full or not self.estimator or
+                  score.cycles is not None):
+      return score
+    try:
+      image = path_utils.join(self.get_variant_dir(config),
+                              self.binary.get_name())
+      if not score:
+        image = self.build(config)
+        score = Score(memory_models.get_image_size(image))
+      if full and self.estimator:
+        score.cycles = self.estimate(image)
+    except (CompileError, spawn.ExecutionError, TuneError, IOError,
+            ValueError), e:
+      logger.debug("Variant %s failed: %s" % (self.format_config(config), e))
+      score = Score(error=str(e))
+    with self._lock:
+      self._scores[config] = score
+    return score
+
+  def get_scores(self):
+    return dict(self._scores)
+
+  def evaluate(self, configs, full=True):
+    """Scores `configs` concurrently and returns a list of their costs."""
+    if self.jobs > 1 and len(configs) > 1:
+      pool = ThreadPool(min(self.jobs, len(configs)))
+      try:
+        # Py2.x: get() without timeout cannot be interrupted.
+        scores = pool.map_async(lambda config: self.score(config, full),
+                                configs).get(24 * 60 * 60)
+      finally:
+        pool.terminate()
+    else:
+      scores = [self.score(config, full) for config in configs]
+    baseline = self.score(self.baseline)
+    # Cheap evaluations compare sizes only.
+    cycles_weight = full and self.cycles_weight or 0
+    return [get_cost(score, baseline, cycles_weight) for score in scores]
+
+  def tune(self, strategy=GREEDY_STRATEGY, num_candidates=None, rng=None):
+    """Returns a tuple of the best configuration and its cost, which is never
+    worse than the baseline, whose cost is 1 (or 1 + cycles weight).
+    """
+    baseline = self.score(self.baseline)
+    if not baseline.is_ok():
+      raise TuneError("%s cannot be built: %s" % (self.binary, baseline.error))
+    if strategy == GREEDY_STRATEGY:
+      best, cost = greedy_search(self.baseline, self.flag_sets, self.evaluate)
+    elif strategy == HALVING_STRATEGY:
+      best, cost = successive_halving(
+        self.baseline, self.flag_sets, self.evaluate,
+        num_candidates or DEFAULT_NUM_CANDIDATES, rng=rng)
+    else:
+      raise TuneError("Unknown strategy %s, expected one of: %s" %
+                      (strategy, ", ".join(STRATEGIES)))
+    baseline_cost = self.evaluate([self.baseline])[0]
+    if cost >= baseline_cost:
+      return self.baseline, baseline_cost
+    return best, cost
+
+  def format_config(self, config):
+    return ", ".join(["%s: %s" % (module.get_name(), " ".join(flags) or "-")
+                      for module, flags in zip(self.modules, config)])
+
+  def format_report(self, config):
+    """Returns the report on the variants and the best configuration."""
+    lines = ["%d variant(s) of %s:" % (len(self._scores), self.binary)]
+    baseline = self._scores[self.baseline]
+    # Variants that have been scored by size only come last.
+    ranked = sorted([(bool(self.estimator) and score.cycles is None,
+                      get_cost(score, baseline, self.cycles_weight), variant)
+                     for variant, score in self._scores.items()])
+    for _, cost, variant in ranked:
+      score = self._scores[variant]
+      if score.is_ok():
+        lines.append("  %6.3f  %7d byte(s)  %-12s  %s" %
+                     (cost, score.size, score.cycles is not None and
+                      "%d cycle(s)" % score.cycles or "",
+                      self.format_config(variant)))
+      else:
+        lines.append("  %6s  %15s  %12s  %s" %
+                     ("failed", "", "", self.format_config(variant)))
+    lines.append("Best: %s" % self.format_config(config))
+    return "\n".join(lines)
+
+def _get_rule_name(call):
+  for keyword in call.keywords:
+    if keyword.arg in ("name", "target"):
+      if isinstance(keyword.value, ast.Str):
+        return keyword.value.s
+      return None
+  func = call.func
+  name = getattr(func, "id", getattr(func, "attr", None))
+  if name in manifest.PRIMITIVES and call.args and \
+        isinstance(call.args[0], ast.Str):
+    return call.args[0].s
+  return None
+
+def _find_closing(code, start):
+  """Returns the offset of the bracket that closes the one at offset `start`
+  of `code`.
+  """
+  lines = code[start:].splitlines(True)
+  offsets = [0]
+  for line in lines:
+    offsets.append(offsets[-1] + len(line))
+  depth = 0
+  tokens = tokenize.generate_tokens(StringIO.StringIO(code[start:]).readline)
+  for token_type, string, (row, col), _, _ in tokens:
+    if token_type != tokenize.OP:
+      continue
+    if string in "([{":
+      depth += 1
+    elif string in ")]}":
+      depth -= 1
+      if not depth:
+        return start + offsets[row - 1] + col
+  raise TuneError("Unbalanced brackets at offset %d" % start)
+
+def update_copts(code, name, copts):
+  """Returns the content of BUILD file `code`, where `copts` keyword of the
+  call that defines rule `name` is set to `copts`. Raises :class:`TuneError`
+  if there is no such call or its copts are not a list literal.
+  """
+  offsets = [0]
+  for line in code.splitlines(True):
+    offsets.append(offsets[-1] + len(line))
+  calls = [node for node in ast.walk(ast.parse(code))
+           if isinstance(node, ast.Call) and _get_rule_name(node) == name]
+  if len(calls) != 1:
+    raise TuneError("Cannot find the definition of %s" % name)
+  call = calls[0]
+  value = json.dumps(list(copts))
+  for keyword in call.keywords:
+    if keyword.arg != "copts":
+      continue
+    if not isinstance(keyword.value, ast.List) or \
+          not all([isinstance(elt, ast.Str) for elt in keyword.value.elts]):
+      raise TuneError("copts of %s is not a list of strings" % name)
+    start = offsets[keyword.value.lineno - 1] + keyword.value.col_offset
+    return code[:start] + value + code[_find_closing(code, start) + 1:]
+  start = offsets[call.func.lineno - 1] + call.func.col_offset
+  end = _find_closing(code, code.index("(", start))
+  end = len(code[:end].rstrip())
+  if code[end - 1] == "(":
+    keyword = "copts=%s" % value
+  elif code[end - 1] == ",":
+    keyword = " copts=%s," % value
+  else:
+    keyword = ", copts=%s" % value
+  return code[:end] + keyword + code[end:]
+
+def write_copts(rule, copts):
+  """Sets `copts` attribute of `rule` in its BUILD file."""
+  path = rule.get_address().buildfile.full_path
+  with open(path) as handle:
+    code = handle.read()
+  code = update_copts(code, rule.get_name(), copts)
+  with open(path, "w") as handle:
+    handle.write(code)
+  rule.set_copts(list(copts))
@@ -0,0 +1,65 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import tuner
+
+FLAG_SETS = [("-Os",), ("-O1",), ("-O2",), ("-O2", "-mfcache")]
+# Synthetic costs of flag sets per module.
+COSTS = [{"-Os": 3, "-O1": 2, "-O2": 1, "-O2 -mfcache": 4},
+         {"-Os": 1, "-O1": 2, "-O2": 3}]
+
+def evaluate(configs, full=True):
+  costs = []
+  for config in configs:
+    cost = 0
+    for i, flags in enumerate(config):
+      cost += COSTS[i].get(" ".join(flags), tuner.INFINITE_COST)
+    costs.append(cost)
+  return costs
+
+class TunerTest(unittest.TestCase):
+
+  def test_greedy_search(self):
+    self.assert_equal(tuner.greedy_search((("-Os",), ("-O2",)), FLAG_SETS,
+                                          evaluate),
+                      ((("-O2",), ("-Os",)), 2))
+
+  def test_successive_halving(self):
+    baseline = (("-Os",), ("-O2",))
+    configs = tuner.sample_configs(baseline, FLAG_SETS, 32)
+    self.assert_equal(len(configs), 16)
+    self.assert_equal(configs[0], baseline)
+    self.assert_equal(len(set(tuner.sample_configs(baseline, FLAG_SETS, 8))),
+                      8)
+    self.assert_equal(tuner.sample_configs(((), (), ()),
+                                           [("-O2",), ("-O2",)], 8),
+                      [((), (), ()), (("-O2",),) * 3])
+    self.assert_equal(tuner.successive_halving(baseline, FLAG_SETS, evaluate,
+                                               32),
+                      ((("-O2",), ("-Os",)), 2))
+
+  def test_get_cost(self):
+    baseline = tuner.Score(100, 1000)
+    self.assert_equal(tuner.get_cost(tuner.Score(50, 500), baseline), 1.0)
+    self.assert_equal(tuner.get_cost(tuner.Score(50), baseline), 0.5)
+    self.assert_equal(tuner.get_cost(tuner.Score(error="failed"), baseline),
+                      tuner.INFINITE_COST)
+    self.assert_equal(tuner.parse_cycles("run 2: 1234 cycles\n"), 1234.0)
+
+  def test_update_copts(self):
+    code = ('cc_library(name="a", srcs=["a.c"])\n'
+            'cc_library(\n  name="b",\n  copts=["-Os",\n         "-g"],\n'
+            '  srcs=["b.c"],\n)\n')
+    code = tuner.update_copts(code, "a", ["-O2"])
+    code = tuner.update_copts(code, "b", ["-O2", "-mfcache"])
+    self.assert_equal(code, 'cc_library(name="a", srcs=["a.c"], '
+                      'copts=["-O2"])\n'
+                      'cc_library(\n  name="b",\n'
+                      '  copts=["-O2", "-mfcache"],\n  srcs=["b.c"],\n)\n')
+    self.assert_raises(tuner.TuneError, tuner.update_copts, code, "c", [])
+
+if __name__ == "__main__":
+  unittest.main()
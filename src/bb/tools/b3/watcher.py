@@ -0,0 +1,104 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The watcher detects changes of files and directories by polling their
+status::
+
+  watcher = FileWatcher()
+  watcher.watch_all(["BUILD", "main.c"])
+  changed = watcher.wait()
+
+A file is changed once its modification time, size or inode has been changed,
+or it has been created or removed. A directory is changed once the list of its
+entries has been changed. Polling a few hundreds of files twice a second costs
+next to nothing, thus no platform specific notification API is used.
+"""
+
+import os
+import time
+
+DEFAULT_INTERVAL = 0.5 # seconds
+DEFAULT_DEBOUNCE = 0.2 # seconds
+
+class FileWatcher(object):
+  """Watches a set of files and directories. The status of each path is
+  checked every `interval` seconds.
+  """
+
+  def __init__(self, interval=DEFAULT_INTERVAL):
+    self._interval = interval
+    self._signatures = dict()
+
+  def get_interval(self):
+    return self._interval
+
+  def _get_signature(self, path):
+    try:
+      st = os.stat(path)
+    except OSError:
+      return None
+    if os.path.isdir(path):
+      try:
+        return ("dir", tuple(sorted(os.listdir(path))))
+      except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+  def watch(self, path):
+    """Starts to watch `path`. The current status of the path is taken as the
+    initial one.
+    """
+    path = os.path.abspath(path)
+    if path not in self._signatures:
+      self._signatures[path] = self._get_signature(path)
+
+  def watch_all(self, paths):
+    for path in paths:
+      self.watch(path)
+
+  def unwatch(self, path):
+    self._signatures.pop(os.path.abspath(path), None)
+
+  def clear(self):
+    self._signatures.clear()
+
+  def get_watched(self):
+    return self._signatures.keys()
+
+  def poll(self):
+    """Returns a sorted list of paths changed since the previous call (or
+    since they are watched).
+    """
+    changed = []
+    for path, signature in self._signatures.items():
+      current = self._get_signature(path)
+      if current != signature:
+        self._signatures[path] = current
+        changed.append(path)
+    return sorted(changed)
+
+  def wait(self, timeout=None, debounce=DEFAULT_DEBOUNCE):
+    """Blocks until some paths have been changed and no more changes happen
+    during `debounce` seconds, so that a burst of writes (e.g. the editor saves
+    several files) is reported once. Returns a sorted list of changed paths,
+    the list is empty if nothing has been changed within `timeout` seconds.
+    """
+    deadline = None
+    if timeout is not None:
+      deadline = time.time() + timeout
+    changed = set()
+    while True:
+      current = self.poll()
+      if current:
+        changed.update(current)
+        time.sleep(debounce)
+        continue
+      if changed:
+        return sorted(changed)
+      if deadline is not None and time.time() >= deadline:
+        return []
+      time.sleep(self._interval)
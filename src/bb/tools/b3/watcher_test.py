@@ -0,0 +1,40 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.b3 import watcher
+
+class FileWatcherTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.path = os.path.join(self.dir, "BUILD")
+    self.write_build("cc_binary(name='app')")
+    self.watcher = watcher.FileWatcher(interval=0.01)
+    self.watcher.watch_all([self.path, self.dir])
+
+  def write_build(self, text):
+    with open(self.path, "w") as fh:
+      fh.write(text)
+
+  def test_poll(self):
+    self.assert_equal(self.watcher.poll(), [])
+    self.write_build("cc_binary(name='application')")
+    self.assert_equal(self.watcher.poll(), [self.path])
+    self.assert_equal(self.watcher.poll(), [])
+
+  def test_directory(self):
+    open(os.path.join(self.dir, "main.c"), "w").close()
+    self.assert_equal(self.watcher.poll(), [self.dir])
+    os.remove(self.path)
+    self.assert_equal(self.watcher.poll(), sorted([self.dir, self.path]))
+
+  def test_wait_timeout(self):
+    self.assert_equal(self.watcher.wait(timeout=0.05, debounce=0.01), [])
+
+if __name__ == "__main__":
+  unittest.main()
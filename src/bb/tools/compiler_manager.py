@@ -20,6 +20,7 @@ import inspect
 import sys
 
 import bb
+from bb.tools import toolchains
 from bb.tools.compilers.compiler import Compiler
 from bb.utils import typecheck
 
@@ -47,18 +48,36 @@ def new_compiler(name, args={}):
   """
   if not typecheck.is_string(name):
     raise Exception("Must be string")
-  name = _fix_compiler_name()
+  name = _fix_compiler_name(name)
   class_ = _COMPILER_CLASSES.get(name, None)
   if not class_:
     print "Compiler '%s' is not supported" % name
     return None
   return class_(**args)
 
+def get_toolchain(name):
+  """Returns :class:`~bb.tools.toolchains.Toolchain` of compiler `name` or
+  ``None`` if the compiler is not supported or its executable cannot be
+  found.
+  """
+  class_ = _COMPILER_CLASSES.get(_fix_compiler_name(name), None)
+  executable = class_ and getattr(class_, "executable", None)
+  if not typecheck.is_string(executable):
+    return None
+  return toolchains.get_registry().probe(executable, class_.toolchain_probe)
+
 def show_compilers():
   """Print list of available compilers."""
   compilers = []
   for name, class_ in _COMPILER_CLASSES.items():
-    compilers.append(("compiler=" + name, None, ""))
+    toolchain = get_toolchain(name)
+    description = ""
+    if toolchain:
+      description = " ".join([str(part) for part in (toolchain.path,
+                                                     toolchain.get_version(),
+                                                     toolchain.get_target())
+                              if part])
+    compilers.append(("compiler=" + name, None, description))
   compilers.sort()
   pretty_printer = fancy_getopt.FancyGetopt(compilers)
   pretty_printer.print_help("List of available compilers:")
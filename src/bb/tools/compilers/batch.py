@@ -0,0 +1,107 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Batched compilation.
+
+Starting a compiler per source is a big fraction of build time for small
+sources. Sources that are compiled with the same options into the same
+directory are passed to a single compiler invocation instead::
+
+  cd <output_dir> && cc -c -MD ... /path/to/a.c /path/to/b.c
+
+The compiler names each object (and depfile) after its source in the current
+directory, so that the objects land where they are expected by
+:func:`bb.tools.compilers.custom_c_compiler.CustomCCompiler.get_object_filenames`.
+Relative paths in options are made absolute for that reason.
+
+Long command lines go through response files (``@file``). If a batch fails to
+compile, its sources are compiled one by one, so that errors are attributed to
+the files that caused them. Batched sources bypass the compiler cache (see
+:mod:`bb.tools.compilers.compiler_cache`), their objects are still kept in the
+action cache.
+"""
+
+import re
+
+from bb.utils import path_utils
+
+# Bounds of adaptive batch size. There have to be enough batches to keep all
+# the jobs busy, while each batch has to be large enough to save processes.
+MIN_BATCH_SIZE = 2
+MAX_BATCH_SIZE = 16
+# Command lines longer than that (in characters) go through response files.
+# It is below the limit of the most restrictive platform (Windows, 8191).
+MAX_COMMAND_LENGTH = 8000
+
+# Options that take a path, either joined (-Idir) or as the next argument.
+_PATH_OPTIONS = ("-I", "-isystem", "-iquote", "-idirafter", "-include",
+                 "-imacros", "-L")
+_UNSAFE_REGEXP = re.compile(r"""[\s'"\\]""")
+
+def get_batch_size(num_sources, num_jobs):
+  """Returns the number of sources per batch, so that there is a batch per
+  job, but no batch is larger than :const:`MAX_BATCH_SIZE` sources.
+  """
+  size = -(-num_sources // max(1, num_jobs))
+  return max(MIN_BATCH_SIZE, min(size, MAX_BATCH_SIZE))
+
+def split(items, batch_size):
+  """Splits `items` list into batches of up to `batch_size` items."""
+  return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+def get_default_object_filename(src, object_extension):
+  """Returns the name of the object that the compiler writes for `src` to the
+  current directory, when the output file is not given.
+  """
+  return path_utils.splitext(path_utils.basename(src))[0] + object_extension
+
+def make_paths_absolute(args):
+  """Returns a copy of `args` where paths of path options are absolute, so
+  that the options mean the same in another directory.
+  """
+  result = []
+  expect_path = False
+  for arg in args:
+    if expect_path:
+      arg = path_utils.abspath(arg)
+      expect_path = False
+    elif arg in _PATH_OPTIONS:
+      expect_path = True
+    else:
+      for option in _PATH_OPTIONS:
+        if arg.startswith(option) and len(arg) > len(option) and \
+              not path_utils.isabs(arg[len(option):]):
+          arg = option + path_utils.abspath(arg[len(option):])
+          break
+    result.append(arg)
+  return result
+
+def quote_response_arg(arg):
+  """Quotes `arg` for a GCC response file."""
+  if not arg:
+    return "''"
+  if not _UNSAFE_REGEXP.search(arg):
+    return arg
+  return _UNSAFE_REGEXP.sub(lambda match: "\\" + match.group(0), arg)
+
+def needs_response_file(cmd):
+  return len(" ".join(cmd)) > MAX_COMMAND_LENGTH
+
+def write_response_file(path, args):
+  """Writes `args` to the response file `path`."""
+  with open(path, "w") as handle:
+    handle.write("\n".join([quote_response_arg(arg) for arg in args]) + "\n")
@@ -0,0 +1,47 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.compilers import batch
+from bb.tools.compilers.gcc import GCC
+
+class BatchTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.max_command_length = batch.MAX_COMMAND_LENGTH
+
+  def teardown(self):
+    batch.MAX_COMMAND_LENGTH = self.max_command_length
+
+  def test_make_paths_absolute(self):
+    self.assert_equal(batch.make_paths_absolute(["-Iinc", "-I/usr/include",
+                                                 "-include", "a.h", "-c",
+                                                 "-DX=inc"]),
+                      ["-I" + os.path.abspath("inc"), "-I/usr/include",
+                       "-include", os.path.abspath("a.h"), "-c", "-DX=inc"])
+
+  def test_get_batch_size(self):
+    self.assert_equal(batch.get_batch_size(24, 4), 6)
+    self.assert_equal(batch.get_batch_size(3, 4), batch.MIN_BATCH_SIZE)
+    self.assert_equal(batch.get_batch_size(100, 1), batch.MAX_BATCH_SIZE)
+
+  def test_compile_batch(self):
+    # Force a response file.
+    batch.MAX_COMMAND_LENGTH = 0
+    sources = [self.write("a.c", "int a(void) { return A; }\n"),
+               self.write("b c.c", "int b(void) { return A; }\n")]
+    output_dir = os.path.join(self.dir, "out")
+    os.mkdir(output_dir)
+    compiler = GCC()
+    compiler._compile_batch(output_dir, sources,
+                            ["-c", "-DA=1", "-DS=\"a b\""], [], [])
+    self.assert_equal(sorted(os.listdir(output_dir)),
+                      ["a.d", "a.o", "b c.d", "b c.o"])
+
+if __name__ == "__main__":
+  unittest.main()
@@ -87,6 +87,10 @@ class CatalinaCompiler(CC):
           options.append("%s-D%s=%s" % ((before,) + macro))
     return options
 
+  def _gen_depfile_options(self, obj):
+    # LCC does not generate depfiles, the include scanner is used instead.
+    return []
+
   def _gen_cc_options(self, pp_opts, debug, before):
     cc_opts = UnixCCompiler._gen_cc_options(self, pp_opts, debug, before)
     if self.verbose:
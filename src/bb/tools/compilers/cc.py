@@ -17,7 +17,15 @@
 #
 # Author: Oleksandr Sviridenko
 
+import os
+import sys
+import threading
+
+from bb.tools.compilers.compiler import CompileError
+from bb.tools.compilers import batch
+from bb.tools.compilers import compiler_cache
 from bb.tools.compilers.custom_c_compiler import CustomCCompiler, Linker
+from bb.utils import fs_snapshot
 from bb.utils import spawn
 from bb.utils import path_utils
 from bb.utils import executable
@@ -52,13 +60,88 @@ class CC(CustomCCompiler):
     self.set_linker(LD())
 
   def _compile(self, obj, src, ext, cc_args, extra_postargs, pp_opts):
+    cache = compiler_cache.get_compiler_cache()
+    # Precompiled headers (-x c-header) are not objects, and the preprocessor
+    # does not show headers that come from a precompiled header (-include), do
+    # not cache them.
+    if cache and "-x" not in cc_args and "-include" not in cc_args and \
+          not self.is_dry_run_mode_enabled():
+      compile_func = lambda: self._spawn_compiler(obj, src, cc_args,
+                                                  extra_postargs)
+      if cache.compile(self, obj, src, cc_args, extra_postargs, compile_func):
+        return
+    self._spawn_compiler(obj, src, cc_args, extra_postargs)
+
+  def _spawn_compiler(self, obj, src, cc_args, extra_postargs):
     compiler = self.get_executable()
+    # The output is captured, so that diagnostics of concurrent compilers do
+    # not interleave.
+    try:
+      result = spawn.spawn([compiler] + cc_args +
+                           self._gen_depfile_options(obj) +
+                           [src, '-o', obj] + extra_postargs,
+                           debug=self.get_verbosity_level(),
+                           dry_run=self.is_dry_run_mode_enabled(),
+                           capture=True)
+    except spawn.ExecutionError, e:
+      if not e.result:
+        raise CompileError(e)
+      raise CompileError("%s\n%s" % (e, e.result.stderr.rstrip()))
+    if result.stdout or result.stderr:
+      sys.stderr.write(result.stdout + result.stderr)
+
+  def _gen_depfile_options(self, obj):
+    return ["-MD", "-MF", self.get_depfile(obj)]
+
+  def _spawn_with_response_file(self, cmd, response_dir, **kwargs):
+    """Spawns `cmd`, its arguments go through a response file in
+    `response_dir` if the command line is too long.
+    """
+    if not batch.needs_response_file(cmd) or \
+          self.is_dry_run_mode_enabled():
+      return spawn.spawn(cmd, debug=self.get_verbosity_level(),
+                         dry_run=self.is_dry_run_mode_enabled(), **kwargs)
+    response_file = path_utils.join(
+      response_dir, "args.%d.%d.rsp" % (os.getpid(),
+                                        threading.current_thread().ident))
+    batch.write_response_file(response_file, cmd[1:])
     try:
-      spawn.spawn([compiler] + cc_args + [src, '-o', obj] + extra_postargs,
-                  debug=self.get_verbosity_level(),
-                  dry_run=self.is_dry_run_mode_enabled())
-    except spawn.ExecutionError, msg:
-      raise Exception(msg) # CompileError
+      return spawn.spawn([cmd[0], "@" + response_file],
+                         debug=self.get_verbosity_level(), **kwargs)
+    finally:
+      os.remove(response_file)
+
+  def _compile_batch(self, output_dir, sources, cc_args, extra_postargs,
+                     pp_opts):
+    cmd = [self.get_executable()] + batch.make_paths_absolute(cc_args)
+    if self._gen_depfile_options(""):
+      cmd.append("-MD")
+    cmd += [path_utils.abspath(src) for src in sources] + \
+        batch.make_paths_absolute(extra_postargs)
+    try:
+      result = self._spawn_with_response_file(cmd, output_dir, cwd=output_dir,
+                                              capture=True)
+    except spawn.ExecutionError, e:
+      # Objects of the sources that did compile are recompiled one by one.
+      for src in sources:
+        depfile = self._get_batch_depfile(output_dir, src)
+        if path_utils.exists(depfile):
+          os.remove(depfile)
+      if not e.result:
+        raise CompileError(e)
+      raise CompileError("%s\n%s" % (e, e.result.stderr.rstrip()))
+    if result.stdout or result.stderr:
+      sys.stderr.write(result.stdout + result.stderr)
+
+  def _get_batch_depfile(self, output_dir, src):
+    """Returns the depfile written by batched compilation of `src`."""
+    return path_utils.join(output_dir, batch.get_default_object_filename(
+        src, ".d"))
+
+  def _move_batch_outputs(self, obj, src):
+    depfile = self._get_batch_depfile(path_utils.dirname(obj), src)
+    if path_utils.exists(depfile):
+      os.rename(depfile, self.get_depfile(obj))
 
   def _link(self, objects, output_dir=None, libraries=None, library_dirs=None,
               debug=False, extra_preargs=None, extra_postargs=None,
@@ -72,7 +155,7 @@ class CC(CustomCCompiler):
     if extra_postargs:
       ld_options.extend(extra_postargs)
     ld_options += (objects + lib_options + ['-o', self.get_output_filename()])
-    path_utils.mkpath(path_utils.dirname(self.get_output_filename()))
+    fs_snapshot.mkpath(path_utils.dirname(self.get_output_filename()))
     try:
       linker = self.get_executable()
       # skip over environment variable settings if /usr/bin/env is used to set
@@ -86,8 +169,9 @@ class CC(CustomCCompiler):
           i = i + 1
       # TODO: resolve this
       #linker[i] = self.get_executable('compiler_cxx')[i]
-      spawn.spawn([linker] + ld_options, debug=self.get_verbosity_level(),
-                  dry_run=self.is_dry_run_mode_enabled())
+      self._spawn_with_response_file(
+        [linker] + ld_options,
+        path_utils.dirname(path_utils.abspath(self.get_output_filename())))
     except Exception, e:
       raise Exception, e
 
@@ -17,6 +17,7 @@
 
 import inspect
 
+from bb.tools import toolchains
 from bb.utils import logging
 from bb.utils import executable
 from bb.utils import typecheck
@@ -24,11 +25,22 @@ from bb.utils import path_utils
 
 logger = logging.get_logger("bb")
 
+class CompileError(Exception):
+  """Indicates that one or more source files failed to compile."""
+
+  def __init__(self, message, errors=None):
+    Exception.__init__(self, message)
+    # A list of (source, error message) pairs.
+    self.errors = errors or []
+
 # TODO: add sources. When compile() is calling, translate sources to files.
 class Compiler(executable.ExecutableWrapper):
   """The base compiler class."""
 
   default_output_filename = None
+  # How the toolchain of the executable is probed, see
+  # :mod:`bb.tools.toolchains`.
+  toolchain_probe = toolchains.GENERIC_PROBE
 
   def __init__(self, verbose=0, files=[], dry_run=False):
     executable.ExecutableWrapper.__init__(self, verbose=verbose, dry_run=dry_run)
@@ -93,6 +105,31 @@ class Compiler(executable.ExecutableWrapper):
     else:
       raise TypeError("Unknown path type '%s' of '%s'" % (type(path), path))
 
+  def get_toolchain(self):
+    """Returns :class:`~bb.tools.toolchains.Toolchain` of the executable or
+    ``None`` if the executable cannot be found.
+    """
+    exe = self.get_executable()
+    if not exe:
+      return None
+    return toolchains.get_registry().probe(exe, self.toolchain_probe)
+
+  def check_executable(self):
+    exe = self.get_executable()
+    return bool(exe and toolchains.get_registry().resolve(exe))
+
+  def get_identity(self):
+    """Returns a tuple that identifies the compiler: class name, resolved
+    path, modification time and size of the executable, and the version and
+    target of the toolchain. The toolchain is probed once per executable, see
+    :mod:`bb.tools.toolchains`.
+    """
+    toolchain = self.get_toolchain()
+    if not toolchain:
+      return (self.__class__.__name__, self.get_executable())
+    return (self.__class__.__name__,) + \
+        toolchain.get_identity(self.toolchain_probe)
+
   def get_language(self, *arg_list, **arg_dict):
     raise NotImplementedError
 
@@ -0,0 +1,223 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Compiler cache that works inside of
+:func:`bb.tools.compilers.cc.CC._compile`, so that every compiler derived from
+:class:`~bb.tools.compilers.cc.CC` (GCC, PropGCC, Catalina) and every rule
+type benefits from it.
+
+In preprocessor mode a source is preprocessed first. The object is looked up
+by the digest of the compiler identity, its options and the normalized
+preprocessor output, where line markers and blank lines are dropped unless
+debug info is requested (see :func:`has_debug_info`), so that the same code
+compiled in a different build directory or checkout hits the cache. The compiler is invoked only on a miss.
+
+In direct mode (the default) the preprocessor is skipped as well: the digest
+of the compiler identity, its options and the source refers to a manifest,
+which lists include files seen by the preprocessor for previous compilations
+with their digests. If all the files of some manifest entry are unchanged, its
+object is restored. Otherwise the lookup falls back to preprocessor mode, and
+the manifest gets a new entry.
+
+Objects and manifests are kept in the action cache, see
+:mod:`bb.tools.action_cache`. The mode is defined by `compilercache` option
+of `b3` section in the user config: ``direct``, ``preprocessor`` or ``off``.
+"""
+
+import hashlib
+import os
+import re
+import threading
+
+import bb.config
+from bb.tools import action_cache
+from bb.utils import logging
+from bb.utils import path_utils
+from bb.utils import spawn
+
+logger = logging.get_logger("bb")
+
+DIRECT_MODE = "direct"
+PREPROCESSOR_MODE = "preprocessor"
+MODES = (DIRECT_MODE, PREPROCESSOR_MODE)
+
+_LINE_MARKER_REGEXP = re.compile(r'^#(?:line)?\s*\d+\s+"((?:[^"\\]|\\.)*)"')
+# Options that affect only preprocessing, thus they are reflected by the
+# preprocessor output.
+_PREPROCESSOR_OPTIONS = ("-I", "-D", "-U")
+
+def has_debug_info(cc_args):
+  """Returns ``True`` if some of `cc_args` options (e.g. ``-g``, ``-g3`` or
+  ``-ggdb``) requests debug info.
+  """
+  return bool([arg for arg in cc_args if arg.startswith("-g")])
+
+def parse_preprocessor_output(path, keep_lines=False):
+  """Returns a tuple of the digest of normalized output of the preprocessor
+  from file `path`, and a sorted list of files that it comes from. Line
+  markers and blank lines are not taken into account unless `keep_lines` is
+  ``True``, e.g. the line table of debug info depends on them. Markers of the working directory (see
+  `-fworking-directory` GCC option) and other names that are not regular
+  files are skipped.
+  """
+  sha1 = hashlib.sha1()
+  files = set()
+  with open(path) as handle:
+    for line in handle:
+      if line.startswith("#"):
+        match = _LINE_MARKER_REGEXP.match(line)
+        if match:
+          name = match.group(1).replace('\\"', '"').replace("\\\\", "\\")
+          if not name.startswith("<") and path_utils.isfile(name):
+            files.add(path_utils.abspath(name))
+          if not keep_lines:
+            continue
+      if keep_lines or line.strip():
+        sha1.update(line)
+  return sha1.hexdigest(), sorted(files)
+
+def write_depfile(path, target, deps):
+  """Writes make-style depfile `path`, see
+  :func:`bb.tools.compilers.dependencies.parse_depfile`.
+  """
+  escaped = [dep.replace(" ", "\\ ") for dep in deps]
+  with open(path, "w") as handle:
+    handle.write("%s: %s\n" % (target, " \\\n  ".join(escaped)))
+
+class CompilerCache(object):
+  """Caches objects compiled by compilers in `mode` (direct or preprocessor)
+  in action cache `cache`.
+  """
+
+  def __init__(self, cache, mode=DIRECT_MODE):
+    if mode not in MODES:
+      raise ValueError("Unknown compiler cache mode %s, expected one of: %s" %
+                       (mode, ", ".join(MODES)))
+    self._cache = cache
+    self._mode = mode
+    self._lock = threading.Lock()
+    self.direct_hits = 0
+    self.preprocessed_hits = 0
+    self.misses = 0
+
+  def get_mode(self):
+    return self._mode
+
+  def get_action_cache(self):
+    return self._cache
+
+  def _count(self, counter):
+    with self._lock:
+      setattr(self, counter, getattr(self, counter) + 1)
+
+  def _get_direct_key(self, compiler, src, cc_args, extra_postargs):
+    argv = [path_utils.abspath(src)] + cc_args + extra_postargs
+    # Relative include directories are resolved against the current
+    # directory.
+    if [arg for arg in cc_args
+        if arg.startswith("-I") and not path_utils.isabs(arg[2:])]:
+      argv.append(os.getcwd())
+    return action_cache.action_key(compiler.get_identity(), argv, [src])
+
+  def _get_object_key(self, compiler, src, cc_args, extra_postargs,
+                      output_digest):
+    argv = [arg for arg in cc_args
+            if not arg.startswith(_PREPROCESSOR_OPTIONS)] + extra_postargs
+    # Debug info keeps paths of the sources.
+    if has_debug_info(cc_args):
+      argv += [os.getcwd(), path_utils.abspath(src)]
+    return action_cache.action_key(compiler.get_identity(),
+                                   argv + [output_digest])
+
+  def _restore(self, compiler, obj, object_key, files):
+    if not self._cache.restore(object_key, {"object": obj}):
+      return False
+    depfile = compiler._gen_depfile_options(obj) and compiler.get_depfile(obj)
+    if depfile:
+      write_depfile(depfile, obj, files)
+    return True
+
+  def compile(self, compiler, obj, src, cc_args, extra_postargs, compile_func):
+    """Restores the object `obj` of `src` compiled by `compiler` with
+    `cc_args` and `extra_postargs` options, or calls `compile_func()` to
+    compile it and stores the object. Returns ``False`` if the object cannot
+    be cached, e.g. the source cannot be preprocessed, so that the caller
+    has to compile it as usual.
+    """
+    direct_key = None
+    if self._mode == DIRECT_MODE:
+      direct_key = self._get_direct_key(compiler, src, cc_args,
+                                        extra_postargs)
+      entry = self._cache.find_manifest_entry(direct_key)
+      if entry and self._restore(compiler, obj, entry["key"],
+                                 sorted(entry["files"])):
+        self._count("direct_hits")
+        logger.info("Restored %s from compiler cache" % obj)
+        return True
+    output = obj + ".i"
+    try:
+      spawn.spawn([compiler.get_executable()] +
+                  [arg for arg in cc_args if arg != "-c"] +
+                  ["-E", src, "-o", output] + extra_postargs,
+                  dry_run=compiler.is_dry_run_mode_enabled(), capture=True)
+      output_digest, files = parse_preprocessor_output(
+        output, keep_lines=has_debug_info(cc_args))
+    except (spawn.ExecutionError, IOError), e:
+      logger.debug("Cannot preprocess %s, compiling without cache: %s" %
+                   (src, e))
+      return False
+    finally:
+      if path_utils.exists(output):
+        os.remove(output)
+    object_key = self._get_object_key(compiler, src, cc_args, extra_postargs,
+                                      output_digest)
+    if self._restore(compiler, obj, object_key, files):
+      self._count("preprocessed_hits")
+      logger.info("Restored %s from compiler cache" % obj)
+    else:
+      self._count("misses")
+      compile_func()
+      self._cache.store(object_key, {"object": obj})
+    if direct_key:
+      self._cache.add_manifest_entry(direct_key, object_key, files)
+    return True
+
+def new_compiler_cache(cache):
+  """Returns :class:`CompilerCache` that keeps objects in action cache
+  `cache`, configured by `compilercache` option of `b3` section of user
+  settings, or ``None`` if the compiler cache is turned off.
+  """
+  settings = bb.config.user_settings
+  mode = DIRECT_MODE
+  if settings.has_option("b3", "compilercache"):
+    mode = settings.get("b3", "compilercache")
+  if mode == "off":
+    return None
+  return CompilerCache(cache, mode)
+
+_compiler_cache = None
+
+def get_compiler_cache():
+  """Returns the current compiler cache or ``None`` if it is disabled."""
+  return _compiler_cache
+
+def set_compiler_cache(cache):
+  global _compiler_cache
+  if cache is not None and not isinstance(cache, CompilerCache):
+    raise TypeError("'cache' has to be a CompilerCache: %s" % cache)
+  _compiler_cache = cache
+  return cache
@@ -0,0 +1,87 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools import action_cache
+from bb.tools.compilers import compiler_cache
+from bb.tools.compilers import dependencies
+from bb.tools.compilers.cc import CC
+
+class CompilerCacheTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.cache = compiler_cache.set_compiler_cache(
+      compiler_cache.CompilerCache(
+        action_cache.ActionCache(os.path.join(self.dir, "cache"))))
+    self.compiler = CC()
+    self.src = self.write("a.c", '#include "a.h"\nint a(void) { return A; }\n')
+    self.write("a.h", "#define A 1\n")
+
+  def teardown(self):
+    compiler_cache.set_compiler_cache(None)
+
+  def compile(self, name):
+    obj = os.path.join(self.dir, name)
+    self.compiler._compile(obj, self.src, ".c", ["-c"], [], [])
+    self.assert_true(os.path.exists(obj))
+    return obj
+
+  def get_counters(self):
+    return (self.cache.direct_hits, self.cache.preprocessed_hits,
+            self.cache.misses)
+
+  def test_compile(self):
+    self.compile("1.o")
+    self.assert_equal(self.get_counters(), (0, 0, 1))
+    obj = self.compile("2.o")
+    self.assert_equal(self.get_counters(), (1, 0, 1))
+    deps = dependencies.parse_depfile(self.compiler.get_depfile(obj))
+    self.assert_equal(sorted([dep for dep in deps
+                              if dep.startswith(self.dir)]),
+                      [os.path.join(self.dir, "a.c"),
+                       os.path.join(self.dir, "a.h")])
+    # The preprocessor output is the same.
+    self.write("a.h", "/* A */\n#define A 1\n")
+    self.compile("3.o")
+    self.assert_equal(self.get_counters(), (1, 1, 1))
+    self.write("a.h", "#define A 2\n")
+    self.compile("4.o")
+    self.assert_equal(self.get_counters(), (1, 1, 2))
+
+  def test_parse_preprocessor_output(self):
+    output = os.path.join(self.dir, "a.i")
+    # Debug info makes GCC write a marker of the working directory.
+    self.compiler._spawn_compiler(output, self.src, ["-g", "-E"], [])
+    _, files = compiler_cache.parse_preprocessor_output(output)
+    self.assert_equal([path for path in files if path.startswith(self.dir)],
+                      [os.path.join(self.dir, "a.c"),
+                       os.path.join(self.dir, "a.h")])
+    self.assert_false([path for path in files if not os.path.isfile(path)])
+
+  def test_compile_with_debug_info(self):
+    self.compiler._compile(os.path.join(self.dir, "1.o"), self.src, ".c",
+                           ["-c", "-g"], [], [])
+    self.compiler._compile(os.path.join(self.dir, "2.o"), self.src, ".c",
+                           ["-c", "-g"], [], [])
+    self.assert_equal(self.get_counters(), (1, 0, 1))
+    # Moved code changes the line table of debug info.
+    self.write("a.c", '#include "a.h"\n\nint a(void) { return A; }\n')
+    self.compiler._compile(os.path.join(self.dir, "3.o"), self.src, ".c",
+                           ["-c", "-g"], [], [])
+    self.assert_equal(self.get_counters(), (1, 0, 2))
+    self.compiler._compile(os.path.join(self.dir, "4.o"), self.src, ".c",
+                           ["-c"], [], [])
+    self.write("a.c", '#include "a.h"\nint a(void) { return A; }\n')
+    self.compiler._compile(os.path.join(self.dir, "5.o"), self.src, ".c",
+                           ["-c"], [], [])
+    self.assert_equal(self.get_counters(), (1, 1, 3))
+    self.assert_true(compiler_cache.has_debug_info(["-c", "-ggdb"]))
+    self.assert_false(compiler_cache.has_debug_info(["-c", "-O2"]))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -18,17 +18,27 @@
 # TODO: Move linker specific API from Compiler class to Linker class and start
 # using it.
 
+import hashlib
 import os
 import os.path
 import sys
+import threading
 import time
+from multiprocessing.pool import ThreadPool
 
 import bb.config
-from bb.tools.compilers.compiler import Compiler
+from bb.tools import action_cache
+from bb.tools.compilers.compiler import Compiler, CompileError
+from bb.tools.compilers import batch
+from bb.tools.compilers import dependencies
+from bb.tools.compilers import pch
+from bb.tools.compilers import unity
+from bb.utils import fs_snapshot
 from bb.utils import path_utils
 from bb.utils import typecheck
 from bb.utils import logging
 from bb.utils import executable
+from bb.utils import spawn
 
 logger = logging.get_logger("bb")
 
@@ -64,6 +74,242 @@ class Linker(object):
     logger.info("Linking executable: %s" % binary_filename)
     self._link(objects, *list_args, **dict_args)
 
+_pch_locks = dict()
+_pch_locks_lock = threading.Lock()
+
+def _get_pch_lock(path):
+  """Returns a lock that serializes builds of the precompiled header `path`
+  by binaries built at the same time.
+  """
+  with _pch_locks_lock:
+    return _pch_locks.setdefault(path, threading.Lock())
+
+class CompileJob(object):
+  """Compiles the objects of a single :func:`CustomCCompiler.compile` call.
+  The job keeps the state shared by its steps: options, unity groups,
+  precompiled headers, batches and unity objects that failed to compile.
+  """
+
+  def __init__(self, compiler, build, cc_options, extra_postopts, pp_options,
+               depends=None):
+    self.compiler = compiler
+    # Maps object file to a tuple of its source and source extension.
+    self.build = build
+    self.cc_options = cc_options
+    self.extra_postopts = extra_postopts
+    self.pp_options = pp_options
+    self.depends = depends or []
+    # Maps unity object to objects of its sources.
+    self.unity_groups = dict()
+    # Maps object file to a tuple of precompiled header options and
+    # dependencies.
+    self.precompiled_headers = dict()
+    # Maps batch name to its jobs.
+    self.batches = dict()
+    # Maps unity objects that failed to compile to objects of their sources.
+    self.fallbacks = dict()
+    self.cache = action_cache.get_action_cache()
+
+  def get_cc_options(self, src):
+    return self.cc_options + self.compiler.get_source_options(src)
+
+  def get_pch_options(self, obj):
+    return self.precompiled_headers.get(obj, ([], []))[0]
+
+  def run(self, objects):
+    """Compiles out of date `objects`. Returns a tuple of the list of objects
+    to be linked and the number of compiled objects.
+    """
+    compiler = self.compiler
+    if compiler.is_unity_build_enabled():
+      objects, self.unity_groups = compiler._setup_unity_build(
+        objects, self.build, self.cc_options, self.extra_postopts)
+    out_of_date = self.find_out_of_date(objects)
+    if out_of_date and compiler.is_precompiled_headers_enabled() and \
+          not compiler.is_dry_run_mode_enabled():
+      self.precompiled_headers = compiler._setup_precompiled_header(
+        self.build, out_of_date, self.cc_options, self.extra_postopts,
+        self.pp_options)
+    if compiler.is_batch_compile_enabled() and \
+          not compiler.is_dry_run_mode_enabled():
+      out_of_date, self.batches = compiler._setup_batches(
+        out_of_date, self.unity_groups, self.precompiled_headers)
+    compiler._run_jobs(self.compile_object, out_of_date)
+    num_compiled = len(out_of_date) + \
+        sum([len(members) - 1 for members in self.batches.values()])
+    objects = [member for obj in objects
+               for member in self.fallbacks.get(obj, [obj])]
+    return objects, num_compiled
+
+  def find_out_of_date(self, objects):
+    """Returns a list of jobs, tuples of object, source, source extension and
+    command digest, for out of date `objects`.
+    """
+    out_of_date = []
+    for obj in objects:
+      if obj not in self.build:
+        continue
+      command_digest = self.check_object(obj)
+      if command_digest:
+        src, ext = self.build[obj]
+        out_of_date.append((obj, src, ext, command_digest))
+    return out_of_date
+
+  def check_object(self, obj):
+    """Returns the command digest of `obj` if it is out of date."""
+    compiler = self.compiler
+    src, ext = self.build[obj]
+    command_digest = compiler._get_command_digest(src, self.get_cc_options(src),
+                                                  self.extra_postopts)
+    if compiler._is_up_to_date(obj, command_digest):
+      logger.debug("%s is up to date" % obj)
+      compiler._dependencies[obj] = \
+          dependencies.DependencyRecord.load(obj).get_dependencies()
+      return None
+    return command_digest
+
+  def get_cache_argv(self, src):
+    # Relative paths are resolved against the current directory.
+    return [os.getcwd(), src] + self.get_cc_options(src) + self.extra_postopts
+
+  def get_direct_key(self, src):
+    """Returns the key of the action cache manifest of the object of `src`.
+    Headers are known once the source is compiled, the manifest keeps them
+    with their digests.
+    """
+    return action_cache.action_key(self.compiler.get_fingerprint_data(),
+                                   self.get_cache_argv(src), [src])
+
+  def restore_object(self, obj, src, command_digest):
+    """Returns ``True`` if the object `obj` has been restored from the action
+    cache.
+    """
+    compiler = self.compiler
+    outputs = compiler._get_compile_outputs(obj)
+    # Outputs can be hardlinks to the action cache, never overwrite them.
+    for path in outputs.values():
+      if path_utils.lexists(path):
+        os.remove(path)
+    # Headers are known from the depfile only, see store_object().
+    if not self.cache or "depfile" not in outputs:
+      return False
+    entry = self.cache.find_manifest_entry(self.get_direct_key(src))
+    if not entry or not self.cache.restore(entry["key"], outputs):
+      return False
+    logger.info("Restored %s from cache" % obj)
+    self.record_object(obj, src, command_digest)
+    return True
+
+  def store_object(self, obj, src):
+    """Stores the outputs of compiled object `obj` in the action cache. The
+    object is not stored unless the compiler has written its depfile, since
+    the included headers cannot be resolved reliably otherwise.
+    """
+    outputs = self.compiler._get_compile_outputs(obj)
+    depfile = outputs.get("depfile")
+    if not self.cache or not depfile or not path_utils.exists(depfile):
+      return
+    pch_deps = self.precompiled_headers.get(obj, ([], []))[1]
+    files = sorted(set([path_utils.abspath(dep) for dep in
+                        [src] + dependencies.parse_depfile(depfile) +
+                        self.depends + pch_deps]))
+    key = action_cache.action_key(self.compiler.get_fingerprint_data(),
+                                  self.get_cache_argv(src), files)
+    self.cache.store(key, outputs)
+    self.cache.add_manifest_entry(self.get_direct_key(src), key, files)
+
+  def record_object(self, obj, src, command_digest):
+    pch_deps = self.precompiled_headers.get(obj, ([], []))[1]
+    self.compiler._record_dependencies(obj, src, command_digest,
+                                       self.depends + pch_deps)
+
+  def compile_object(self, obj, src, ext, command_digest):
+    if obj in self.batches:
+      return self.compile_batch(self.batches[obj])
+    if obj in self.unity_groups:
+      return self.compile_unity_object(obj, src, ext, command_digest)
+    return self.compile_single_object(obj, src, ext, command_digest)
+
+  def compile_single_object(self, obj, src, ext, command_digest):
+    compiler = self.compiler
+    if compiler.is_dry_run_mode_enabled():
+      logger.info("Compiling %s" % src)
+      return
+    if self.restore_object(obj, src, command_digest):
+      return
+    logger.info("Compiling %s" % src)
+    # Note: we pass a copy of files, options, etc. since we
+    # need to privent their modification
+    compiler._compile(obj, src, ext,
+                      self.get_cc_options(src) + self.get_pch_options(obj),
+                      self.extra_postopts, self.pp_options)
+    self.store_object(obj, src)
+    self.record_object(obj, src, command_digest)
+
+  def compile_unity_object(self, obj, src, ext, command_digest):
+    """Compiles unity object `obj`. If the unity source fails to compile, its
+    sources are compiled one by one instead.
+    """
+    try:
+      self.compile_single_object(obj, src, ext, command_digest)
+      return
+    except CompileError, e:
+      members = self.unity_groups[obj]
+      logger.warning("Unity source %s failed to compile, compiling its %d "
+                     "sources one by one: %s" % (src, len(members), e))
+    # Remember the failure while the group sources are the same.
+    self.compiler._save_record(
+      unity.get_failure_record_filename(obj),
+      dependencies.DependencyRecord(command_digest,
+                                    [src] + [self.build[member][0]
+                                             for member in members]))
+    for member in members:
+      member_digest = self.check_object(member)
+      if member_digest:
+        member_src, member_ext = self.build[member]
+        self.compile_single_object(member, member_src, member_ext,
+                                   member_digest)
+    self.fallbacks[obj] = members
+
+  def compile_batch(self, members):
+    """Compiles a batch of jobs by a single compiler invocation. If the batch
+    fails to compile, its sources are compiled one by one instead.
+    """
+    compiler = self.compiler
+    pending = []
+    for obj, src, ext, command_digest in members:
+      if not self.restore_object(obj, src, command_digest):
+        pending.append((obj, src, ext, command_digest))
+    if len(pending) < 2:
+      for obj, src, ext, command_digest in pending:
+        self.compile_single_object(obj, src, ext, command_digest)
+      return
+    sources = [src for _, src, _, _ in pending]
+    try:
+      logger.info("Compiling %s" % ", ".join(sources))
+      compiler._compile_batch(path_utils.dirname(pending[0][0]), sources,
+                              self.get_cc_options(sources[0]) +
+                              self.get_pch_options(pending[0][0]),
+                              self.extra_postopts, self.pp_options)
+    except CompileError, e:
+      logger.warning("Batch of %d sources failed to compile, compiling them "
+                     "one by one: %s" % (len(sources), e))
+      errors = []
+      for obj, src, ext, command_digest in pending:
+        try:
+          self.compile_single_object(obj, src, ext, command_digest)
+        except CompileError, e:
+          errors.append((src, str(e)))
+      if errors:
+        raise CompileError("%d file(s) failed to compile: %s" %
+                           (len(errors), ", ".join([src for src, _
+                                                    in errors])), errors)
+      return
+    for obj, src, ext, command_digest in pending:
+      compiler._move_batch_outputs(obj, src)
+      self.store_object(obj, src)
+      self.record_object(obj, src, command_digest)
+
 class CustomCCompiler(Compiler):
   """Abstract base class to define the interface of the standard C compiler that
   must be implemented by real compiler class.
@@ -92,6 +338,10 @@ class CustomCCompiler(Compiler):
   default_output_filename = "a.out"
   source_extensions = None
   object_extension = None
+  supports_precompiled_headers = False
+  supports_batch_compile = False
+  # Flag sets tried per module by b3 tune, see bb.tools.b3.tuner.
+  tune_flag_sets = (("-Os",), ("-O1",), ("-O2",), ("-O3",))
 
   def __init__(self, verbose=0, dry_run=False):
     Compiler.__init__(self, verbose, dry_run)
@@ -116,7 +366,89 @@ class CustomCCompiler(Compiler):
     self.set_source_extensions(self.source_extensions)
     self._extra_preopts = list()
     self._extra_postopts = list()
+    # Maps source file to a list of options of this source only.
+    self._source_options = dict()
     self._linker = None
+    self._force = False
+    self._precompiled_headers = False
+    # Unity build group size: 0 disables unity build, None picks the size
+    # adaptively.
+    self._unity_group_size = 0
+    # Batch size: 0 disables batched compilation, None picks the size
+    # adaptively.
+    self._batch_size = 0
+    # Maps object file to a list of its dependencies.
+    self._dependencies = dict()
+
+  def enable_force_mode(self):
+    """Enables force mode: all the objects will be rebuilt regardless of
+    dependencies.
+    """
+    self._force = True
+
+  def disable_force_mode(self):
+    self._force = False
+
+  def is_force_mode_enabled(self):
+    return self._force
+
+  def enable_precompiled_headers(self):
+    """Enables precompiled headers: leading includes shared by translation
+    units are precompiled once, see :mod:`bb.tools.compilers.pch`. Has no
+    effect if the compiler does not support precompiled headers.
+    """
+    self._precompiled_headers = True
+
+  def disable_precompiled_headers(self):
+    self._precompiled_headers = False
+
+  def is_precompiled_headers_enabled(self):
+    return self._precompiled_headers and self.supports_precompiled_headers
+
+  def enable_unity_build(self, group_size=None):
+    """Enables unity build: sources are compiled in groups of `group_size`,
+    see :mod:`bb.tools.compilers.unity`. The size is picked adaptively if
+    `group_size` is not provided.
+    """
+    if group_size is not None and (not typecheck.is_int(group_size) or
+                                   group_size < 1):
+      raise TypeError("'group_size' has to be a positive int: %s" % group_size)
+    self._unity_group_size = group_size
+
+  def disable_unity_build(self):
+    self._unity_group_size = 0
+
+  def is_unity_build_enabled(self):
+    return self._unity_group_size != 0
+
+  def get_unity_group_size(self):
+    """Returns the number of sources per unity group or ``None`` if the size
+    is picked adaptively.
+    """
+    return self._unity_group_size
+
+  def enable_batch_compile(self, batch_size=None):
+    """Enables batched compilation: up to `batch_size` sources are compiled by
+    a single compiler invocation, see :mod:`bb.tools.compilers.batch`. The
+    size is picked adaptively if `batch_size` is not provided. Has no effect
+    if the compiler does not support batched compilation.
+    """
+    if batch_size is not None and (not typecheck.is_int(batch_size) or
+                                   batch_size < 1):
+      raise TypeError("'batch_size' has to be a positive int: %s" % batch_size)
+    self._batch_size = batch_size
+
+  def disable_batch_compile(self):
+    self._batch_size = 0
+
+  def is_batch_compile_enabled(self):
+    return self._batch_size != 0 and self.supports_batch_compile
+
+  def get_batch_size(self):
+    """Returns the number of sources per batch or ``None`` if the size is
+    picked adaptively.
+    """
+    return self._batch_size
 
   def set_output_dir(self, path):
     if not typecheck.is_string(path):
@@ -134,6 +466,14 @@ class CustomCCompiler(Compiler):
       return self._output_dir
     return bb.config.user_settings.get("b3", "builddir")
 
+  def get_fingerprint_data(self):
+    """Returns a list of values that affect the output of this compiler: its
+    identity, macros, include directories, libraries and extra options.
+    """
+    return [self.get_identity(), self.macros, self.get_include_dirs(),
+            self.get_extra_preopts(), self.get_extra_postopts(),
+            self.libraries, self.library_dirs]
+
   def get_default_ccompiler(osname=None, platform=None):
     """Determine the default compiler to use for the given `platform`.
 
@@ -214,7 +554,8 @@ class CustomCCompiler(Compiler):
     """
     if not typecheck.is_string(path):
       raise TypeError()
-    self._include_dirs.append(path)
+    if path not in self._include_dirs:
+      self._include_dirs.append(path)
 
   def get_include_dirs(self):
     return self._include_dirs
@@ -447,11 +788,38 @@ class CustomCCompiler(Compiler):
   def get_extra_postopts(self):
     return self._extra_postopts
 
+  def set_source_options(self, path, options):
+    """Sets `options` that are passed to the compiler when compiling the
+    source `path` only, e.g. options of the library the source comes from.
+    They follow the common options, thus take precedence over them.
+    """
+    if not typecheck.is_list(options):
+      raise TypeError("'options' has to be a list: %s" % options)
+    path = path_utils.abspath(path)
+    if options:
+      self._source_options[path] = list(options)
+    elif path in self._source_options:
+      del self._source_options[path]
+
+  def get_source_options(self, path):
+    return self._source_options.get(path_utils.abspath(path), [])
+
   def compile(self, files=[], output_file=None, macros=None,
               include_dirs=[], debug=False, extra_preopts=None,
               extra_postopts=[], depends=None, link=True):
+    """Compiles source files and links them unless `link` is ``False``. Only
+    objects that are out of date are recompiled, unless force mode is
+    enabled. An object is out of date if the compile command has been changed
+    or one of its dependencies (source, headers and files from `depends` list)
+    has been modified. Out of date objects are compiled concurrently, see
+    :func:`bb.utils.spawn.set_max_jobs`. Linking is skipped if no object has
+    been recompiled and the output file is up to date, and is never started
+    if some object has failed to compile.
+    """
     if not typecheck.is_list(files):
       raise TypeError("'sources' must be a list")
+    # Dependencies are reported for this call only.
+    self._dependencies = dict()
     files = files + self.get_files()
     # Play with extra preopts and postopts
     extra_preopts = self.get_extra_preopts()
@@ -463,20 +831,327 @@ class CustomCCompiler(Compiler):
     macros, objects, extra_postopts, pp_options, build = \
         self._setup_compile(files, macros, include_dirs, extra_postopts, depends)
     cc_options = self._gen_cc_options(pp_options, debug, extra_preopts)
-    for obj in objects:
-      try:
-        src, ext = build[obj]
-      except KeyError:
-        continue
-      logger.info("Compiling %s" % src)
-      # Note: we pass a copy of files, options, etc. since we
-      # need to privent their modification
-      if not self.is_dry_run_mode_enabled():
-        self._compile(obj, src, ext, list(cc_options), extra_postopts, pp_options)
+    job = CompileJob(self, build, cc_options, extra_postopts, pp_options,
+                     depends)
+    objects, num_compiled = job.run(objects)
     if link is True:
-      self.link(objects, self.get_output_filename())
+      output_filename = self.get_output_filename()
+      # Keep the link record in output directory rather than next to binary.
+      link_record = path_utils.join(self.get_output_dir(),
+                                    path_utils.basename(output_filename))
+      command_digest = self._get_command_digest(objects, output_filename)
+      if num_compiled or not self._is_up_to_date(output_filename,
+                                                 command_digest, link_record):
+        self._cached_link(objects, output_filename)
+        if not self.is_dry_run_mode_enabled():
+          self._save_record(link_record,
+                            dependencies.DependencyRecord(command_digest,
+                                                          objects))
+      else:
+        logger.debug("%s is up to date" % output_filename)
     return objects
 
+  def _setup_unity_build(self, objects, build, cc_options, extra_postopts):
+    """Groups the sources of `objects` into unity sources and adds them to
+    `build` dict. Returns a tuple of the list of objects to be linked, where
+    objects of grouped sources are replaced by unity objects, and a dict that
+    maps each unity object to objects of its sources. Groups that failed to
+    compile before and have not been changed since are not formed. Sources
+    with different options (see :func:`set_source_options`) are never
+    grouped together.
+    """
+    sources = dict()
+    for obj in objects:
+      src = build[obj][0]
+      sources.setdefault(tuple(self.get_source_options(src)),
+                         []).append(unity.SourceInfo(src))
+    objects_by_source = dict([(build[obj][0], obj) for obj in objects])
+    group_size = self.get_unity_group_size() or \
+        unity.get_group_size(len(objects), spawn.get_max_jobs())
+    unity_dir = path_utils.join(self.get_output_dir(), unity.UNITY_DIR)
+    result = []
+    groups = dict()
+    i = 0
+    for options, infos in sorted(sources.items()):
+      for group in unity.split(infos, group_size):
+        members = [objects_by_source[source.path] for source in group]
+        if len(members) < 2:
+          result.extend(members)
+          continue
+        ext = path_utils.splitext(group[0].path)[1]
+        src = path_utils.join(unity_dir, "unity%d%s" % (i, ext))
+        i += 1
+        fs_snapshot.mkpath(unity_dir)
+        unity.write_unity_source(src, group)
+        self.set_source_options(src, list(options))
+        obj = self.get_object_filenames([src])[0]
+        failure = dependencies.DependencyRecord.load(
+          unity.get_failure_record_filename(obj))
+        if failure and failure.is_up_to_date(
+            self._get_command_digest(src, cc_options + list(options),
+                                     extra_postopts)):
+          logger.debug("%s failed to compile before, skip it" % src)
+          result.extend(members)
+          continue
+        fs_snapshot.mkpath(path_utils.dirname(obj))
+        build[obj] = (src, ext)
+        groups[obj] = members
+        result.append(obj)
+    return result, groups
+
+  def _setup_batches(self, out_of_date, unity_groups, precompiled_headers):
+    """Groups out of date objects that share output directory, source
+    extension, precompiled header and source options into batches, see
+    :mod:`bb.tools.compilers.batch`. Returns a tuple of the list of jobs,
+    where batched objects are replaced by a job per batch, and a dict that
+    maps each batch name to its jobs.
+    """
+    groups = dict()
+    result = []
+    for job in out_of_date:
+      obj, src, ext, _ = job
+      if obj in unity_groups or path_utils.basename(obj) != \
+            batch.get_default_object_filename(src,
+                                              self.get_object_extension()):
+        result.append(job)
+        continue
+      pch_options = precompiled_headers.get(obj, ([], []))[0]
+      groups.setdefault((path_utils.dirname(obj), ext, tuple(pch_options),
+                         tuple(self.get_source_options(src))),
+                        []).append(job)
+    batch_size = self.get_batch_size() or \
+        batch.get_batch_size(len(out_of_date), spawn.get_max_jobs())
+    batches = dict()
+    for (output_dir, ext, _, _), jobs in sorted(groups.items()):
+      for members in batch.split(jobs, batch_size):
+        if len(members) < 2:
+          result.extend(members)
+          continue
+        name = path_utils.join(output_dir, "batch%d" % len(batches))
+        label = "%s (%d sources)" % (members[0][1], len(members))
+        batches[name] = members
+        result.append((name, label, ext, None))
+    return result, batches
+
+  def _compile_batch(self, output_dir, sources, cc_args, extra_postargs,
+                     pp_opts):
+    """Compiles `sources` by a single compiler invocation into `output_dir`,
+    see :mod:`bb.tools.compilers.batch`. Compilers that support batched
+    compilation have to implement this method.
+    """
+    raise NotImplementedError()
+
+  def _move_batch_outputs(self, obj, src):
+    """Moves outputs of batched compilation of `src` other than the object
+    (e.g. depfile) to where :func:`_compile` would write them.
+    """
+    pass
+
+  def _setup_precompiled_header(self, build, out_of_date, cc_options,
+                                extra_postopts, pp_options):
+    """Finds the prefix of leading includes shared by the sources and
+    precompiles it, see :mod:`bb.tools.compilers.pch`. Returns a dict that maps
+    each out of date object, which source starts with the prefix, to a tuple of
+    extra compile options and dependencies brought by the precompiled header.
+    """
+    includes = dict()
+    for obj, (src, ext) in build.items():
+      includes[obj] = pch.get_leading_includes(src, self.get_include_dirs())
+    prefix, users = pch.find_prefix(includes)
+    users = set(users)
+    pending = [obj for obj, _, _, _ in out_of_date if obj in users]
+    if not pending:
+      return dict()
+    result = self._build_precompiled_header(prefix, len(pending), cc_options,
+                                            extra_postopts, pp_options)
+    if not result:
+      return dict()
+    header, deps = result
+    options = ["-include", header, "-Winvalid-pch"]
+    return dict([(obj, (options, deps)) for obj in pending])
+
+  def _build_precompiled_header(self, prefix, num_users, cc_options,
+                                extra_postopts, pp_options):
+    """Returns a tuple of the prefix header path and its dependencies, or
+    ``None`` if the header cannot be or is not worth to be precompiled. The
+    header is built once per compiler (including its identity, macros and
+    memory model, if any), options and prefix, and is shared by all the
+    binaries built with them.
+    """
+    command_digest = self._get_command_digest(cc_options, extra_postopts,
+                                              prefix)
+    pch_dir = path_utils.join(bb.config.user_settings.get("b3", "builddir"),
+                              "pch", command_digest)
+    header = path_utils.join(pch_dir, pch.PREFIX_HEADER)
+    gch = header + ".gch"
+    with _get_pch_lock(gch):
+      if self._is_up_to_date(gch, command_digest):
+        record = dependencies.DependencyRecord.load(gch)
+        return header, record.get_dependencies()
+      if num_users < pch.MIN_USERS:
+        return None
+      fs_snapshot.mkpath(pch_dir)
+      pch.write_prefix_header(header, prefix)
+      if path_utils.lexists(gch):
+        os.remove(gch)
+      cache = action_cache.get_action_cache()
+      argv = [os.getcwd(), header] + cc_options + extra_postopts
+      direct_key = cache and action_cache.action_key(
+        self.get_fingerprint_data(), argv, [header])
+      entry = cache and cache.find_manifest_entry(direct_key)
+      if entry and cache.restore(entry["key"], {"pch": gch}):
+        logger.info("Restored precompiled header %s from cache" % gch)
+        deps = entry["files"].keys()
+      else:
+        logger.info("Precompiling %s" % header)
+        tmp = "%s.%d.tmp" % (gch, os.getpid())
+        depfile = self.get_depfile(tmp)
+        try:
+          self._compile(tmp, header, ".h",
+                        list(cc_options) + ["-x", "c-header"], extra_postopts,
+                        pp_options)
+        except CompileError, e:
+          logger.warning("Cannot precompile %s, compiling without it: %s" %
+                         (header, e))
+          for path in (tmp, depfile):
+            if path_utils.lexists(path):
+              os.remove(path)
+          return None
+        os.rename(tmp, gch)
+        # The header is cached only if its includes are known from the
+        # depfile.
+        if path_utils.exists(depfile):
+          deps = dependencies.parse_depfile(depfile)
+          os.remove(depfile)
+          files = sorted(set([path_utils.abspath(dep)
+                              for dep in [header] + deps]))
+          if cache:
+            key = action_cache.action_key(self.get_fingerprint_data(), argv,
+                                          files)
+            cache.store(key, {"pch": gch})
+            cache.add_manifest_entry(direct_key, key, files)
+        else:
+          deps = dependencies.scan_includes(header, self.get_include_dirs())
+      deps = sorted(set([path_utils.abspath(dep) for dep in [header] + deps]))
+      self._save_record(gch, dependencies.DependencyRecord(command_digest,
+                                                           deps))
+      return header, deps
+
+  def _run_jobs(self, func, jobs):
+    """Calls `func` for each tuple of arguments from `jobs` list. Jobs are run
+    concurrently by up to :func:`bb.utils.spawn.get_max_jobs` threads. Raises
+    :class:`CompileError` with an error message per source once all jobs are
+    finished, if some of them have failed.
+    """
+    errors = []
+    def run_job(args):
+      try:
+        func(*args)
+      except CompileError, e:
+        # A batch of sources reports errors per source.
+        if not e.errors:
+          logger.error("%s: %s" % (args[1], e))
+          errors.append((args[1], str(e)))
+        for src, message in e.errors:
+          logger.error("%s: %s" % (src, message))
+          errors.append((src, message))
+      except Exception, e:
+        logger.error("%s: %s" % (args[1], e))
+        errors.append((args[1], str(e)))
+    num_workers = min(spawn.get_max_jobs(), len(jobs))
+    if num_workers > 1:
+      pool = ThreadPool(num_workers)
+      try:
+        # Py2.x: get() without timeout cannot be interrupted.
+        pool.map_async(run_job, jobs).get(24 * 60 * 60)
+      finally:
+        pool.terminate()
+    else:
+      for args in jobs:
+        run_job(args)
+    if errors:
+      raise CompileError("%d file(s) failed to compile: %s" %
+                         (len(errors), ", ".join([src for src, _ in errors])),
+                         sorted(errors))
+
+  def get_dependencies(self):
+    """Returns a sorted list of files (sources and headers) that the objects
+    compiled by the last :func:`compile` call depend on.
+    """
+    deps = set()
+    for obj_deps in self._dependencies.values():
+      deps.update(obj_deps)
+    return sorted(deps)
+
+  def _get_compile_outputs(self, obj):
+    """Returns a dict of files produced by compilation of object `obj`."""
+    outputs = {"object": obj}
+    if self._gen_depfile_options(obj):
+      outputs["depfile"] = self.get_depfile(obj)
+    return outputs
+
+  def _cached_link(self, objects, output_filename):
+    """Links the objects unless the binary can be restored from the action
+    cache.
+    """
+    if self.is_dry_run_mode_enabled():
+      return self.link(objects, output_filename)
+    if path_utils.lexists(output_filename):
+      os.remove(output_filename)
+    cache = action_cache.get_action_cache()
+    if not cache:
+      return self.link(objects, output_filename)
+    outputs = {"binary": output_filename}
+    key = action_cache.action_key(self.get_fingerprint_data(),
+                                  [os.getcwd(), output_filename] + objects,
+                                  objects)
+    if cache.restore(key, outputs):
+      logger.info("Binary %s restored from cache" % output_filename)
+      return
+    self.link(objects, output_filename)
+    cache.store(key, outputs)
+
+  def get_depfile(self, obj):
+    """Returns path to the depfile that the compiler generates for the object
+    `obj`. See :func:`_gen_depfile_options`.
+    """
+    return obj + ".d"
+
+  def _gen_depfile_options(self, obj):
+    """Returns a list of options that make the compiler write a depfile for
+    `obj`. Compilers that do not support depfiles return an empty list, so that
+    dependencies will be found by include scanner.
+    """
+    return []
+
+  def _get_command_digest(self, *args):
+    sha1 = hashlib.sha1()
+    sha1.update(repr(self.get_fingerprint_data()))
+    for arg in args:
+      sha1.update(repr(arg))
+    return sha1.hexdigest()
+
+  def _is_up_to_date(self, filename, command_digest, record_filename=None):
+    if self.is_force_mode_enabled() or not path_utils.exists(filename):
+      return False
+    record = dependencies.DependencyRecord.load(record_filename or filename)
+    return bool(record) and record.is_up_to_date(command_digest)
+
+  def _record_dependencies(self, obj, src, command_digest, depends=None):
+    depfile = self.get_depfile(obj)
+    if path_utils.exists(depfile):
+      deps = dependencies.parse_depfile(depfile)
+    else:
+      deps = dependencies.scan_includes(src, self.get_include_dirs())
+    deps = [path_utils.abspath(dep) for dep in [src] + deps + (depends or [])]
+    deps = sorted(set(deps))
+    self._dependencies[obj] = deps
+    self._save_record(obj, dependencies.DependencyRecord(command_digest, deps))
+
+  def _save_record(self, filename, record):
+    fs_snapshot.mkpath(path_utils.dirname(record.get_path(filename)))
+    record.save(filename)
+
   def _compile(self, obj, src, ext, cc_args, extra_postargs, pp_opts):
     """Compile source to product objects."""
     raise NotImplemented
@@ -506,7 +1181,7 @@ class CustomCCompiler(Compiler):
       src = sources[i]
       obj = objects[i]
       ext = path_utils.splitext(src)[1]
-      path_utils.mkpath(path_utils.dirname(obj), 0777)
+      fs_snapshot.mkpath(path_utils.dirname(obj), 0777)
       build[obj] = (src, ext)
     return macros, objects, extra, pp_options, build
 
@@ -0,0 +1,135 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.utils import logging
+from bb.tools import action_cache
+from bb.tools.compilers import batch
+from bb.tools.compilers.compiler import CompileError
+from bb.tools.compilers.custom_c_compiler import CustomCCompiler, CompileJob
+from bb.tools.compilers.gcc import GCC
+
+# Turn off logging
+logger = logging.get_logger("bb")
+logger.propagate = False
+
+class FakeCompiler(CustomCCompiler):
+  """Writes an object per source, fails on sources that contain ``FAIL`` and
+  on unity sources if `fail_unity` is ``True``.
+  """
+
+  source_extensions = [".c"]
+  object_extension = ".o"
+  supports_batch_compile = True
+
+  def __init__(self, fail_unity=False):
+    CustomCCompiler.__init__(self)
+    self.fail_unity = fail_unity
+    self.calls = []
+
+  def _check(self, src):
+    with open(src) as handle:
+      if "FAIL" in handle.read():
+        raise CompileError("%s has failed" % src)
+
+  def _compile(self, obj, src, ext, cc_args, extra_postargs, pp_opts):
+    self.calls.append([os.path.basename(src)])
+    if self.fail_unity and "/unity/" in src:
+      raise CompileError("unity source has failed")
+    self._check(src)
+    open(obj, "w").close()
+
+  def _compile_batch(self, output_dir, sources, cc_args, extra_postargs,
+                     pp_opts):
+    self.calls.append([os.path.basename(src) for src in sources])
+    for src in sources:
+      self._check(src)
+    for src in sources:
+      open(os.path.join(output_dir, batch.get_default_object_filename(
+        src, self.get_object_extension())), "w").close()
+
+class CompileJobTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+
+  def run_job(self, compiler, sources):
+    compiler.set_output_dir(os.path.join(self.dir, "out"))
+    _, objects, extra_postopts, pp_options, build = \
+        compiler._setup_compile(sources, None, [], [], None)
+    job = CompileJob(compiler, build, ["-c"], extra_postopts, pp_options)
+    return job, job.run(objects)
+
+  def test_unity_fallback(self):
+    sources = [self.write("%s.c" % name, "int x;\n")
+               for name in ("a", "b", "c", "d")]
+    compiler = FakeCompiler(fail_unity=True)
+    compiler.enable_unity_build(2)
+    job, (objects, num_compiled) = self.run_job(compiler, sources)
+    self.assert_equal(len(job.fallbacks), 2)
+    self.assert_equal(objects, compiler.get_object_filenames(sources))
+    self.assert_equal(sorted(compiler.calls),
+                      [["a.c"], ["b.c"], ["c.c"], ["d.c"], ["unity0.c"],
+                       ["unity1.c"]])
+    # Failed groups are not formed again while their sources are the same.
+    compiler.calls = []
+    job, (objects, num_compiled) = self.run_job(compiler, sources)
+    self.assert_equal(objects, compiler.get_object_filenames(sources))
+    self.assert_equal(num_compiled, 0)
+    self.assert_equal(compiler.calls, [])
+
+  def test_batch(self):
+    sources = [self.write("%s.c" % name, "int x;\n")
+               for name in ("a", "b", "c")]
+    compiler = FakeCompiler()
+    compiler.enable_batch_compile(4)
+    job, (objects, num_compiled) = self.run_job(compiler, sources)
+    self.assert_equal(len(job.batches), 1)
+    self.assert_equal(num_compiled, 3)
+    self.assert_equal(compiler.calls, [["a.c", "b.c", "c.c"]])
+    for obj in objects:
+      self.assert_true(os.path.exists(obj))
+
+  def test_batch_fallback(self):
+    sources = [self.write("a.c", "int x;\n"), self.write("b.c", "FAIL\n"),
+               self.write("c.c", "int x;\n")]
+    compiler = FakeCompiler()
+    compiler.enable_batch_compile(4)
+    try:
+      self.run_job(compiler, sources)
+    except CompileError, e:
+      self.assert_equal([src for src, _ in e.errors], [sources[1]])
+    else:
+      self.fail("CompileError is expected")
+    self.assert_equal(compiler.calls, [["a.c", "b.c", "c.c"], ["a.c"],
+                                       ["b.c"], ["c.c"]])
+    self.assert_true(os.path.exists(compiler.get_object_filenames(sources)[0]))
+
+  def test_cache_tracks_headers(self):
+    cache = action_cache.set_action_cache(
+      action_cache.ActionCache(os.path.join(self.dir, "cache")))
+    try:
+      os.mkdir(os.path.join(self.dir, "cfg"))
+      src = self.write("a.c", "#include \"value.h\"\nint value = VALUE;\n")
+      compiler = GCC()
+      # The header is found by an option of this source only.
+      compiler.set_source_options(src, ["-I" + os.path.join(self.dir, "cfg")])
+      contents = []
+      for i, value in enumerate(["1", "22", "1"]):
+        header = self.write("cfg/value.h", "#define VALUE %s\n" % value)
+        os.utime(header, (i, i))
+        _, (objects, _) = self.run_job(compiler, [src])
+        with open(objects[0], "rb") as handle:
+          contents.append(handle.read())
+      self.assert_not_equal(contents[0], contents[1])
+      self.assert_equal(contents[0], contents[2])
+      self.assert_equal(cache.hits, 1)
+    finally:
+      action_cache.set_action_cache(None)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,155 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Dependency tracking for incremental compilation.
+
+Dependencies of an object file are either read from the depfile produced by
+the compiler (see `-MD` GCC option) or found by :func:`scan_includes`. Once the
+object has been compiled, a :class:`DependencyRecord` is saved next to it. The
+record keeps the digest of the compile command and the signature of each
+dependency, so the next build can tell whether the object is up-to-date.
+"""
+
+import json
+import re
+
+from bb.utils import logging
+from bb.utils import path_utils
+
+logger = logging.get_logger("bb")
+
+RECORD_EXTENSION = ".deps"
+
+_INCLUDE_REGEXP = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]',
+                             re.MULTILINE)
+
+def parse_depfile(path):
+  """Parses make-style depfile `path` and returns a list of prerequisites."""
+  with open(path) as handle:
+    content = handle.read()
+  content = content.replace("\\\n", " ")
+  deps = []
+  for line in content.splitlines():
+    if ":" not in line:
+      continue
+    # Skip the target part. Note that the target never contains a drive letter
+    # since it is our object file.
+    _, prerequisites = line.split(":", 1)
+    # Spaces inside of file names are escaped by backslash.
+    for token in re.split(r"(?<!\\)\s+", prerequisites.strip()):
+      if token:
+        deps.append(token.replace("\\ ", " "))
+  return deps
+
+def scan_includes(src, include_dirs=[]):
+  """Returns a list of headers included by `src` file directly or
+  indirectly. Quoted includes are searched in the directory of the including
+  file and then in `include_dirs`, angle-bracket includes only in
+  `include_dirs`. Headers that cannot be found (e.g. system headers) are
+  skipped.
+
+  Conditional compilation is not taken into account, thus the result may
+  contain extra headers.
+  """
+  found = []
+  visited = set([path_utils.abspath(src)])
+  stack = [src]
+  while stack:
+    path = stack.pop()
+    try:
+      with open(path) as handle:
+        content = handle.read()
+    except IOError:
+      continue
+    for kind, name in _INCLUDE_REGEXP.findall(content):
+      search_dirs = list(include_dirs)
+      if kind == '"':
+        search_dirs.insert(0, path_utils.dirname(path))
+      for search_dir in search_dirs:
+        header = path_utils.abspath(path_utils.join(search_dir, name))
+        if path_utils.isfile(header):
+          if header not in visited:
+            visited.add(header)
+            found.append(header)
+            stack.append(header)
+          break
+  return found
+
+class DependencyRecord(object):
+  """Keeps the digest of the command, that was used to produce a file, and
+  signatures of its dependencies.
+  """
+
+  def __init__(self, command_digest=None, deps=None):
+    self.command_digest = command_digest
+    # Maps dependency path to a tuple (signature, digest).
+    self.deps = dict()
+    if deps:
+      self.add_dependencies(deps)
+
+  def add_dependency(self, path):
+    self.deps[path] = (path_utils.signature(path), path_utils.digest(path))
+
+  def add_dependencies(self, paths):
+    for path in paths:
+      self.add_dependency(path)
+
+  def get_dependencies(self):
+    return self.deps.keys()
+
+  def is_up_to_date(self, command_digest):
+    """Returns ``True`` if the command was not changed and all the dependencies
+    have the same signature or content.
+    """
+    if command_digest != self.command_digest:
+      return False
+    for path, (signature, digest) in self.deps.items():
+      current_signature = path_utils.signature(path)
+      if current_signature is None:
+        return False
+      if current_signature == signature:
+        continue
+      if path_utils.digest(path) != digest:
+        return False
+    return True
+
+  @classmethod
+  def get_path(cls, filename):
+    return filename + RECORD_EXTENSION
+
+  @classmethod
+  def load(cls, filename):
+    """Loads the record for `filename`. Returns ``None`` if the record does not
+    exist or cannot be read.
+    """
+    path = cls.get_path(filename)
+    if not path_utils.exists(path):
+      return None
+    try:
+      with open(path) as handle:
+        data = json.load(handle)
+    except ValueError, e:
+      logger.warning("Cannot read %s: %s" % (path, e))
+      return None
+    record = cls(str(data["command"]))
+    for dep, (signature, digest) in data["deps"].items():
+      record.deps[str(dep)] = (signature and tuple(signature), str(digest))
+    return record
+
+  def save(self, filename):
+    with open(self.get_path(filename), "w") as handle:
+      json.dump({"command": self.command_digest, "deps": self.deps}, handle)
@@ -0,0 +1,44 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.compilers import dependencies
+
+class DependenciesTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+
+  def test_parse_depfile(self):
+    depfile = self.write("a.o.d", "a.o: a.c inc/a.h \\\n b\\ c.h\n")
+    self.assert_equal(dependencies.parse_depfile(depfile),
+                      ["a.c", "inc/a.h", "b c.h"])
+
+  def test_scan_includes(self):
+    a_h = self.write("a.h", '#include "b.h"\n#include <stdio.h>\n')
+    b_h = self.write("inc/b.h", "int b;\n")
+    src = self.write("a.c", '#include "a.h"\n  #  include <b.h>\n')
+    self.assert_equal(dependencies.scan_includes(src,
+                                                 [os.path.join(self.dir,
+                                                               "inc")]),
+                      [a_h, b_h])
+
+  def test_record(self):
+    src = self.write("a.c", "int a;\n")
+    record = dependencies.DependencyRecord("cmd", [src])
+    record.save(src)
+    record = dependencies.DependencyRecord.load(src)
+    self.assert_true(record.is_up_to_date("cmd"))
+    self.assert_false(record.is_up_to_date("another cmd"))
+    # Same content with a new modification time.
+    os.utime(src, (0, 0))
+    self.assert_true(record.is_up_to_date("cmd"))
+    self.write("a.c", "int b;\n")
+    self.assert_false(record.is_up_to_date("cmd"))
+
+if __name__ == "__main__":
+  unittest.main()
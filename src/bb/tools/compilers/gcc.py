@@ -15,10 +15,38 @@
 __copyright__ = "Copyright (c) 2012 Sladeware LLC"
 __author__ = "Oleksandr Sviridenko"
 
+from bb.tools import toolchains
 from bb.tools.compilers.cc import CC
 
 class GCC(CC):
   """Base class for GCC compilers. See propgcc."""
 
+  supports_precompiled_headers = True
+  supports_batch_compile = True
+  toolchain_probe = toolchains.GCC_PROBE
+
   def __init__(self, *args, **kwargs):
     CC.__init__(self, *args, **kwargs)
+
+  def get_version(self):
+    """Returns the version of the compiler, e.g. ``4.6.1``, or ``None`` if
+    it is unknown.
+    """
+    toolchain = self.get_toolchain()
+    return toolchain and toolchain.get_version()
+
+  def get_target(self):
+    """Returns the target triple of the compiler, e.g. ``propeller-elf``."""
+    toolchain = self.get_toolchain()
+    return toolchain and toolchain.get_target()
+
+  def get_builtin_include_dirs(self):
+    """Returns the list of directories searched for system headers."""
+    toolchain = self.get_toolchain()
+    return toolchain and toolchain.get_include_dirs() or []
+
+  def supports_flag(self, flag):
+    """Returns ``True`` if the compiler accepts `flag`."""
+    toolchain = self.get_toolchain()
+    return bool(toolchain and
+                toolchains.get_registry().supports_flag(toolchain, flag))
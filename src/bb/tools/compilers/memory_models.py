@@ -0,0 +1,220 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Memory model selection for the Parallax Propeller.
+
+PropGCC applies one memory model to a program (see
+:func:`bb.tools.compilers.propgcc.PropGCC.set_memory_model`). LMM code runs
+faster than CMM code, while CMM code is the most compact. COG model is never
+selected, since the whole program would have to fit into the 2 KB of a cog.
+
+The runner of each thread is compiled under LMM and CMM models and the code
+size is measured from the object (see :func:`get_code_size`). Then
+:func:`plan` selects the fastest model in which the code fits into hub
+memory, and spreads the threads over cogs, the hottest ones first::
+
+  profiles = [ThreadProfile("BLINKER", "blinker_runner", weight=10,
+                            sizes={"lmm": 2400, "cmm": 1300})]
+  launch_plan = plan(profiles)
+  print(launch_plan.format_report())
+
+The plan is advisory: hub usage is estimated from the runners until the size
+of the built image is known (see :func:`LaunchPlan.set_image_size`).
+"""
+
+import os
+import re
+import struct
+
+from bb.tools.loaders.propler.image import Image
+
+COG_MODEL = "cog"
+LMM_MODEL = "lmm"
+CMM_MODEL = "cmm"
+MODELS = (COG_MODEL, CMM_MODEL, LMM_MODEL)
+# Models that can be selected for a program, the fastest first.
+PROGRAM_MODELS = (LMM_MODEL, CMM_MODEL)
+
+NUM_COGS = 8
+HUB_SIZE = 32 * 1024
+
+_SHF_ALLOC = 0x2
+_SHF_EXECINSTR = 0x4
+
+class PlacementError(Exception):
+  """Indicates that threads cannot be placed."""
+
+def get_code_size(path):
+  """Returns the size in bytes of executable sections of ELF object or
+  executable `path`.
+  """
+  with open(path, "rb") as handle:
+    content = handle.read()
+  if content[:4] != "\x7fELF":
+    raise ValueError("%s is not an ELF file" % path)
+  is_64 = content[4] == "\x02"
+  order = content[5] == "\x02" and ">" or "<"
+  if is_64:
+    shoff, = struct.unpack_from(order + "Q", content, 0x28)
+    shentsize, shnum = struct.unpack_from(order + "HH", content, 0x3a)
+    section_format = order + "IIQQQQ"
+  else:
+    shoff, = struct.unpack_from(order + "I", content, 0x20)
+    shentsize, shnum = struct.unpack_from(order + "HH", content, 0x2e)
+    section_format = order + "IIIIII"
+  size = 0
+  for i in range(shnum):
+    _, _, flags, _, _, section_size = \
+        struct.unpack_from(section_format, content, shoff + i * shentsize)
+    if flags & _SHF_ALLOC and flags & _SHF_EXECINSTR:
+      size += section_size
+  return size
+
+def get_image_size(path):
+  """Returns the size of the image `path`: program size of Propeller (ELF32)
+  images, see :func:`bb.tools.loaders.propler.image.Image.get_file_size`,
+  and the size of code of other ELF files.
+  """
+  with open(path, "rb") as handle:
+    ident = handle.read(5)
+  if ident[:4] != "\x7fELF":
+    return os.path.getsize(path)
+  if ident[4] == "\x01":
+    return Image.get_file_size(path)
+  return get_code_size(path)
+
+def find_runner_sources(runners, sources):
+  """Returns a dict that maps each runner from `runners` to the source from
+  `sources` list that defines it. Runners that are not defined by the
+  sources are omitted.
+  """
+  result = dict()
+  for src in sources:
+    try:
+      with open(src) as handle:
+        content = handle.read()
+    except IOError:
+      continue
+    for runner in runners:
+      if runner in result or runner not in content:
+        continue
+      if re.search(r"^[\w\s\*]*?\b%s\s*\([^;{)]*\)\s*\{" % re.escape(runner),
+                   content, re.MULTILINE):
+        result[runner] = src
+  return result
+
+class ThreadProfile(object):
+  """Describes the thread `name` with runner `runner`: its `weight` (how hot
+  the thread is), the source that defines the runner and a dict of code sizes
+  of the source compiled under each model. A model under which the source
+  does not compile is missing from `sizes`.
+  """
+
+  def __init__(self, name, runner, weight=1, source=None, sizes=None):
+    self.name = name
+    self.runner = runner
+    self.weight = weight
+    self.source = source
+    self.sizes = sizes or dict()
+
+  def is_measured(self):
+    return bool(self.sizes)
+
+class LaunchPlan(object):
+  """The result of :func:`plan`: the model of the program and the list of
+  cogs, where each cog is a dict with its id, threads and their code size.
+  """
+
+  def __init__(self, profiles, model, cogs, hub_usage, hub_size=HUB_SIZE):
+    self.profiles = profiles
+    self.model = model
+    self.cogs = cogs
+    self.hub_usage = hub_usage
+    self.hub_size = hub_size
+    self.image_size = None
+
+  def get_model(self):
+    """Returns the model the program has to be compiled in."""
+    return self.model
+
+  def set_image_size(self, size):
+    """Sets the size of the built image, that replaces the hub usage
+    estimated from the runners.
+    """
+    self.image_size = size
+
+  def get_hub_usage(self):
+    if self.image_size is not None:
+      return self.image_size
+    return self.hub_usage
+
+  def to_dict(self):
+    return dict(cogs=self.cogs, model=self.model,
+                hub_usage=self.get_hub_usage(),
+                estimated=self.image_size is None, hub_size=self.hub_size,
+                unmeasured=sorted([profile.name for profile in self.profiles
+                                   if not profile.is_measured()]))
+
+  def format_report(self):
+    lines = ["Launch plan (advisory, the program is compiled in %s model):" %
+             self.model.upper()]
+    for cog in self.cogs:
+      lines.append("  cog %d  %5d byte(s)  %s" %
+                   (cog["cog"], cog["code_size"], ", ".join(cog["threads"])))
+    lines.append("Hub usage: %d of %d byte(s) (%s)" %
+                 (self.get_hub_usage(), self.hub_size,
+                  self.image_size is None and "estimated from runners" or
+                  "image"))
+    unmeasured = self.to_dict()["unmeasured"]
+    if unmeasured:
+      lines.append("Not measured (runner source not found): %s" %
+                   ", ".join(unmeasured))
+    return "\n".join(lines)
+
+def _get_hub_usage(profiles, model):
+  """Returns the size of code of the runners under `model`. Threads that
+  share a source share the code.
+  """
+  sizes = dict()
+  for profile in profiles:
+    if profile.is_measured():
+      sizes[profile.source or profile.name] = profile.sizes.get(model, 0)
+  return sum(sizes.values())
+
+def plan(profiles, num_cogs=NUM_COGS, hub_size=HUB_SIZE):
+  """Selects the model of the program and spreads threads described by
+  `profiles` (a list of :class:`ThreadProfile`) over `num_cogs` cogs. Returns
+  :class:`LaunchPlan`. Raises :class:`PlacementError` if the code does not
+  fit into hub memory.
+  """
+  for model in PROGRAM_MODELS:
+    hub_usage = _get_hub_usage(profiles, model)
+    if hub_usage <= hub_size:
+      break
+  else:
+    raise PlacementError("Code does not fit into hub memory: %d of %d "
+                         "byte(s)" % (hub_usage, hub_size))
+  hottest = sorted(profiles, key=lambda profile: (-profile.weight,
+                                                  profile.name))
+  cogs = [dict(cog=i, threads=[], code_size=0)
+          for i in range(min(len(profiles), num_cogs))]
+  # Hot threads are spread first, like RoundrobinThreadDistributor does.
+  for i, profile in enumerate(hottest):
+    cog = cogs[i % len(cogs)]
+    cog["threads"].append(profile.name)
+    cog["code_size"] += profile.sizes.get(model, 0)
+  return LaunchPlan(profiles, model, cogs, hub_usage, hub_size)
@@ -0,0 +1,63 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+import subprocess
+
+from bb.utils.testing import unittest
+from bb.tools.compilers import memory_models
+from bb.tools.compilers.memory_models import ThreadProfile
+
+class MemoryModelsTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+
+  def test_get_code_size(self):
+    sizes = []
+    for n in (1, 20):
+      src = self.write("a%d.c" % n,
+                       "".join(["int f%d(int x) { return x * %d; }\n" %
+                                (i, i) for i in range(n)]))
+      obj = src + ".o"
+      subprocess.check_call(["cc", "-c", src, "-o", obj])
+      sizes.append(memory_models.get_code_size(obj))
+    self.assert_true(0 < sizes[0] < sizes[1])
+    self.assert_raises(ValueError, memory_models.get_code_size, src)
+
+  def test_find_runner_sources(self):
+    a = self.write("a.c", "void b_runner(void);\n"
+                   "void\na_runner()\n{\n  b_runner();\n}\n")
+    b = self.write("b.c", "static void b_runner(void) {}\n")
+    self.assert_equal(memory_models.find_runner_sources(
+        ["a_runner", "b_runner", "c_runner"], [a, b]),
+                      {"a_runner": a, "b_runner": b})
+
+  def test_plan(self):
+    sizes = {"lmm": 2000, "cmm": 1200}
+    profiles = [ThreadProfile("A", "a", 10, "a.c", sizes),
+                ThreadProfile("B", "b", 5, "b.c", {"lmm": 4000, "cmm": 2500}),
+                ThreadProfile("C", "c", 1, "c.c", sizes),
+                ThreadProfile("D", "d", 1, "c.c", sizes),
+                ThreadProfile("E", "e", 3)]
+    launch_plan = memory_models.plan(profiles, num_cogs=3)
+    self.assert_equal([cog["threads"] for cog in launch_plan.cogs],
+                      [["A", "C"], ["B", "D"], ["E"]])
+    # LMM code of A, B and C, D that share the source.
+    self.assert_equal(launch_plan.get_hub_usage(), 2000 + 4000 + 2000)
+    self.assert_equal(launch_plan.get_model(), "lmm")
+    self.assert_equal(launch_plan.to_dict()["unmeasured"], ["E"])
+    # The size of the built image replaces the estimate.
+    launch_plan.set_image_size(9000)
+    self.assert_equal(launch_plan.to_dict()["hub_usage"], 9000)
+    self.assert_false(launch_plan.to_dict()["estimated"])
+    # LMM code does not fit, CMM does.
+    launch_plan = memory_models.plan(profiles, num_cogs=3, hub_size=6000)
+    self.assert_equal(launch_plan.get_model(), "cmm")
+    self.assert_raises(memory_models.PlacementError, memory_models.plan,
+                       profiles, hub_size=1000)
+
+if __name__ == "__main__":
+  unittest.main()
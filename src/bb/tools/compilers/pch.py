@@ -0,0 +1,145 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Precompiled headers.
+
+Translation units of a binary usually start with the same includes, e.g.
+``bb/os.h`` and the generated config headers of BBOS. The common prefix of
+these includes is written to a prefix header, which is precompiled once and
+then injected into compilation of each such translation unit with
+`-include` option::
+
+  a.c: #include "bb/os.h"    prefix.h: #include "/path/to/bb/os.h"
+       #include <stdio.h>              #include <stdio.h>
+       int main() ...
+  b.c: #include "bb/os.h"
+       #include <stdio.h>
+       #include "b.h"
+
+Only leading includes are taken into account, i.e. includes that precede any
+other code or directive of the translation unit, so that nothing defined by
+the translation unit can change their meaning. Quoted includes are resolved to
+absolute paths, since the prefix header lives in the build directory. The
+headers have to be protected by include guards, since the translation unit
+includes them once again.
+"""
+
+import re
+
+from bb.utils import path_utils
+
+PREFIX_HEADER = "prefix.h"
+# The minimal number of translation units that have to be compiled to make
+# the precompilation of a header worth it.
+MIN_USERS = 2
+
+_INCLUDE_REGEXP = re.compile(r'^#\s*include\s*([<"])([^>"]+)[>"]\s*$')
+
+def _strip_comments(line, in_comment):
+  """Returns a tuple of `line` without comments and a flag that tells whether
+  the line ends inside of a block comment.
+  """
+  result = ""
+  while line:
+    if in_comment:
+      end = line.find("*/")
+      if end < 0:
+        return result, True
+      line = line[end + 2:]
+      in_comment = False
+      continue
+    start = line.find("/*")
+    line_comment = line.find("//")
+    if line_comment >= 0 and (start < 0 or line_comment < start):
+      return result + line[:line_comment], False
+    if start < 0:
+      return result + line, False
+    result += line[:start] + " "
+    line = line[start + 2:]
+    in_comment = True
+  return result, in_comment
+
+def _resolve_include(kind, name, src, include_dirs):
+  if kind == '"':
+    for search_dir in [path_utils.dirname(src)] + list(include_dirs):
+      header = path_utils.abspath(path_utils.join(search_dir, name))
+      if path_utils.isfile(header):
+        return '"%s"' % header
+  return "<%s>" % name
+
+def get_leading_includes(src, include_dirs=[]):
+  """Returns a list of includes that precede any other code or directive in
+  `src` file. Each include is either ``"<name>"`` or ``'"path"'``, where path
+  is an absolute path of the quoted header found in the directory of `src` or
+  `include_dirs`.
+  """
+  includes = []
+  in_comment = False
+  try:
+    with open(src) as handle:
+      for line in handle:
+        line, in_comment = _strip_comments(line, in_comment)
+        line = line.strip()
+        if not line:
+          continue
+        match = _INCLUDE_REGEXP.match(line)
+        if not match:
+          break
+        includes.append(_resolve_include(match.group(1), match.group(2), src,
+                                         include_dirs))
+  except IOError:
+    return []
+  return includes
+
+def find_prefix(includes):
+  """Takes a dict that maps a key (e.g. object file) to leading includes of
+  its source, and returns a tuple of the prefix of includes shared by the
+  largest group of keys and a sorted list of these keys. The prefix is empty
+  if less than :const:`MIN_USERS` keys share it.
+  """
+  groups = dict()
+  for key, key_includes in includes.items():
+    if key_includes:
+      groups.setdefault(key_includes[0], []).append(key)
+  if not groups:
+    return [], []
+  first = sorted(groups, key=lambda include: (-len(groups[include]),
+                                              include))[0]
+  users = sorted(groups[first])
+  if len(users) < MIN_USERS:
+    return [], []
+  prefix = list(includes[users[0]])
+  for key in users[1:]:
+    key_includes = includes[key]
+    i = 0
+    while i < len(prefix) and i < len(key_includes) and \
+          prefix[i] == key_includes[i]:
+      i += 1
+    del prefix[i:]
+  return prefix, users
+
+def write_prefix_header(path, prefix):
+  """Writes the prefix header `path` with `prefix` includes, unless it
+  already has the same content.
+  """
+  content = "".join(["#include %s\n" % include for include in prefix])
+  if path_utils.isfile(path):
+    with open(path) as handle:
+      if handle.read() == content:
+        return
+  with open(path, "w") as handle:
+    handle.write(content)
@@ -0,0 +1,40 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.tools.compilers import pch
+
+class PrecompiledHeaderTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+
+  def test_get_leading_includes(self):
+    os_h = self.write("inc/bb/os.h", "")
+    src = self.write("a.c", "/* Copyright\n * #include <no.h> */\n"
+                     "#include \"bb/os.h\" // the OS\n\n"
+                     "# include <stdio.h>\n"
+                     "#define X 1\n"
+                     "#include \"b.h\"\n")
+    self.assert_equal(pch.get_leading_includes(src, [self.dir + "/inc"]),
+                      ['"%s"' % os_h, "<stdio.h>"])
+
+  def test_find_prefix(self):
+    includes = {"a.o": ["<os.h>", "<config.h>", "<a.h>"],
+                "b.o": ["<os.h>", "<config.h>"],
+                "c.o": ["<os.h>", "<b.h>"],
+                "d.o": ["<stdio.h>"],
+                "e.o": []}
+    self.assert_equal(pch.find_prefix(includes),
+                      (["<os.h>"], ["a.o", "b.o", "c.o"]))
+    del includes["c.o"]
+    self.assert_equal(pch.find_prefix(includes),
+                      (["<os.h>", "<config.h>"], ["a.o", "b.o"]))
+    self.assert_equal(pch.find_prefix({"a.o": ["<os.h>"]}), ([], []))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -26,9 +26,21 @@
    for further instructions.
 """
 
+import os
+
+from bb.tools import action_cache
+from bb.tools.compilers.compiler import CompileError
+from bb.tools.compilers import dependencies
+from bb.tools.compilers import memory_models
 from bb.tools.compilers.gcc import GCC
+from bb.utils import fs_snapshot
+from bb.utils import logging
+from bb.utils import path_utils
+from bb.utils import spawn
 from bb.utils import typecheck
 
+logger = logging.get_logger("bb")
+
 class PropGCC(GCC):
   """PropGCC is a GCC port for the Parallax Propeller P8X32A
   Microcontroller. Project page: http://code.google.com/p/propgcc/.
@@ -45,6 +57,8 @@ class PropGCC(GCC):
   """
 
   executable = "propeller-elf-gcc"
+  tune_flag_sets = (("-Os",), ("-O1",), ("-O2",), ("-Os", "-mfcache"),
+                    ("-O2", "-mfcache"))
 
   def __init__(self, *args, **kargs):
     GCC.__init__(self, *args, **kargs)
@@ -91,11 +105,90 @@ class PropGCC(GCC):
     """Return memory model. See :func:`set_memory_model`."""
     return self._memory_model
 
+  def get_fingerprint_data(self):
+    return GCC.get_fingerprint_data(self) + [self.get_memory_model(),
+                                             self.get_linker().get_opts()]
+
+  def check_memory_model(self):
+    """Raises :class:`CompileError` if the toolchain does not support the
+    memory model, e.g. ``cmm`` is not known by older PropGCC releases. The
+    answer is kept by the toolchain registry, so that the compiler is asked
+    once.
+    """
+    model = self.get_memory_model()
+    if not model or self.is_dry_run_mode_enabled() or \
+          not self.get_toolchain():
+      return
+    if not self.supports_flag("-m%s" % model):
+      raise CompileError("%s %s does not support %s memory model" %
+                         (self.get_executable(), self.get_version(), model))
+
+  def measure_code_sizes(self, src, output_dir,
+                         models=memory_models.MODELS):
+    """Compiles `src` under each model from `models` into `output_dir` and
+    returns a dict that maps each model to the code size of the object, see
+    :mod:`bb.tools.compilers.memory_models`. Models under which the source
+    does not compile are omitted. Sources are compiled concurrently, objects
+    are kept in the action cache along with the headers from their depfiles.
+    """
+    pp_options = self._gen_preprocess_options(self.macros,
+                                              self.get_include_dirs())
+    cc_options = self._gen_cc_options(pp_options, False,
+                                      self.get_extra_preopts())
+    base = path_utils.splitext(path_utils.basename(src))[0]
+    fs_snapshot.mkpath(output_dir)
+    cache = action_cache.get_action_cache()
+    objects = dict()
+    pending = dict()
+    for model in models:
+      obj = path_utils.join(output_dir, "%s.%s.o" % (base, model))
+      cmd = [self.get_executable()] + cc_options + ["-m%s" % model] + \
+          self._gen_depfile_options(obj) + [src, "-o", obj]
+      # Includes are known from the depfile, the manifest keeps them.
+      direct_key = cache and action_cache.action_key(
+        self.get_fingerprint_data(), [os.getcwd()] + cmd, [src])
+      if path_utils.lexists(obj):
+        os.remove(obj)
+      objects[model] = obj
+      entry = cache and cache.find_manifest_entry(direct_key)
+      if not entry or not cache.restore(entry["key"], {"object": obj}):
+        pending[model] = (cmd, direct_key)
+    results = spawn.spawn_many([cmd for cmd, _ in pending.values()],
+                               capture=True)
+    sizes = dict()
+    for (model, (cmd, direct_key)), result in zip(pending.items(), results):
+      depfile = self.get_depfile(objects[model])
+      if not result.is_ok():
+        logger.debug("%s does not compile under %s model: %s" %
+                     (src, model, result.stderr.strip()))
+      elif cache and path_utils.exists(depfile):
+        files = sorted(set([path_utils.abspath(dep) for dep in
+                            [src] + dependencies.parse_depfile(depfile)]))
+        key = action_cache.action_key(self.get_fingerprint_data(),
+                                      [os.getcwd()] + cmd, files)
+        cache.store(key, {"object": objects[model]})
+        cache.add_manifest_entry(direct_key, key, files)
+      if path_utils.exists(depfile):
+        os.remove(depfile)
+    for model, obj in objects.items():
+      if path_utils.exists(obj):
+        sizes[model] = memory_models.get_code_size(obj)
+    return sizes
+
   def _compile(self, obj, src, ext, cc_args, extra_postargs, pp_opts):
     if self.get_memory_model():
+      self.check_memory_model()
       cc_args.append("-m%s" % self.get_memory_model())
     GCC._compile(self, obj, src, ext, cc_args, extra_postargs, pp_opts)
 
+  def _compile_batch(self, output_dir, sources, cc_args, extra_postargs,
+                     pp_opts):
+    if self.get_memory_model():
+      self.check_memory_model()
+      cc_args.append("-m%s" % self.get_memory_model())
+    GCC._compile_batch(self, output_dir, sources, cc_args, extra_postargs,
+                       pp_opts)
+
   def _link(self, objects, output_dir=None, libraries=None, library_dirs=None,
             debug=False, extra_preargs=None, extra_postargs=None,
             target_lang=None):
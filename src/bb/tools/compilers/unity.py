@@ -0,0 +1,143 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Unity (jumbo) builds.
+
+Sources are grouped and each group is compiled as a single translation unit,
+a generated unity source that includes the sources of the group::
+
+  /* Generated by b3, do not edit. */
+  #include "/path/to/a.c"
+  #undef A_MACRO
+  #include "/path/to/b.c"
+
+This saves a process and parsing of the same headers per source, which
+dominates build time of small embedded targets. Since the sources share one
+translation unit:
+
+* macros defined by a source are undefined after it;
+* sources that define the same file-scope static symbol are put into
+  different groups;
+* sources that define macros before their first include (e.g. feature test
+  macros) are compiled on their own.
+
+If a group fails to compile anyway, its sources are compiled one by one, see
+:func:`bb.tools.compilers.custom_c_compiler.CustomCCompiler.compile`.
+"""
+
+import re
+
+from bb.utils import path_utils
+
+UNITY_DIR = "unity"
+# Bounds of adaptive group size. A group has to be large enough to pay off the
+# process and header parsing overhead, and small enough to keep incremental
+# rebuilds cheap.
+MIN_GROUP_SIZE = 4
+MAX_GROUP_SIZE = 32
+
+_STATIC_REGEXP = re.compile(r"^static\b[^;{}()=]*?\b(\w+)\s*[\[(=;]",
+                            re.MULTILINE)
+_DEFINE_REGEXP = re.compile(r"^\s*#\s*define\s+(\w+)", re.MULTILINE)
+_INCLUDE_REGEXP = re.compile(r"^\s*#\s*include\b", re.MULTILINE)
+
+class SourceInfo(object):
+  """Keeps what matters for grouping of the source `path`: static symbols and
+  macros it defines.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.statics = set()
+    self.macros = []
+    # True if the source cannot share a translation unit.
+    self.standalone = False
+    try:
+      with open(path) as handle:
+        content = handle.read()
+    except IOError:
+      self.standalone = True
+      return
+    self.statics = set(_STATIC_REGEXP.findall(content))
+    for match in _DEFINE_REGEXP.finditer(content):
+      if match.group(1) not in self.macros:
+        self.macros.append(match.group(1))
+    first_define = _DEFINE_REGEXP.search(content)
+    first_include = _INCLUDE_REGEXP.search(content)
+    if first_define and (not first_include or
+                         first_define.start() < first_include.start()):
+      self.standalone = True
+
+def get_group_size(num_sources, num_jobs):
+  """Returns the number of sources per group, so that there are enough groups
+  to keep `num_jobs` compilers busy, but no group is smaller than
+  :const:`MIN_GROUP_SIZE` or larger than :const:`MAX_GROUP_SIZE` sources.
+  """
+  num_groups = max(1, min(num_jobs, num_sources // MIN_GROUP_SIZE))
+  size = -(-num_sources // num_groups)
+  return max(1, min(size, MAX_GROUP_SIZE))
+
+def split(sources, group_size):
+  """Splits `sources` (a list of :class:`SourceInfo`) into groups of up to
+  `group_size` sources. Returns a list of groups, where a group is a list of
+  sources. Groups do not mix source extensions, and sources of a group do not
+  define the same static symbols. Standalone sources make groups of their
+  own.
+  """
+  groups = []
+  open_groups = dict()
+  for source in sorted(sources, key=lambda source: source.path):
+    if source.standalone or group_size < 2:
+      groups.append([source])
+      continue
+    ext = path_utils.splitext(source.path)[1]
+    candidates = open_groups.setdefault(ext, [])
+    for group in candidates:
+      if len(group) < group_size and \
+            not any([source.statics & other.statics for other in group]):
+        group.append(source)
+        break
+    else:
+      group = [source]
+      candidates.append(group)
+      groups.append(group)
+    open_groups[ext] = [group for group in candidates
+                        if len(group) < group_size]
+  return groups
+
+def get_failure_record_filename(obj):
+  """Returns the name of the record that keeps the failure of the unity object
+  `obj`, see :class:`bb.tools.compilers.dependencies.DependencyRecord`.
+  """
+  return obj + ".failed"
+
+def write_unity_source(path, sources):
+  """Writes the unity source `path` that includes `sources`, unless it
+  already has the same content.
+  """
+  lines = ["/* Generated by b3, do not edit. */"]
+  for source in sources:
+    lines.append('#include "%s"' % path_utils.abspath(source.path))
+    for macro in source.macros:
+      lines.append("#undef %s" % macro)
+  content = "\n".join(lines) + "\n"
+  if path_utils.isfile(path):
+    with open(path) as handle:
+      if handle.read() == content:
+        return
+  with open(path, "w") as handle:
+    handle.write(content)
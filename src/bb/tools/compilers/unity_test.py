@@ -0,0 +1,50 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+from bb.utils.testing import unittest
+from bb.tools.compilers import unity
+
+class UnityTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+
+  def write_source(self, name, content):
+    return unity.SourceInfo(self.write(name, content))
+
+  def test_source_info(self):
+    source = self.write_source("a.c",
+      "#include <stdio.h>\n"
+      "#define A 1\n"
+      "static int counter = 0;\n"
+      "static const char *names[] = {0};\n"
+      "static inline int helper(int x) { return x; }\n"
+      "int main(void) { static int local; return 0; }\n")
+    self.assert_equal(source.statics, set(["counter", "names", "helper"]))
+    self.assert_equal(source.macros, ["A"])
+    self.assert_false(source.standalone)
+    source = self.write_source("b.c",
+      "#define _GNU_SOURCE\n#include <stdio.h>\n")
+    self.assert_true(source.standalone)
+
+  def test_split(self):
+    a = self.write_source("a.c", "static int helper(void);\n")
+    b = self.write_source("b.c", "static int helper(void);\n")
+    c = self.write_source("c.c", "")
+    d = self.write_source("d.cpp", "")
+    e = self.write_source("e.c", "#define X\n")
+    f = self.write_source("f.c", "")
+    groups = unity.split([f, e, d, c, b, a], 3)
+    self.assert_equal([[source.path for source in group] for group in groups],
+                      [[a.path, c.path, f.path], [b.path], [d.path], [e.path]])
+
+  def test_get_group_size(self):
+    self.assert_equal(unity.get_group_size(24, 1), 24)
+    self.assert_equal(unity.get_group_size(24, 4), 6)
+    self.assert_equal(unity.get_group_size(6, 8), 6)
+    self.assert_equal(unity.get_group_size(100, 1), unity.MAX_GROUP_SIZE)
+
+if __name__ == "__main__":
+  unittest.main()
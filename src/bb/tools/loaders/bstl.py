@@ -31,7 +31,7 @@ propeller device via ``/dev/ttyUSB0`` serial port::
 __copyright__ = "Copyright (c) 2012 Sladeware LLC"
 __author__ = "Oleksandr Sviridenko"
 
-from bb.utils.spawn import spawn
+from bb.utils.spawn import spawn, ExecutionError
 from bb.tools.loaders import Loader
 
 class BSTLLoader(Loader):
@@ -120,6 +120,6 @@ class BSTLLoader(Loader):
     flags.extend(['-p', self.get_mode()])
     # Spawn!
     try:
-      spawn(loader + flags + [filename], verbose=self.verbose)
-    except BuilderExecutionError, msg:
+      spawn(loader + flags + [filename], debug=self.verbose)
+    except ExecutionError, msg:
       raise LoaderError, msg
@@ -57,8 +57,11 @@ elif os.name == 'posix':
   class Console(object):
     def __init__(self):
       self.fd = sys.stdin.fileno()
+      self.old = None
 
     def setup(self):
+      if not os.isatty(self.fd):
+        return
       self.old = termios.tcgetattr(self.fd)
       new = termios.tcgetattr(self.fd)
       new[3] = new[3] & ~termios.ICANON & ~termios.ECHO & ~termios.ISIG
@@ -71,7 +74,8 @@ elif os.name == 'posix':
       return c
 
     def cleanup(self):
-      termios.tcsetattr(self.fd, termios.TCSAFLUSH, self.old)
+      if self.old is not None:
+        termios.tcsetattr(self.fd, termios.TCSAFLUSH, self.old)
 
   console = Console()
 
@@ -608,7 +608,7 @@ def upload_bootloader(port="/dev/ttyUSB0", config=None, rebuild=False):
         spawn(["homespun", bootloader_src, "-b",
                "-L", "/usr/local/lib/catalina/target/",
                "-D", catalina_config,
-               "-o", bootloader_binary], verbose=True)
+               "-o", bootloader_binary], debug=True)
     # Fix binary name, since '.binary' will be added automatically
     #bootloader_binary += ".binary"
     uploader = SPIUploader(port=port)
@@ -0,0 +1,286 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Author: Oleksandr Sviridenko
+
+"""Registry of toolchains: what is known about a compiler executable without
+running it on every build.
+
+A toolchain is probed once: its version, target triple and builtin include
+directories are asked from the executable itself (e.g. ``gcc -dumpversion``)
+and kept in ``toolchains.json`` in the build directory, keyed by the resolved
+path of the executable and its signature (modification time and size), so
+that an upgraded toolchain is probed again. Supported flags are probed on
+demand and kept with the rest::
+
+  registry = toolchains.get_registry()
+  toolchain = registry.probe("propeller-elf-gcc", toolchains.GCC_PROBE)
+  if toolchain:
+    print(toolchain.get_version(), toolchain.get_target())
+    print(registry.supports_flag(toolchain, "-mcmm"))
+
+Within a process executables are resolved against ``PATH`` and their
+signatures are read once, see
+:func:`bb.tools.compilers.compiler.Compiler.get_identity`.
+"""
+
+import json
+import os
+import threading
+
+import bb.config
+from bb.utils import logging
+from bb.utils import path_utils
+from bb.utils import spawn
+
+logger = logging.get_logger("bb")
+
+REGISTRY_FILENAME = "toolchains.json"
+# Probe types.
+GCC_PROBE = "gcc"
+# A toolchain that cannot be probed is identified by its path and signature.
+GENERIC_PROBE = "generic"
+PROBE_TIMEOUT = 30.0
+
+class Toolchain(object):
+  """Probed properties of the toolchain executable `path`."""
+
+  def __init__(self, path, signature, probe=GENERIC_PROBE, version=None,
+               target=None, include_dirs=None, flags=None):
+    self.path = path
+    self.signature = tuple(signature)
+    self.probe = probe
+    self.version = version
+    self.target = target
+    self.include_dirs = include_dirs or []
+    # Maps probed flags to True if the flag is supported.
+    self.flags = flags or dict()
+
+  def get_version(self):
+    return self.version
+
+  def get_target(self):
+    return self.target
+
+  def get_include_dirs(self):
+    """Returns builtin include directories of the compiler."""
+    return self.include_dirs
+
+  def get_identity(self, probe=GENERIC_PROBE):
+    """Returns a tuple that identifies the toolchain in action keys. The
+    version and target are not known by the generic `probe`, thus they are
+    not a part of its identity, so that the identity does not depend on
+    whether the toolchain was probed by another probe.
+    """
+    identity = (self.path,) + self.signature
+    if probe == GENERIC_PROBE:
+      return identity
+    return identity + (self.version, self.target)
+
+  def to_dict(self):
+    return dict(path=self.path, signature=list(self.signature),
+                probe=self.probe, version=self.version, target=self.target,
+                include_dirs=self.include_dirs, flags=self.flags)
+
+  @classmethod
+  def from_dict(cls, data):
+    # JSON strings are unicode, while probed values are str. The identity
+    # has to be the same, since it is a part of fingerprints and action keys.
+    def to_str(value):
+      return value if value is None else str(value)
+    return cls(str(data["path"]), tuple(data["signature"]),
+               to_str(data["probe"]), to_str(data["version"]),
+               to_str(data["target"]),
+               [str(path) for path in data["include_dirs"]],
+               dict([(str(flag), supported)
+                     for flag, supported in data["flags"].items()]))
+
+  def __repr__(self):
+    return "Toolchain(%s, %s, %s)" % (self.path, self.version, self.target)
+
+def _run_probe(cmd):
+  """Returns the result of probe command `cmd` or ``None`` if it cannot be
+  run.
+  """
+  try:
+    return spawn.run(cmd, capture=True, timeout=PROBE_TIMEOUT)
+  except spawn.ExecutionError, e:
+    logger.debug("Probe %s failed: %s" % (" ".join(cmd), e))
+    return None
+
+def parse_include_dirs(output):
+  """Returns the list of include directories from the verbose output of GCC
+  preprocessor, e.g. ``gcc -E -v -x c /dev/null``.
+  """
+  include_dirs = []
+  in_list = False
+  for line in output.splitlines():
+    if line.startswith("#include <...> search starts here:"):
+      in_list = True
+    elif line.startswith("End of search list."):
+      break
+    elif in_list and line.startswith(" "):
+      path = line.strip()
+      # Darwin marks framework directories.
+      if path.endswith(" (framework directory)"):
+        continue
+      include_dirs.append(os.path.normpath(path))
+  return include_dirs
+
+def probe_gcc(toolchain):
+  """Fills in `toolchain` properties of GCC-like compiler."""
+  result = _run_probe([toolchain.path, "-dumpversion"])
+  if result and result.is_ok():
+    toolchain.version = result.stdout.strip()
+  result = _run_probe([toolchain.path, "-dumpmachine"])
+  if result and result.is_ok():
+    toolchain.target = result.stdout.strip()
+  result = _run_probe([toolchain.path, "-E", "-v", "-x", "c", os.devnull,
+                       "-o", os.devnull])
+  if result and result.is_ok():
+    toolchain.include_dirs = parse_include_dirs(result.stderr)
+
+_PROBES = {
+  GCC_PROBE: probe_gcc,
+  GENERIC_PROBE: lambda toolchain: None,
+}
+
+class ToolchainRegistry(object):
+  """Keeps probed toolchains in file `path`, or in memory only if `path` is
+  ``None``.
+  """
+
+  def __init__(self, path=None):
+    self._path = path
+    self._lock = threading.RLock()
+    self._toolchains = None
+    # Executables resolved by this process: (name, PATH) -> path, and
+    # signatures of resolved paths.
+    self._resolved = dict()
+    self._signatures = dict()
+    self.probes = 0
+
+  def get_path(self):
+    return self._path
+
+  def _load(self):
+    if self._toolchains is not None:
+      return
+    self._toolchains = dict()
+    if not self._path:
+      return
+    try:
+      with open(self._path) as handle:
+        for data in json.load(handle):
+          self._toolchains[data["path"]] = Toolchain.from_dict(data)
+    except (IOError, ValueError, KeyError, TypeError):
+      pass
+
+  def save(self):
+    """Writes the registry to its file, if any."""
+    if not self._path:
+      return
+    with self._lock:
+      data = [toolchain.to_dict() for toolchain in self._toolchains.values()]
+      path_utils.mkpath(path_utils.dirname(self._path))
+      tmp_path = "%s.%d.tmp" % (self._path, os.getpid())
+      with open(tmp_path, "w") as handle:
+        json.dump(data, handle, indent=2, sort_keys=True)
+      os.rename(tmp_path, self._path)
+
+  def resolve(self, executable):
+    """Returns the path of `executable`, looked up in ``PATH`` once per
+    process, or ``None`` if it cannot be found.
+    """
+    key = (executable, os.environ.get("PATH"))
+    with self._lock:
+      if key not in self._resolved:
+        path = spawn.which(executable)
+        self._resolved[key] = path and path_utils.abspath(path)
+      return self._resolved[key]
+
+  def get_signature(self, path):
+    with self._lock:
+      if path not in self._signatures:
+        self._signatures[path] = path_utils.signature(path)
+      return self._signatures[path]
+
+  def probe(self, executable, probe=GENERIC_PROBE):
+    """Returns :class:`Toolchain` of `executable`, probed by `probe` unless it
+    is known already, or ``None`` if the executable cannot be found.
+    """
+    path = self.resolve(executable)
+    signature = path and self.get_signature(path)
+    if not signature:
+      return None
+    with self._lock:
+      self._load()
+      toolchain = self._toolchains.get(path)
+      # Any probe tells what the generic one does.
+      if toolchain and toolchain.signature == tuple(signature) and \
+            probe in (toolchain.probe, GENERIC_PROBE):
+        return toolchain
+      toolchain = Toolchain(path, signature, probe)
+      _PROBES[probe](toolchain)
+      self.probes += 1
+      logger.debug("Probed %s" % toolchain)
+      self._toolchains[path] = toolchain
+      self.save()
+      return toolchain
+
+  def supports_flag(self, toolchain, flag):
+    """Returns ``True`` if GCC-like `toolchain` accepts `flag`. The answer is
+    kept by the registry.
+    """
+    with self._lock:
+      if flag in toolchain.flags:
+        return toolchain.flags[flag]
+    result = _run_probe([toolchain.path, "-Werror", flag, "-x", "c", "-c",
+                         os.devnull, "-o", os.devnull])
+    supported = bool(result and result.is_ok())
+    with self._lock:
+      toolchain.flags[flag] = supported
+      self.save()
+    return supported
+
+  def get_toolchains(self):
+    """Returns a list of known toolchains."""
+    with self._lock:
+      self._load()
+      return sorted(self._toolchains.values(),
+                    key=lambda toolchain: toolchain.path)
+
+def new_registry():
+  """Returns :class:`ToolchainRegistry` kept in the build directory defined by
+  `builddir` option of `b3` section of user settings.
+  """
+  builddir = bb.config.user_settings.get("b3", "builddir")
+  return ToolchainRegistry(path_utils.join(builddir, REGISTRY_FILENAME))
+
+_registry = None
+
+def get_registry():
+  """Returns the current registry, creates one if there is none."""
+  global _registry
+  if _registry is None:
+    _registry = new_registry()
+  return _registry
+
+def set_registry(registry):
+  global _registry
+  if registry is not None and not isinstance(registry, ToolchainRegistry):
+    raise TypeError("'registry' has to be a ToolchainRegistry: %s" % registry)
+  _registry = registry
+  return registry
@@ -0,0 +1,63 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+import stat
+
+from bb.utils.testing import unittest
+from bb.tools import toolchains
+
+FAKE_GCC = """#!/bin/sh
+echo probe >> "$0.log"
+case "$1" in
+  -dumpversion) echo 4.6.1 ;;
+  -dumpmachine) echo propeller-elf ;;
+  -E) printf '#include <...> search starts here:\\n /opt/inc\\nEnd of search list.\\n' >&2 ;;
+  *) test "$2" != -mbad ;;
+esac
+"""
+
+class ToolchainRegistryTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.gcc = os.path.join(self.dir, "fake-gcc")
+    with open(self.gcc, "w") as handle:
+      handle.write(FAKE_GCC)
+    os.chmod(self.gcc, stat.S_IRWXU)
+    self.path = os.path.join(self.dir, "toolchains.json")
+
+  def get_num_probes(self):
+    with open(self.gcc + ".log") as handle:
+      return len(handle.readlines())
+
+  def test_probe(self):
+    registry = toolchains.ToolchainRegistry(self.path)
+    toolchain = registry.probe(self.gcc, toolchains.GCC_PROBE)
+    self.assert_equal(toolchain.get_version(), "4.6.1")
+    self.assert_equal(toolchain.get_target(), "propeller-elf")
+    self.assert_equal(toolchain.get_include_dirs(), ["/opt/inc"])
+    self.assert_true(registry.supports_flag(toolchain, "-mcmm"))
+    self.assert_false(registry.supports_flag(toolchain, "-mbad"))
+    self.assert_equal(self.get_num_probes(), 5)
+    identity = repr(toolchain.get_identity(toolchains.GCC_PROBE))
+    # Another process reads the registry and does not probe.
+    registry = toolchains.ToolchainRegistry(self.path)
+    toolchain = registry.probe(self.gcc, toolchains.GCC_PROBE)
+    self.assert_equal(repr(toolchain.get_identity(toolchains.GCC_PROBE)),
+                      identity)
+    self.assert_false(registry.supports_flag(toolchain, "-mbad"))
+    self.assert_equal(registry.probe(self.gcc).get_version(), "4.6.1")
+    self.assert_equal(self.get_num_probes(), 5)
+    # The toolchain has been changed.
+    with open(self.gcc, "a") as handle:
+      handle.write("\n")
+    registry = toolchains.ToolchainRegistry(self.path)
+    registry.probe(self.gcc, toolchains.GCC_PROBE)
+    self.assert_equal(self.get_num_probes(), 8)
+    self.assert_equal(registry.probe(os.path.join(self.dir, "none")), None)
+
+if __name__ == "__main__":
+  unittest.main()
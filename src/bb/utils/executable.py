@@ -218,6 +218,16 @@ class ExecutableWrapper(object):
       return False
     return True
 
+  def get_identity(self):
+    """Returns a tuple that identifies the executable: class name, resolved
+    path, modification time and size of the executable file.
+    """
+    exe = self.get_executable()
+    path = exe and spawn.which(exe)
+    if not path:
+      return (self.__class__.__name__, exe)
+    return (self.__class__.__name__, path) + path_utils.signature(path)
+
   def run(self, dry_run=False):
     dry_run = self.is_dry_run_mode_enabled() or dry_run
     exe = self.get_executable()
@@ -0,0 +1,199 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The filesystem snapshot memoizes stat results, directory listings and
+directories created during a build, so that BUILD files, rules and compilers
+asking the same questions about the filesystem do not hit it again::
+
+  fs_snapshot.set_snapshot(fs_snapshot.FileSystemSnapshot())
+  fs_snapshot.exists("BUILD") # calls os.stat()
+  fs_snapshot.isfile("BUILD") # does not
+
+Module-level functions use the current snapshot and go straight to the
+filesystem if no snapshot has been installed. The snapshot assumes that
+nobody else changes the filesystem during a build; long-running processes,
+such as the build server and ``b3 build --watch``, have to call
+:func:`FileSystemSnapshot.invalidate` for the changed paths.
+"""
+
+import fnmatch
+import glob
+import os
+import stat as _stat
+
+from bb.utils import path_utils
+
+class FileSystemSnapshot(object):
+  """Memoizes stat results, directory listings and created directories. Paths
+  are normalized to absolute paths.
+  """
+
+  def __init__(self):
+    self._stats = dict()
+    self._listings = dict()
+    self._created_dirs = set()
+
+  def stat(self, path):
+    """Returns `os.stat()` result for `path` or ``None`` if the path does not
+    exist.
+    """
+    path = os.path.abspath(path)
+    try:
+      return self._stats[path]
+    except KeyError:
+      pass
+    try:
+      result = os.stat(path)
+    except OSError:
+      result = None
+    self._stats[path] = result
+    return result
+
+  def exists(self, path):
+    return self.stat(path) is not None
+
+  def isdir(self, path):
+    result = self.stat(path)
+    return result is not None and _stat.S_ISDIR(result.st_mode)
+
+  def isfile(self, path):
+    result = self.stat(path)
+    return result is not None and _stat.S_ISREG(result.st_mode)
+
+  def getmtime(self, path):
+    result = self.stat(path)
+    if result is None:
+      raise OSError("No such file or directory: '%s'" % path)
+    return result.st_mtime
+
+  def listdir(self, path):
+    """Returns a sorted list of entries of the directory `path`, or an empty
+    list if there is no such directory.
+    """
+    path = os.path.abspath(path)
+    try:
+      return list(self._listings[path])
+    except KeyError:
+      pass
+    try:
+      entries = tuple(sorted(os.listdir(path)))
+    except OSError:
+      entries = ()
+    self._listings[path] = entries
+    return list(entries)
+
+  def glob1(self, dirname, pattern):
+    """Returns a list of entries of `dirname` that match `pattern`. Works as
+    :func:`glob.glob1`.
+    """
+    names = self.listdir(dirname)
+    if not pattern.startswith("."):
+      names = [name for name in names if not name.startswith(".")]
+    return fnmatch.filter(names, pattern)
+
+  def mkpath(self, path, mode=0777):
+    """Creates the directory `path` and all missing ancestors once per
+    snapshot.
+    """
+    path = os.path.abspath(path)
+    if path in self._created_dirs:
+      return
+    created = path_utils.mkpath(path, mode)
+    if created:
+      self.invalidate(created)
+    head = path
+    while head not in self._created_dirs:
+      self._created_dirs.add(head)
+      parent = os.path.dirname(head)
+      if parent == head:
+        break
+      head = parent
+
+  def touch(self, path, mode=0777, recursive=False):
+    """Creates an empty file `path`. Works as :func:`path_utils.touch`, but
+    creates missing directories with :func:`mkpath`.
+    """
+    if recursive:
+      self.mkpath(os.path.dirname(os.path.abspath(path)), mode)
+    path_utils.touch(path, mode=mode)
+    self.invalidate([path])
+    return path
+
+  def invalidate(self, paths=None):
+    """Forgets everything known about `paths` and listings of their parent
+    directories. Forgets everything if `paths` is not provided.
+    """
+    if paths is None:
+      self._stats.clear()
+      self._listings.clear()
+      self._created_dirs.clear()
+      return
+    for path in paths:
+      path = os.path.abspath(path)
+      self._stats.pop(path, None)
+      self._listings.pop(path, None)
+      self._listings.pop(os.path.dirname(path), None)
+      self._created_dirs.discard(path)
+
+_snapshot = None
+
+def get_snapshot():
+  """Returns the current snapshot or ``None``."""
+  return _snapshot
+
+def set_snapshot(snapshot):
+  """Installs `snapshot`, ``None`` disables memoization."""
+  global _snapshot
+  if snapshot is not None and not isinstance(snapshot, FileSystemSnapshot):
+    raise TypeError("'snapshot' has to be a FileSystemSnapshot: %s" % snapshot)
+  _snapshot = snapshot
+  return snapshot
+
+def new_snapshot():
+  """Creates a new snapshot and makes it the current one."""
+  return set_snapshot(FileSystemSnapshot())
+
+def invalidate(paths=None):
+  """Invalidates `paths` in the current snapshot, if any."""
+  if _snapshot is not None:
+    _snapshot.invalidate(paths)
+
+def exists(path):
+  if _snapshot is None:
+    return os.path.exists(path)
+  return _snapshot.exists(path)
+
+def isdir(path):
+  if _snapshot is None:
+    return os.path.isdir(path)
+  return _snapshot.isdir(path)
+
+def isfile(path):
+  if _snapshot is None:
+    return os.path.isfile(path)
+  return _snapshot.isfile(path)
+
+def getmtime(path):
+  if _snapshot is None:
+    return os.path.getmtime(path)
+  return _snapshot.getmtime(path)
+
+def glob1(dirname, pattern):
+  if _snapshot is None:
+    return glob.glob1(dirname, pattern)
+  return _snapshot.glob1(dirname, pattern)
+
+def mkpath(path, mode=0777):
+  if _snapshot is None:
+    path_utils.mkpath(path, mode)
+  else:
+    _snapshot.mkpath(path, mode)
+
+def touch(path, mode=0777, recursive=False):
+  if _snapshot is None:
+    return path_utils.touch(path, mode=mode, recursive=recursive)
+  return _snapshot.touch(path, mode=mode, recursive=recursive)
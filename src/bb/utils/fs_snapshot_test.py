@@ -0,0 +1,38 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import os
+
+from bb.utils.testing import unittest
+from bb.utils import fs_snapshot
+
+class FileSystemSnapshotTest(unittest.TestCase):
+
+  def setup(self):
+    self.make_temp_dir()
+    self.snapshot = fs_snapshot.FileSystemSnapshot()
+
+  def test_memoization(self):
+    path = os.path.join(self.dir, "BUILD")
+    self.assert_false(self.snapshot.exists(path))
+    self.assert_equal(self.snapshot.glob1(self.dir, "BUILD*"), [])
+    open(path, "w").close()
+    self.assert_false(self.snapshot.exists(path))
+    self.assert_equal(self.snapshot.glob1(self.dir, "BUILD*"), [])
+    self.snapshot.invalidate([path])
+    self.assert_true(self.snapshot.isfile(path))
+    self.assert_equal(self.snapshot.glob1(self.dir, "BUILD*"), ["BUILD"])
+
+  def test_mkpath(self):
+    path = os.path.join(self.dir, "a", "b")
+    self.assert_false(self.snapshot.isdir(path))
+    self.snapshot.mkpath(path)
+    self.assert_true(self.snapshot.isdir(path))
+    self.assert_equal(self.snapshot.listdir(self.dir), ["a"])
+    self.snapshot.touch(os.path.join(path, "c", "d"), recursive=True)
+    self.assert_true(self.snapshot.isfile(os.path.join(path, "c", "d")))
+
+if __name__ == "__main__":
+  unittest.main()
@@ -15,6 +15,8 @@
 #
 # Author: Oleksandr Sviridenko
 
+import errno
+import hashlib
 import inspect
 import os
 from os.path import *
@@ -33,6 +35,27 @@ def localpath(*args):
   filename = inspect.getsourcefile(caller_frame[1][0])
   return join(dirname(filename), *args)
 
+def digest(path, block_size=1 << 16):
+  """Returns hex SHA-1 digest of the content of the file `path`."""
+  sha1 = hashlib.sha1()
+  with open(path, "rb") as handle:
+    while True:
+      block = handle.read(block_size)
+      if not block:
+        break
+      sha1.update(block)
+  return sha1.hexdigest()
+
+def signature(path):
+  """Returns a tuple (mtime, size) for the file `path` or ``None`` if the file
+  does not exist.
+  """
+  try:
+    st = os.stat(path)
+  except OSError:
+    return None
+  return (st.st_mtime, st.st_size)
+
 def remove_tree(directory, dry_run=False):
   """Recursively removes an entire directory tree.
 
@@ -121,6 +144,8 @@ def mkpath(name, mode=0777, verbose=0, dry_run=False):
         os.mkdir(head)
         created_dirs.append(head)
       except OSError, exc:
-        raise OSError("could not create '%s': %s" % (head, exc[-1]))
+        # The directory could be created by another thread in the meantime.
+        if not (exc.errno == errno.EEXIST and isdir(head)):
+          raise OSError("could not create '%s': %s" % (head, exc[-1]))
     _path_created[abs_head] = 1
   return created_dirs
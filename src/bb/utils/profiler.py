@@ -0,0 +1,194 @@
+# -*- coding: utf-8; -*-
+#
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko <info@bionicbunny.org>
+
+"""The profiler records spans of time spent on named pieces of work. Spans are
+recorded only while a profiler is installed, otherwise :func:`span` costs a
+single check::
+
+  profiler.set_profiler(profiler.Profiler())
+  with profiler.span("main.c", "process"):
+    compile()
+  profiler.get_profiler().write_trace("trace.json")
+
+The trace is written in Chrome trace-event format and can be opened with
+chrome://tracing.
+"""
+
+import contextlib
+import json
+import thread
+import threading
+import time
+
+class Span(object):
+  """Represents a completed piece of work."""
+
+  __slots__ = ("name", "category", "start", "end", "thread", "args")
+
+  def __init__(self, name, category, start, end, thread_id, args=None):
+    self.name = name
+    self.category = category
+    self.start = start
+    self.end = end
+    self.thread = thread_id
+    self.args = args or dict()
+
+  def get_duration(self):
+    return self.end - self.start
+
+  def __repr__(self):
+    return "Span(%s, %s, %.3fs)" % (self.name, self.category,
+                                    self.get_duration())
+
+class Profiler(object):
+  """Collects spans from all threads."""
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._spans = []
+    self._start = time.time()
+    self._end = None
+
+  def get_start_time(self):
+    return self._start
+
+  def get_wall_time(self):
+    """Returns the time since the profiler was created till :func:`stop` was
+    called, or till now.
+    """
+    return (self._end or time.time()) - self._start
+
+  def stop(self):
+    self._end = time.time()
+
+  @contextlib.contextmanager
+  def span(self, name, category, **args):
+    start = time.time()
+    try:
+      yield
+    finally:
+      span = Span(name, category, start, time.time(), thread.get_ident(), args)
+      with self._lock:
+        self._spans.append(span)
+
+  def get_spans(self, category=None):
+    """Returns a list of spans of `category` (all spans if `category` is not
+    provided) sorted by start time.
+    """
+    with self._lock:
+      spans = list(self._spans)
+    if category:
+      spans = [span for span in spans if span.category == category]
+    return sorted(spans, key=lambda span: span.start)
+
+  def get_total_time(self, category):
+    """Returns the sum of durations of spans of `category`."""
+    return sum([span.get_duration() for span in self.get_spans(category)])
+
+  def get_durations(self, category):
+    """Returns a dict that maps span names of `category` to the sum of their
+    durations.
+    """
+    durations = dict()
+    for span in self.get_spans(category):
+      durations[span.name] = durations.get(span.name, 0.0) + \
+          span.get_duration()
+    return durations
+
+  def get_trace_events(self):
+    """Returns a list of complete ("X") events in Chrome trace-event format,
+    where times are in microseconds since the profiler was created.
+    """
+    threads = dict()
+    events = []
+    for span in self.get_spans():
+      tid = threads.setdefault(span.thread, len(threads))
+      events.append({
+        "name": span.name,
+        "cat": span.category,
+        "ph": "X",
+        "ts": int((span.start - self._start) * 1e6),
+        "dur": int(span.get_duration() * 1e6),
+        "pid": 0,
+        "tid": tid,
+        "args": span.args,
+      })
+    return events
+
+  def write_trace(self, path):
+    with open(path, "w") as handle:
+      json.dump({"traceEvents": self.get_trace_events(),
+                 "displayTimeUnit": "ms"}, handle)
+
+def get_critical_path(roots, durations, successors):
+  """Returns a tuple of the longest path and its duration, where the path
+  starts at one of `roots` and follows `successors(node)` function, and the
+  length of a path is the sum of `durations` of its nodes (nodes without
+  duration take no time). The graph has to be acyclic.
+  """
+  finish = dict()
+  next_node = dict()
+  for root in roots:
+    stack = [(root, False)]
+    while stack:
+      node, expanded = stack.pop()
+      if node in finish:
+        continue
+      children = successors(node)
+      if not expanded:
+        stack.append((node, True))
+        stack.extend([(child, False) for child in children
+                      if child not in finish])
+        continue
+      best = None
+      for child in children:
+        if best is None or finish[child] > finish[best]:
+          best = child
+      next_node[node] = best
+      finish[node] = durations.get(node, 0.0) + \
+          (finish[best] if best is not None else 0.0)
+  if not finish:
+    return ([], 0.0)
+  node = max(roots, key=lambda root: finish[root])
+  length = finish[node]
+  path = []
+  while node is not None:
+    path.append(node)
+    node = next_node[node]
+  return (path, length)
+
+class _NullContext(object):
+
+  def __enter__(self):
+    return None
+
+  def __exit__(self, *exc_info):
+    return False
+
+_null_context = _NullContext()
+_profiler = None
+
+def get_profiler():
+  """Returns the current profiler or ``None``."""
+  return _profiler
+
+def set_profiler(profiler):
+  """Installs `profiler`, ``None`` disables profiling."""
+  global _profiler
+  if profiler is not None and not isinstance(profiler, Profiler):
+    raise TypeError("'profiler' has to be a Profiler: %s" % profiler)
+  _profiler = profiler
+  return profiler
+
+def span(name, category, **args):
+  """Returns a context manager that records a span with the current
+  profiler, if any.
+  """
+  profiler = _profiler
+  if profiler is None:
+    return _null_context
+  return profiler.span(name, category, **args)
@@ -0,0 +1,37 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+from bb.utils.testing import unittest
+from bb.utils import profiler
+
+class ProfilerTest(unittest.TestCase):
+
+  def teardown(self):
+    profiler.set_profiler(None)
+
+  def test_span(self):
+    with profiler.span("nothing", "rule"):
+      pass
+    build_profiler = profiler.set_profiler(profiler.Profiler())
+    with profiler.span("main.c", "process", cmd="cc main.c"):
+      pass
+    spans = build_profiler.get_spans()
+    self.assert_equal(len(spans), 1)
+    self.assert_equal(spans[0].name, "main.c")
+    events = build_profiler.get_trace_events()
+    self.assert_equal(events[0]["ph"], "X")
+    self.assert_equal(events[0]["args"], {"cmd": "cc main.c"})
+
+  def test_critical_path(self):
+    graph = {"app": ["lib", "fs"], "lib": ["base"], "fs": ["base"],
+             "base": []}
+    durations = {"app": 1.0, "lib": 2.0, "fs": 5.0, "base": 1.0}
+    path, length = profiler.get_critical_path(["app"], durations,
+                                              graph.__getitem__)
+    self.assert_equal(path, ["app", "fs", "base"])
+    self.assert_equal(length, 7.0)
+
+if __name__ == "__main__":
+  unittest.main()
@@ -17,19 +17,378 @@
 #
 # Author: Oleksandr Sviridenko
 
+"""The process engine runs programs with bounded concurrency: no more than
+:func:`get_max_jobs` programs are running at the same time, no matter how
+many threads start them. A program can be run synchronously::
+
+  result = spawn.run(["gcc", "--version"], capture=True, timeout=10)
+  print(result.returncode, result.stdout, result.rusage["maxrss"])
+
+or asynchronously, in which case a :class:`Future` is returned::
+
+  futures = [spawn.submit(cmd, capture=True) for cmd in cmds]
+  results = [future.result() for future in futures]
+
+Captured output is limited by `max_output` bytes per stream, the rest is
+read and dropped. Once `timeout` seconds have passed, the program is killed.
+Resource usage (user and system time and maximal resident set size) of each
+program is reported in its :class:`Result`, totals are kept by the engine.
+
+:func:`spawn` runs a program and raises :class:`ExecutionError` if it fails;
+the output is not captured unless asked, so that the program writes to the
+descriptors of this process.
+"""
+
+import errno
 import os
-import sys
+import Queue
+import select
+import subprocess
+import threading
+import time
 import types
 
 from bb.utils import logging
+from bb.utils import profiler
 
 logger = logging.get_logger("bb")
 
+# The default limit of captured output per stream, in bytes.
+DEFAULT_MAX_OUTPUT = 1 << 20
+
 class PlatformError(Exception):
   """Platform error."""
 
 class ExecutionError(Exception):
-  """Execution error."""
+  """Execution error. Keeps the :class:`Result` of the failed program, if
+  any.
+  """
+
+  def __init__(self, message, result=None):
+    Exception.__init__(self, message)
+    self.result = result
+
+class Result(object):
+  """The result of a program run by the process engine. `returncode` is
+  negative if the program was terminated by a signal, `rusage` is a dict with
+  `utime`, `stime` (in seconds) and `maxrss` (in kilobytes).
+  """
+
+  def __init__(self, cmd, returncode, stdout=None, stderr=None, rusage=None,
+               elapsed=0.0, timed_out=False, truncated=False):
+    self.cmd = cmd
+    self.returncode = returncode
+    self.stdout = stdout
+    self.stderr = stderr
+    self.rusage = rusage or dict(utime=0.0, stime=0.0, maxrss=0)
+    self.elapsed = elapsed
+    self.timed_out = timed_out
+    # True if some output has been dropped because of the limit.
+    self.truncated = truncated
+
+  def is_ok(self):
+    return self.returncode == 0 and not self.timed_out
+
+  def get_error_message(self):
+    if self.timed_out:
+      return "Command '%s' timed out after %.1fs" % (self.cmd[0],
+                                                    self.elapsed)
+    if self.returncode < 0:
+      return "Command '%s' terminated by signal %d" % (self.cmd[0],
+                                                       -self.returncode)
+    return "Command '%s' failed with exit status %d" % (self.cmd[0],
+                                                        self.returncode)
+
+  def __repr__(self):
+    return "Result(%s, %d)" % (self.cmd[0], self.returncode)
+
+class Future(object):
+  """The result of a program that will be available once it is finished, see
+  :func:`ProcessEngine.submit`.
+  """
+
+  def __init__(self, cmd):
+    self.cmd = cmd
+    self._event = threading.Event()
+    self._result = None
+    self._exception = None
+
+  def done(self):
+    return self._event.is_set()
+
+  def _wait(self, timeout):
+    deadline = timeout is not None and time.time() + timeout
+    # Py2.x: Event.wait() without timeout cannot be interrupted.
+    while not self._event.wait(0.1):
+      if deadline and time.time() >= deadline:
+        raise ExecutionError("Command '%s' is not finished in %.1fs" %
+                             (self.cmd[0], timeout))
+
+  def result(self, timeout=None):
+    """Waits for the program and returns its :class:`Result`. Raises the
+    exception that prevented the program from being run, if any.
+    """
+    self._wait(timeout)
+    if self._exception:
+      raise self._exception
+    return self._result
+
+  def exception(self, timeout=None):
+    self._wait(timeout)
+    return self._exception
+
+  def _set_result(self, result):
+    self._result = result
+    self._event.set()
+
+  def _set_exception(self, exception):
+    self._exception = exception
+    self._event.set()
+
+def _read_output(process, deadline, max_output):
+  """Reads stdout and stderr of `process` until both are closed or
+  `deadline` has come. Returns a tuple of stdout, stderr, and flags that tell
+  whether the deadline has come and whether some output has been dropped.
+  """
+  streams = {process.stdout.fileno(): [], process.stderr.fileno(): []}
+  sizes = dict([(fd, 0) for fd in streams])
+  outputs = dict(streams)
+  truncated = False
+  timed_out = False
+  while streams:
+    wait = None
+    if deadline:
+      wait = deadline - time.time()
+      if wait <= 0:
+        timed_out = True
+        break
+    try:
+      ready, _, _ = select.select(list(streams), [], [], wait)
+    except select.error, e:
+      if e.args[0] == errno.EINTR:
+        continue
+      raise
+    for fd in ready:
+      data = os.read(fd, 65536)
+      if not data:
+        del streams[fd]
+        continue
+      if sizes[fd] < max_output:
+        outputs[fd].append(data[:max_output - sizes[fd]])
+      if sizes[fd] + len(data) > max_output:
+        truncated = True
+      sizes[fd] += len(data)
+  return ("".join(outputs[process.stdout.fileno()]),
+          "".join(outputs[process.stderr.fileno()]), timed_out, truncated)
+
+def _wait(pid, deadline):
+  """Waits for the process `pid` till `deadline`. Returns a tuple of status
+  and resource usage, or ``None`` if the deadline has come.
+  """
+  delay = 0.001
+  while True:
+    try:
+      if not deadline:
+        _, status, rusage = os.wait4(pid, 0)
+        return status, rusage
+      wpid, status, rusage = os.wait4(pid, os.WNOHANG)
+    except OSError, e:
+      if e.errno == errno.EINTR:
+        continue
+      raise
+    if wpid:
+      return status, rusage
+    if time.time() >= deadline:
+      return None
+    time.sleep(delay)
+    delay = min(delay * 2, 0.05)
+
+def _kill(process):
+  try:
+    process.kill()
+  except OSError:
+    pass
+
+def _new_stats():
+  return dict(processes=0, failures=0, timeouts=0, utime=0.0, stime=0.0,
+              maxrss=0, elapsed=0.0)
+
+class ProcessEngine(object):
+  """Runs programs, up to `max_jobs` at the same time."""
+
+  def __init__(self, max_jobs=1):
+    self._lock = threading.Lock()
+    self._queue = Queue.Queue()
+    self._num_workers = 0
+    self._max_jobs = 1
+    self._slots = None
+    self.set_max_jobs(max_jobs)
+    self._stats = _new_stats()
+    # Stats of programs run since begin_stats() calls.
+    self._windows = []
+
+  def set_max_jobs(self, n):
+    """Sets the maximum number of programs that can be run at once."""
+    if not type(n) is types.IntType or n < 1:
+      raise TypeError("'n' must be a positive integer")
+    self._max_jobs = n
+    self._slots = threading.BoundedSemaphore(n)
+
+  def get_max_jobs(self):
+    return self._max_jobs
+
+  def get_stats(self):
+    """Returns a dict with the number of programs run, failed and timed out,
+    their total user and system time, elapsed time and maximal resident set
+    size.
+    """
+    with self._lock:
+      return dict(self._stats)
+
+  def begin_stats(self):
+    """Starts to collect stats (see :func:`get_stats`) of programs run from
+    now on, e.g. by a single build of a long running process. Returns the
+    stats to be passed to :func:`end_stats`.
+    """
+    stats = _new_stats()
+    with self._lock:
+      self._windows.append(stats)
+    return stats
+
+  def end_stats(self, stats):
+    """Stops collecting `stats` started by :func:`begin_stats` and returns
+    a copy of them.
+    """
+    with self._lock:
+      self._windows = [window for window in self._windows
+                       if window is not stats]
+      return dict(stats)
+
+  def run(self, cmd, capture=False, timeout=None, max_output=None, env=None,
+          cwd=None):
+    """Runs `cmd` and returns its :class:`Result`. The output is captured if
+    `capture` is ``True``, otherwise it goes to the descriptors of this
+    process. Raises :class:`ExecutionError` if the program cannot be
+    started.
+    """
+    if max_output is None:
+      max_output = DEFAULT_MAX_OUTPUT
+    with self._slots:
+      with profiler.span(os.path.basename(cmd[0]), "process",
+                         cmd=" ".join(cmd)):
+        result = self._execute(cmd, capture, timeout, max_output, env, cwd)
+    with self._lock:
+      for stats in [self._stats] + self._windows:
+        stats["processes"] += 1
+        stats["failures"] += int(not result.is_ok())
+        stats["timeouts"] += int(result.timed_out)
+        stats["utime"] += result.rusage["utime"]
+        stats["stime"] += result.rusage["stime"]
+        stats["elapsed"] += result.elapsed
+        stats["maxrss"] = max(stats["maxrss"], result.rusage["maxrss"])
+    return result
+
+  def _execute(self, cmd, capture, timeout, max_output, env, cwd):
+    start = time.time()
+    deadline = timeout and start + timeout
+    pipe = capture and subprocess.PIPE or None
+    try:
+      # Descriptors have to be closed, otherwise a child can keep pipes of
+      # programs started by other threads open.
+      process = subprocess.Popen(cmd, stdout=pipe, stderr=pipe, env=env,
+                                 cwd=cwd, close_fds=True)
+    except OSError, e:
+      raise ExecutionError("Unable to execute %s: %s" % (cmd[0], e.strerror))
+    stdout = stderr = None
+    timed_out = truncated = False
+    try:
+      if capture:
+        stdout, stderr, timed_out, truncated = \
+            _read_output(process, deadline, max_output)
+      waited = None
+      if not timed_out:
+        waited = _wait(process.pid, deadline)
+      if not waited:
+        timed_out = True
+        _kill(process)
+        waited = _wait(process.pid, None)
+    except:
+      _kill(process)
+      raise
+    finally:
+      for stream in (process.stdout, process.stderr):
+        if stream:
+          stream.close()
+    status, rusage = waited
+    if os.WIFSIGNALED(status):
+      returncode = -os.WTERMSIG(status)
+    else:
+      returncode = os.WEXITSTATUS(status)
+    # The process has been waited for, Popen must not do it once again.
+    process.returncode = returncode
+    return Result(cmd, returncode, stdout, stderr,
+                  dict(utime=rusage.ru_utime, stime=rusage.ru_stime,
+                       maxrss=rusage.ru_maxrss),
+                  time.time() - start, timed_out, truncated)
+
+  def submit(self, cmd, **kwargs):
+    """Schedules `cmd` to be run with arguments of :func:`run` and returns a
+    :class:`Future`.
+    """
+    future = Future(cmd)
+    self._queue.put((future, cmd, kwargs))
+    with self._lock:
+      if self._num_workers < self._max_jobs:
+        self._num_workers += 1
+        worker = threading.Thread(target=self._work)
+        worker.daemon = True
+        worker.start()
+    return future
+
+  def _work(self):
+    while True:
+      future, cmd, kwargs = self._queue.get()
+      try:
+        future._set_result(self.run(cmd, **kwargs))
+      except Exception, e:
+        future._set_exception(e)
+
+  def spawn_many(self, cmds, **kwargs):
+    """Runs `cmds` concurrently with arguments of :func:`run` and returns a
+    list of their results in the same order.
+    """
+    futures = [self.submit(cmd, **kwargs) for cmd in cmds]
+    return [future.result() for future in futures]
+
+_engine = ProcessEngine()
+
+def get_engine():
+  return _engine
+
+def set_max_jobs(n):
+  """Sets the maximum number of programs that can be spawned at once."""
+  _engine.set_max_jobs(n)
+
+def get_max_jobs():
+  """Returns the maximum number of programs that can be spawned at once."""
+  return _engine.get_max_jobs()
+
+def run(cmd, **kwargs):
+  """Runs `cmd` with the engine, see :func:`ProcessEngine.run`."""
+  return _engine.run(_check_cmd(cmd), **kwargs)
+
+def submit(cmd, **kwargs):
+  """Schedules `cmd` with the engine, see :func:`ProcessEngine.submit`."""
+  return _engine.submit(_check_cmd(cmd), **kwargs)
+
+def spawn_many(cmds, **kwargs):
+  """Runs `cmds` with the engine, see :func:`ProcessEngine.spawn_many`."""
+  return _engine.spawn_many([_check_cmd(cmd) for cmd in cmds], **kwargs)
+
+def _check_cmd(cmd):
+  if not type(cmd) is types.ListType:
+    raise TypeError("'cmd' must be a list")
+  return [str(arg) for arg in cmd]
 
 def which(program):
   def is_exe(fpath):
@@ -45,7 +404,7 @@ def which(program):
         return exe_file
   return None
 
-def spawn(cmd, search_path=True, debug=False, dry_run=False):
+def spawn(cmd, search_path=True, debug=False, dry_run=False, **kwargs):
   """Run another program, specified as a command list `cmd`, in a new
   process. `cmd` is just the argument list for the new process, ie. ``cmd[0]``
   is the program to run and ``cmd[1:]`` are the rest of its arguments. There is
@@ -54,77 +413,23 @@ def spawn(cmd, search_path=True, debug=False, dry_run=False):
   If `search_path` is true (the default), the system's executable search path
   will be used to find the program; otherwise, cmd[0] must be the exact path to
   the executable. If 'dry_run' is true, the command will not actually be run.
+  Other arguments (`capture`, `timeout`, etc.) are passed to
+  :func:`ProcessEngine.run`.
 
-  Raise :class:`ExecutionError` if running the program fails in any way; just
-  return on success.
+  Returns :class:`Result` on success. Raise :class:`ExecutionError` if running
+  the program fails in any way, the error keeps the result.
   """
-  debug = False
-  if not type(cmd) is types.ListType:
-    raise types.TypeError("'cmd' must be a list")
-  for i in range(len(cmd)):
-    if not type(cmd[i]) is types.StringType:
-      cmd[i] = str(cmd[i])
+  cmd = _check_cmd(cmd)
   if debug:
     logger.debug(" ".join(cmd))
   if dry_run:
-    return
-  if os.name == "posix":
-    _spawn_posix(cmd, search_path, debug)
-  else:
+    return Result(cmd, 0)
+  if os.name != "posix":
     raise PlatformError("Don't know how to spawn programs on platform '%s'" %
                         os.name)
-
-# TODO: replace _std*_fd with sys.std*.fileno()
-_stdin_fd = sys.stdin.fileno()
-_stdout_fd = sys.stdout.fileno()
-_stderr_fd = sys.stderr.fileno()
-
-def _spawn_posix(cmd, search_path=True, debug=False):
-  exec_fn = search_path and os.execvp or os.execcv
-  if not debug:
-    child_stdin, parent_stdout = os.pipe()
-    parent_stdin, child_stdout = os.pipe()
-    (_, child_stderr) = os.pipe()
-  pid = os.fork()
-  if not pid: # in a new child
-    # Redirect STDIN, STDOUT and STDERR
-    if not debug:
-      #os.dup2(child_stdin , _stdin_fd)
-      #os.dup2(child_stdout, _stdout_fd)
-      #os.dup2(child_stderr, _stderr_fd)
-      pass
-    try:
-      exec_fn(cmd[0], cmd)
-    except OSError, e:
-      sys.stderr.write("unable to execute %s: %s\n" % (cmd[0],e.strerror))
-      os._exit(1)
-  else: # inside the parent
-        # Loop until the child either exits or is terminated by a signal
-        # (ie. keep waiting if it's merely stopped)
-    while 1:
-      try:
-        (pid, status) = os.waitpid(pid, 0)
-      except OSError, exc:
-        import errno
-        if exc.errno == errno.EINTR:
-          continue
-        raise ExecutionError("Command '%s' failed: %s" % (cmd[0], exc[-1]))
-      if os.WIFSIGNALED(status):
-        raise ExecutionError("Command '%s' terminated by signal %d"
-                             % (cmd[0], os.WTERMSIG(status)))
-      elif os.WIFEXITED(status):
-        exit_status = os.WEXITSTATUS(status)
-        if exit_status == 0:
-          return # hey, it succeeded!
-        else:
-          raise ExecutionError("Command '%s' failed with exit status %d"
-                               % (cmd[0], exit_status))
-      elif os.WIFSTOPPED(status):
-        continue
-      else:
-        raise ExecutionError("Unknown error executing %s: termination status %d"
-                             % (cmd[0], status))
-      if not debug:
-        os.close(child_stdin)
-        os.close(child_stdout)
-        os.close(child_stderr)
+  if not search_path and not os.path.isfile(cmd[0]):
+    raise ExecutionError("Unable to execute %s: no such file" % cmd[0])
+  result = _engine.run(cmd, **kwargs)
+  if not result.is_ok():
+    raise ExecutionError(result.get_error_message(), result)
+  return result
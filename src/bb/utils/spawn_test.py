@@ -0,0 +1,59 @@
+# http://www.bionicbunny.org/
+# Copyright (c) 2013 Sladeware LLC
+#
+# Author: Oleksandr Sviridenko
+
+import sys
+
+from bb.utils.testing import unittest
+from bb.utils import spawn
+
+class SpawnTest(unittest.TestCase):
+
+  def setup(self):
+    self.engine = spawn.ProcessEngine(max_jobs=2)
+
+  def python(self, code):
+    return [sys.executable, "-c", code]
+
+  def test_run(self):
+    result = self.engine.run(self.python("import sys; sys.stdout.write('x');"
+                                         "sys.stderr.write('y' * 100)"),
+                             capture=True, max_output=10)
+    self.assert_true(result.is_ok())
+    self.assert_equal(result.stdout, "x")
+    self.assert_equal(result.stderr, "y" * 10)
+    self.assert_true(result.truncated)
+    self.assert_true(result.rusage["maxrss"] > 0)
+    result = self.engine.run(self.python("import sys; sys.exit(3)"))
+    self.assert_equal(result.returncode, 3)
+    self.assert_false(result.is_ok())
+
+  def test_timeout(self):
+    result = self.engine.run(self.python("import time; time.sleep(10)"),
+                             capture=True, timeout=0.2)
+    self.assert_true(result.timed_out)
+    self.assert_true(result.returncode < 0)
+    self.assert_true(result.elapsed < 5)
+
+  def test_spawn_many(self):
+    self.engine.run(self.python("pass"))
+    stats = self.engine.begin_stats()
+    results = self.engine.spawn_many([self.python("print(%d)" % i)
+                                      for i in range(5)], capture=True)
+    self.assert_equal([result.stdout.strip() for result in results],
+                      [str(i) for i in range(5)])
+    self.assert_equal(self.engine.end_stats(stats)["processes"], 5)
+    self.assert_equal(self.engine.get_stats()["processes"], 6)
+    future = self.engine.submit(["/nonexistent/program"])
+    self.assert_true(isinstance(future.exception(), spawn.ExecutionError))
+
+  def test_spawn(self):
+    with self.assert_raises(spawn.ExecutionError) as context:
+      spawn.spawn(self.python("import sys; sys.stderr.write('no'); "
+                              "sys.exit(1)"), capture=True)
+    self.assert_equal(context.exception.result.stderr, "no")
+    self.assert_equal(spawn.spawn(["false"], dry_run=True).returncode, 0)
+
+if __name__ == "__main__":
+  unittest.main()
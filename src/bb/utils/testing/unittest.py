@@ -17,6 +17,9 @@
 
 from __future__ import absolute_import
 
+import os
+import shutil
+import tempfile
 import unittest
 
 TestLoader = unittest.TestLoader
@@ -42,4 +45,24 @@ class TestCase(unittest.TestCase):
   assert_false = unittest.TestCase.assertFalse
   assert_raises = unittest.TestCase.assertRaises
 
+  def make_temp_dir(self):
+    """Creates a temporary directory, that is removed once the test is done,
+    and returns its path. The path is kept in `dir` attribute.
+    """
+    self.dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.dir, True)
+    return self.dir
+
+  def write(self, name, content=""):
+    """Writes `content` to file `name` relative to the temporary directory
+    (see :func:`make_temp_dir`) and returns the path of the file. Parent
+    directories are created if needed.
+    """
+    path = os.path.join(self.dir, name)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    with open(path, "w") as handle:
+      handle.write(content)
+    return path
+
 main = unittest.main